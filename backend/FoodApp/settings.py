@@ -160,4 +160,58 @@ DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL')
 GRAPH_MODELS = {
   'all_applications': True,
   'group_models': True,
-}
\ No newline at end of file
+}
+
+# meal planner
+# 'vectorized' builds constraint rows from a NumPy coefficient matrix,
+# 'legacy' builds them term by term from the DataFrame.
+MEAL_PLANNER_ENGINE = 'vectorized'
+# 'cbc' solves the PuLP model with the CBC binary, 'branch_and_bound' runs an
+# exact search in process. The joint weekly solve is only available with CBC.
+MEAL_PLANNER_SOLVER = 'cbc'
+# Most candidates the 'branch_and_bound' solver searches; bigger frames are
+# cut to a share of every meal type first, and their plans are reported as
+# 'branch_and_bound_truncated' and not cached, see api/solvers.py. Its search
+# time grows exponentially with this number.
+MEAL_PLANNER_BRANCH_AND_BOUND = {
+    'MAX_CANDIDATES': 32,
+}
+# 'daily' solves each pending day separately, 'weekly' plans them with one joint
+# solve first. Per-day solving is several times faster on large catalogs.
+MEAL_PLANNER_MODE = 'daily'
+# In-process cache of planner results, see api/cache.py
+MEAL_PLAN_CACHE = {
+    'MAX_ENTRIES': 1024,
+    'TTL': 60 * 60,
+}
+# Timing spans of the planner stages, see api/timings.py. WINDOW is the
+# number of recent spans per stage the stats endpoint reports on.
+MEAL_PLANNER_TIMINGS = {
+    'WINDOW': 1000,
+}
+# Rendered recipe responses in the Django cache, see api/cache.py. TIMEOUT
+# is in seconds, 0 turns the cache off.
+RECIPE_RESPONSE_CACHE = {
+    'TIMEOUT': 60 * 60,
+}
+# Relative optimality gap at which the joint weekly solve stops.
+MEAL_PLANNER_WEEKLY_GAP = 0.005
+# Fraction of the time left the joint weekly solve may use; a week it does not
+# finish by then is solved day by day in the rest.
+MEAL_PLANNER_WEEKLY_TIME_SHARE = 0.5
+# Seconds one planning request may spend in the solver before the greedy
+# planner takes over.
+MEAL_PLANNER_TIME_LIMIT = 5
+# Candidate pruning before the model is built. TOP_K keeps only the best
+# recipes per meal type and day (None keeps all of them).
+MEAL_PLANNER_PRUNING = {
+    'ENABLED': True,
+    'TOP_K': 100,
+}
+# Recipes used within COOL_DOWN_DAYS are not excluded but made less
+# attractive: the optimized nutrient gets up to PENALTY (a fraction) worse
+# for a recipe used today, fading out over the window.
+MEAL_PLANNER_ROTATION = {
+    'COOL_DOWN_DAYS': 14,
+    'PENALTY': 0.5,
+}
@@ -1,18 +1,50 @@
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from api.models import (Ingredient, DislikedIngredients, RecipeIngredients, UserWeight,
-                        Cart, CartIngredient, DayPlanRecipes, DayPlan, UserNutrientPreferences
+                        Cart, CartIngredient, DayPlanRecipes, DayPlan, UserNutrientPreferences,
+                        PlanningJob, DailySummary, WeeklySummary, DayPlanItem, VersionStamp
                         )
 from datetime import timedelta, datetime
 from django.utils.timezone import now
-from django.test import TestCase
-from api.models import Recipe, Ingredient, DislikedIngredients, User
-from api.utils import select_meals 
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import skipUnless
+from django.db.migrations.executor import MigrationExecutor
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.core.management import call_command, CommandError
+from io import StringIO
+from contextlib import redirect_stdout
+from decimal import Decimal
+import json
+import os
+import numpy as np
+import pandas as pd
+import tempfile
+import time
+from api.models import Recipe, Ingredient, DislikedIngredients, User, UserRecipeUsage
+from api.utils import (select_meals, select_meal_ids, select_meals_for_week, select_meal_ids_for_week,
+                       load_candidate_recipes, prune_candidates, solve_day, resolve_objective, plan_meals_for_week,
+                       get_recent_recipe_usage, upload_recipes_from_csv, search_recipes, load_week_plans,
+                       save_week_plans, weakest_solved_by)
+from api.catalog import RecipeCatalog, get_active_catalog, recipe_catalog
+from api.cache import (CATALOG_VERSION_KEY, USER_SCOPES, PlanCache, bump_catalog_version, get_stamps, plan_cache,
+                       recipe_responses, user_version_key)
+from django.core.cache import cache
+from api.timings import PlannerTimings, planner_timings, span
+from api.summaries import check_summaries, rebuild_summaries
+from api.serializers import RecipeSerializer
+from api.solvers import BranchAndBoundBackend, best_candidates
+from api.search import SEARCH, SEARCH_CONFIG, search_recipe_text
 from django.contrib.auth import get_user_model
 User = get_user_model()
 
 
+def seed_version_stamps(user):
+    # the first read of a stamp inserts it; query counts leave that out
+    get_stamps([CATALOG_VERSION_KEY, *(user_version_key(user.id, scope) for scope in USER_SCOPES)])
+
 
 class JWTTestCase(APITestCase):
     def setUp(self):
@@ -418,7 +450,1509 @@ class SelectMealsTests(TestCase):
                     f"Disliked {disliked_ingredient}' in '{meal.title}'."
                 )
 
-                
+    def test_vectorized_engine_matches_legacy(self):
+        for diet_type in ['high_protein', 'low_calories', 'high_fat', 'low_carbohydrates']:
+            self.user_nutrient_preferences.diet_type = diet_type
+            self.user_nutrient_preferences.save()
+
+            legacy = select_meals(user=self.user, engine='legacy')
+            vectorized = select_meals(user=self.user, engine='vectorized')
+
+            self.assertEqual(
+                sorted(legacy.values_list('id', flat=True)),
+                sorted(vectorized.values_list('id', flat=True)),
+                f"Engines disagree for diet type '{diet_type}'"
+            )
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            select_meals(user=self.user, engine='simplex')
+
+    def test_branch_and_bound_matches_cbc(self):
+        df = load_candidate_recipes(self.user)
+
+        for diet_type in ['high_protein', 'low_calories', 'high_fat', 'low_carbohydrates']:
+            optimize_field, objective = resolve_objective(diet_type)
+            values = df.set_index('id')[optimize_field]
+
+            results = {
+                solver: solve_day(df, self.user_nutrient_preferences, optimize_field, objective, prune=False, solver=solver)
+                for solver in ['cbc', 'branch_and_bound']
+            }
+
+            self.assertEqual(results['cbc'][1], 'cbc')
+            self.assertEqual(results['branch_and_bound'][1], 'branch_and_bound')
+            self.assertAlmostEqual(
+                values.loc[results['cbc'][0]].sum(),
+                values.loc[results['branch_and_bound'][0]].sum(),
+                msg=f"Solvers disagree for diet type '{diet_type}'"
+            )
+
+    def random_catalog(self, rng, size):
+        return pd.DataFrame({
+            'id': np.arange(1, size + 1),
+            'meal_type': rng.choice(['breakfast', 'lunch', 'dinner', 'snack'], size),
+            'total_calories': rng.uniform(100, 900, size).round(),
+            'protein': rng.uniform(2, 60, size).round(1),
+            'fat': rng.uniform(1, 40, size).round(1),
+            'sugars': rng.uniform(0, 30, size),
+            'carbohydrates': rng.uniform(0, 90, size),
+            'fiber': rng.uniform(0, 15, size),
+            'iron': rng.uniform(0, 8, size),
+            'potassium': rng.uniform(50, 1200, size),
+        })
+
+    # the whole frame is searched, so the plans must be as good as CBC's
+    @override_settings(MEAL_PLANNER_BRANCH_AND_BOUND={'MAX_CANDIDATES': 60})
+    def test_branch_and_bound_matches_cbc_on_random_catalogs(self):
+        rng = np.random.default_rng(8)
+        preferences = UserNutrientPreferences(
+            min_calories=1200, max_calories=2400, min_protein=60, max_protein=180,
+            min_fat=20, max_fat=90, min_sugars=0, max_sugars=0, min_iron=0, max_iron=0,
+            min_potassium=0, max_potassium=0, min_carbohydrates=0, max_carbohydrates=0,
+            min_fiber=0, max_fiber=0,
+        )
+
+        for _ in range(5):
+            df = self.random_catalog(rng, 60)
+
+            for field, objective in [('protein', 'maximize'), ('total_calories', 'minimize')]:
+                values = df.set_index('id')[field]
+                cbc_ids, cbc_solved_by = solve_day(df, preferences, field, objective, prune=False, solver='cbc')
+                bnb_ids, bnb_solved_by = solve_day(df, preferences, field, objective, prune=False, solver='branch_and_bound')
+
+                self.assertEqual(bnb_solved_by, cbc_solved_by.replace('cbc', 'branch_and_bound'))
+                self.assertAlmostEqual(values.loc[cbc_ids].sum(), values.loc[bnb_ids].sum(), places=4)
+
+    def test_branch_and_bound_at_the_default_pruning_size(self):
+        # hard for an exhaustive search: the optimum sits right at max_protein
+        rng = np.random.default_rng(7)
+        preferences = UserNutrientPreferences(
+            min_calories=0, max_calories=0, min_protein=63.6, max_protein=100.1, min_fat=34.1, max_fat=116.5,
+            min_sugars=0, max_sugars=0, min_iron=0, max_iron=0, min_potassium=0, max_potassium=0,
+            min_carbohydrates=0, max_carbohydrates=0, min_fiber=12.1, max_fiber=42.1,
+        )
+        df = self.random_catalog(rng, 600)
+        candidates = prune_candidates(df, preferences, 'protein', 'maximize', top_k=100)[0]
+        self.assertGreater(len(candidates), 300)
+
+        kept = best_candidates(candidates, 'protein', 'maximize', 32)
+        self.assertEqual(candidates['meal_type'].iloc[kept].value_counts().tolist(), [8, 8, 8, 8])
+        self.assertIn(candidates['protein'].idxmax(), candidates.index[kept])
+
+        for field, objective in [('protein', 'maximize'), ('total_calories', 'minimize')]:
+            started = time.monotonic()
+            selected_ids, solved_by = solve_day(df, preferences, field, objective, deadline=started + 5,
+                                                solver='branch_and_bound')
+            self.assertEqual(solved_by, 'branch_and_bound_truncated')
+            self.assertLess(time.monotonic() - started, 2.5)
+            picked = df.set_index('id').loc[selected_ids]
+            self.assertTrue(63.6 <= picked['protein'].sum() <= 100.1 + 1e-6)
+            self.assertEqual(set(picked['meal_type']), {'breakfast', 'lunch', 'dinner', 'snack'})
+
+    def test_branch_and_bound_searches_the_whole_frame_when_the_cut_is_infeasible(self):
+        # only the low protein recipes fit max_protein, the cut keeps the high ones
+        df = pd.DataFrame({
+            'id': range(1, 9),
+            'meal_type': ['breakfast', 'lunch', 'dinner', 'snack'] * 2,
+            'total_calories': [500.0] * 8,
+            'protein': [50.0] * 4 + [5.0] * 4,
+            **{field: [0.0] * 8 for field in ['fat', 'sugars', 'carbohydrates', 'fiber', 'iron', 'potassium']},
+        })
+        preferences = UserNutrientPreferences(
+            min_calories=0, max_calories=0, min_protein=1, max_protein=30, min_fat=0, max_fat=0,
+            min_sugars=0, max_sugars=0, min_iron=0, max_iron=0, min_potassium=0, max_potassium=0,
+            min_carbohydrates=0, max_carbohydrates=0, min_fiber=0, max_fiber=0,
+        )
+        backend = BranchAndBoundBackend(max_candidates=4)
+        self.assertEqual(list(best_candidates(df, 'protein', 'maximize', 4)), [0, 1, 2, 3])
+
+        positions, status = backend.solve(df, preferences, 'protein', 'maximize', time.monotonic() + 5)
+
+        self.assertEqual(status, 'optimal')
+        self.assertEqual(positions, [4, 5, 6, 7])
+
+    @override_settings(MEAL_PLANNER_BRANCH_AND_BOUND={'MAX_CANDIDATES': 4})
+    def test_truncated_branch_and_bound_plans_are_not_cached(self):
+        plan_cache.clear()
+        self.assertGreater(Recipe.objects.count(), 4)
+
+        _, solved_by = select_meal_ids(user=self.user, solver='branch_and_bound')
+        self.assertEqual(solved_by, 'branch_and_bound_truncated')
+        self.assertEqual(plan_cache.stats()['entries'], 0)
+        self.assertEqual(weakest_solved_by(['cbc', 'branch_and_bound_truncated']), 'branch_and_bound_truncated')
+
+    def test_branch_and_bound_infeasible_falls_back_to_greedy(self):
+        self.user_nutrient_preferences.min_calories = 100000
+        self.user_nutrient_preferences.max_calories = 200000
+        self.user_nutrient_preferences.save()
+
+        selected_ids, solved_by = select_meal_ids(user=self.user, solver='branch_and_bound')
+
+        self.assertEqual(solved_by, 'greedy')
+        self.assertTrue(0 < len(selected_ids) <= 6)
+
+    @override_settings(MEAL_PLANNER_SOLVER='branch_and_bound')
+    def test_weekly_selection_with_branch_and_bound(self):
+        weekly_selection = select_meals_for_week(user=self.user, days=3)
+
+        selected_ids = [meal.id for day in weekly_selection for meal in day]
+        self.assertTrue(selected_ids, "Expected meals to be selected")
+        self.assertEqual(len(selected_ids), len(set(selected_ids)))
+
+    def test_recipe_lists_can_exclude_disliked_ingredients(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        disliked = Recipe.objects.filter(recipeingredients__ingredient__name__in=["Tomato", "Chicken"]).distinct()
+
+        response = client.get('/api/recipes/')
+        self.assertEqual(len(response.json()), Recipe.objects.count())
+
+        response = client.get('/api/recipes/', {'exclude_disliked': 'true'})
+        self.assertEqual(len(response.json()), Recipe.objects.count() - disliked.count())
+        self.assertFalse({recipe['id'] for recipe in response.json()} & set(disliked.values_list('id', flat=True)))
+
+        response = client.get('/api/recipes/by-type/', {'meal_type': 'lunch', 'exclude_disliked': '1'})
+        self.assertEqual(
+            sorted(recipe['id'] for recipe in response.json()),
+            sorted(Recipe.objects.filter(meal_type='lunch').exclude(id__in=disliked).values_list('id', flat=True))
+        )
+
+    def test_replacement_suggestions(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        recipe = Recipe.objects.get(title="Vegetable Stir Fry")
+        disliked = set(Recipe.objects.filter(
+            recipeingredients__ingredient__name__in=["Tomato", "Chicken"]
+        ).values_list('id', flat=True))
+
+        response = client.get(f'/api/recipes/{recipe.id}/suggestions/', {'count': 3})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        suggestions = response.data['suggestions']
+        self.assertTrue(0 < len(suggestions) <= 3)
+        self.assertEqual(suggestions[0]['distance'], 0)
+        self.assertEqual([s['distance'] for s in suggestions], sorted(s['distance'] for s in suggestions))
+        for suggestion in suggestions:
+            self.assertEqual(suggestion['meal_type'], recipe.meal_type)
+            self.assertNotEqual(suggestion['id'], recipe.id)
+            self.assertNotIn(suggestion['id'], disliked)
+
+        day_plan = DayPlan.objects.create(user=self.user, date=now().date())
+        DayPlanRecipes.objects.create(day_plan=day_plan, recipe_id=suggestions[0]['id'])
+        response = client.get(
+            f'/api/recipes/{recipe.id}/suggestions/', {'count': 3, 'day': now().date().strftime('%Y-%m-%d')}
+        )
+        self.assertNotIn(suggestions[0]['id'], [s['id'] for s in response.data['suggestions']])
+
+        self.assertEqual(client.get('/api/recipes/999999/suggestions/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(
+            client.get(f'/api/recipes/{recipe.id}/suggestions/', {'count': 'many'}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+
+    def test_unknown_solver(self):
+        with self.assertRaises(ValueError):
+            select_meals(user=self.user, solver='glpk')
+
+    def test_infeasible_preferences_fall_back_to_greedy(self):
+        self.user_nutrient_preferences.min_calories = 100000
+        self.user_nutrient_preferences.max_calories = 200000
+        self.user_nutrient_preferences.save()
+
+        selected_ids, solved_by = select_meal_ids(user=self.user)
+
+        self.assertEqual(solved_by, 'greedy')
+        self.assertTrue(0 < len(selected_ids) <= 6)
+        meal_types = set(Recipe.objects.filter(id__in=selected_ids).values_list('meal_type', flat=True))
+        self.assertTrue({"lunch", "dinner", "breakfast"} <= meal_types)
+
+    @override_settings(MEAL_PLANNER_TIME_LIMIT=0)
+    def test_exhausted_time_budget_uses_greedy(self):
+        selected_ids, solved_by = select_meal_ids(user=self.user)
+
+        self.assertEqual(solved_by, 'greedy_time_limit')
+        selected = Recipe.objects.filter(id__in=selected_ids)
+        self.assertLessEqual(sum(float(meal.total_calories) for meal in selected), self.user_nutrient_preferences.max_calories)
+        self.assertLessEqual(sum(float(meal.potassium) for meal in selected), self.user_nutrient_preferences.max_potassium)
+
+    def test_pruning_stages(self):
+        self.user_nutrient_preferences.max_potassium = 750
+        self.user_nutrient_preferences.save()
+        df = load_candidate_recipes(self.user)
+
+        pruned, stats = prune_candidates(df, self.user_nutrient_preferences, 'protein', 'maximize', top_k=1)
+
+        self.assertEqual(stats['candidates'], len(df))
+        self.assertLess(stats['after_bounds'], stats['candidates'])
+        self.assertTrue((pruned['potassium'] <= 750).all())
+        self.assertEqual(sorted(pruned['meal_type']), sorted(set(df[df['potassium'] <= 750]['meal_type'])))
+
+    def test_lossless_pruning_keeps_the_optimum(self):
+        preferences = self.user_nutrient_preferences
+        df = load_candidate_recipes(self.user)
+        protein = df.set_index('id')['protein']
+
+        full_ids, full_solved_by = solve_day(df, preferences, 'protein', 'maximize', prune=False)
+        pruned_ids, pruned_solved_by = solve_day(df, preferences, 'protein', 'maximize', prune=True, top_k=0)
+
+        self.assertEqual(full_solved_by, 'cbc')
+        self.assertEqual(pruned_solved_by, 'cbc')
+        self.assertEqual(protein.loc[full_ids].sum(), protein.loc[pruned_ids].sum())
+
+    def test_evaluate_pruning_command(self):
+        out = StringIO()
+        call_command('evaluate_pruning', '--top-k', '2', stdout=out)
+        self.assertIn("mean objective change", out.getvalue())
+
+    @override_settings(MEAL_PLANNER_TIME_LIMIT=1)
+    def test_benchmark_planner_command(self):
+        recipe_count = Recipe.objects.count()
+        out = StringIO()
+        call_command('benchmark_planner', '--sizes', '300', '--users', '2', '--ingredients', '50',
+                     stdout=out, stderr=StringIO())
+
+        results = json.loads(out.getvalue())
+        catalog, = results['catalogs']
+        self.assertEqual(catalog['size'], 300)
+        self.assertEqual(len(catalog['records']), 2)
+        for stage in ('candidates', 'build', 'solve', 'persist', 'plan_week'):
+            self.assertEqual(catalog['stages'][stage]['runs'], 2)
+        self.assertTrue(all(record['candidates'] > 0 for record in catalog['records']))
+        self.assertEqual(Recipe.objects.count(), recipe_count)
+        self.assertFalse(get_user_model().objects.filter(email__endswith='@benchmark.invalid').exists())
+
+    def test_benchmark_planner_reports_the_solver_it_ran(self):
+        out = StringIO()
+        call_command('benchmark_planner', '--sizes', '100', '--users', '1', '--ingredients', '50',
+                     '--solver', 'branch_and_bound', stdout=out, stderr=StringIO())
+
+        results = json.loads(out.getvalue())
+        self.assertEqual(results['environment']['solver'], 'branch_and_bound')
+        record, = results['catalogs'][0]['records']
+        self.assertFalse(record['plan_solved_by'].startswith('cbc'))
+
+    def test_weekly_selection_does_not_repeat_recipes(self):
+        weekly_selection = select_meals_for_week(user=self.user, days=3)
+        self.assertEqual(len(weekly_selection), 3)
+
+        selected_ids = [meal.id for day in weekly_selection for meal in day]
+        self.assertTrue(selected_ids, "Expected meals to be selected")
+        self.assertEqual(len(selected_ids), len(set(selected_ids)))
+
+        for day in weekly_selection:
+            total_calories = sum(float(meal.total_calories) for meal in day)
+            self.assertGreaterEqual(total_calories, self.user_nutrient_preferences.min_calories)
+            self.assertLessEqual(total_calories, self.user_nutrient_preferences.max_calories)
+            self.assertTrue({"lunch", "dinner", "breakfast"} <= {meal.meal_type for meal in day})
+
+    @override_settings(MEAL_PLANNER_WEEKLY_TIME_SHARE=0)
+    def test_weekly_selection_falls_back_to_daily_solves_past_its_time_share(self):
+        plan_cache.clear()
+        planner_timings.clear()
+        selected_ids, solved_by = select_meal_ids_for_week(user=self.user, days=3)
+
+        self.assertEqual(solved_by, 'cbc')
+        stages = planner_timings.stats()['stages']
+        self.assertEqual(stages['week_solve']['counts']['status'], {'not_solved': 1})
+        self.assertEqual(stages['solve']['count'], 3)
+        self.assertTrue(all(selected_ids))
+        flat_ids = [recipe_id for day_ids in selected_ids for recipe_id in day_ids]
+        self.assertEqual(len(flat_ids), len(set(flat_ids)))
+
+    def test_recently_used_recipes_are_penalized_not_excluded(self):
+        plan_cache.clear()
+        baseline, _ = select_meal_ids(user=self.user)
+
+        for recipe_id in baseline:
+            UserRecipeUsage.objects.create(user=self.user, recipe_id=recipe_id)
+        rotated, solved_by = select_meal_ids(user=self.user)
+        self.assertEqual(solved_by, 'cbc')
+        self.assertNotEqual(sorted(rotated), sorted(baseline))
+
+        for recipe in Recipe.objects.exclude(id__in=baseline):
+            UserRecipeUsage.objects.create(user=self.user, recipe=recipe)
+        everything_used, solved_by = select_meal_ids(user=self.user)
+        self.assertEqual(solved_by, 'cbc')
+        self.assertEqual(sorted(everything_used), sorted(baseline))
+
+    def test_usage_outside_the_cool_down_window_is_ignored(self):
+        plan_cache.clear()
+        baseline, _ = select_meal_ids(user=self.user)
+
+        for recipe_id in baseline:
+            UserRecipeUsage.objects.create(user=self.user, recipe_id=recipe_id)
+        UserRecipeUsage.objects.filter(user=self.user).update(last_used=now().date() - timedelta(days=30))
+
+        self.assertEqual(get_recent_recipe_usage(self.user), {})
+        self.assertEqual(sorted(select_meal_ids(user=self.user)[0]), sorted(baseline))
+
+    def test_plan_week_reuses_recipes_after_the_whole_catalog_was_used(self):
+        for recipe in Recipe.objects.all():
+            UserRecipeUsage.objects.create(user=self.user, recipe=recipe)
+        DayPlanRecipes.objects.create(
+            day_plan=DayPlan.objects.create(user=self.user, date=now().date() - timedelta(days=3)),
+            recipe=Recipe.objects.first()
+        )
+
+        plan_meals_for_week(self.user)
+
+        self.assertTrue(DayPlanRecipes.objects.filter(day_plan__user=self.user, day_plan__date=now().date()).exists())
+
+    def test_plan_week_writes_in_bulk(self):
+        plan_cache.clear()
+        seed_version_stamps(self.user)
+        # week, used recipes, preferences, disliked ingredients, catalog version
+        # and catalog (2), then savepoint, user lock, week again, day plans, day plan recipes, recipe nutrients, and in
+        # a nested savepoint the daily and weekly rollups (read, write), usage
+        # upsert, release
+        with self.assertNumQueries(21):
+            plan_meals_for_week(self.user, mode='weekly')
+
+        planned = DayPlanRecipes.objects.filter(day_plan__user=self.user)
+        self.assertEqual(DayPlan.objects.filter(user=self.user).count(), 7)
+        self.assertEqual(
+            set(UserRecipeUsage.objects.filter(user=self.user).values_list('recipe_id', flat=True)),
+            set(planned.values_list('recipe_id', flat=True))
+        )
+
+        emptied = list(DayPlan.objects.filter(user=self.user).order_by('date')[:2])
+        DayPlanRecipes.objects.filter(day_plan__in=emptied).delete()
+        with self.assertNumQueries(21):
+            plan_meals_for_week(self.user, mode='weekly')
+        for day_plan in emptied:
+            self.assertGreaterEqual(day_plan.recipes.count(), 3)
+        self.assertEqual(check_summaries(), [])
+
+    def test_planners_working_from_the_same_week_do_not_collide(self):
+        today = now().date()
+        stale = load_week_plans(self.user, [today + timedelta(days=i) for i in range(7)])
+        recipe_ids = list(Recipe.objects.order_by('id').values_list('id', flat=True)[:4])
+        save_week_plans(self.user, stale, {today: recipe_ids[:3]}, today)
+        # a second planner that read the week before the first one wrote it
+        save_week_plans(self.user, stale, {today: recipe_ids[1:]}, today)
+
+        self.assertEqual(DayPlan.objects.filter(user=self.user, date=today).count(), 1)
+        self.assertEqual(
+            sorted(DayPlanRecipes.objects.filter(day_plan__user=self.user).values_list('recipe_id', flat=True)),
+            recipe_ids
+        )
+        self.assertEqual(check_summaries(), [])
+
+class PlanCacheTests(APITestCase):
+    def setUp(self):
+        plan_cache.clear()
+        plan_cache.reset_stats()
+
+        self.users = []
+        for email in ['first@example.com', 'second@example.com']:
+            user = User.objects.create_user(email=email, password='password123')
+            UserNutrientPreferences.objects.create(user=user, min_calories=500, max_calories=2000)
+            self.users.append(user)
+
+        for index, meal_type in enumerate(["breakfast", "lunch", "dinner", "snack"] * 2):
+            Recipe.objects.create(
+                title=f"Recipe {index}", description="Des",
+                total_calories=200 + index * 10, sugars=5, protein=10 + index, fat=5,
+                carbohydrates=10, fiber=2, iron=1, potassium=100,
+                preparation_time=15, preparation_guide="Prepare", meal_type=meal_type
+            )
+
+    def test_identical_preferences_share_a_plan(self):
+        first = list(select_meals(self.users[0]).values_list('id', flat=True))
+        second = list(select_meals(self.users[1]).values_list('id', flat=True))
+
+        self.assertEqual(sorted(first), sorted(second))
+        self.assertEqual(plan_cache.stats()['misses'], 1)
+        self.assertEqual(plan_cache.stats()['hits'], 1)
+
+    def test_users_with_planning_history_share_plans_that_avoid_it(self):
+        first, _ = select_meal_ids(self.users[0])
+        unused = Recipe.objects.exclude(id__in=first).first()
+        UserRecipeUsage.objects.create(user=self.users[1], recipe=unused)
+
+        self.assertEqual(sorted(select_meal_ids(self.users[1])[0]), sorted(first))
+        self.assertEqual(plan_cache.stats()['hits'], 1)
+
+        # a cached plan with a recently used recipe is solved again, and the
+        # penalized plan is not cached for anyone else
+        UserRecipeUsage.objects.create(user=self.users[1], recipe_id=first[0])
+        rotated, _ = select_meal_ids(self.users[1])
+        self.assertNotIn(first[0], rotated)
+        self.assertEqual(plan_cache.stats()['entries'], 1)
+        self.assertEqual(sorted(select_meal_ids(self.users[0])[0]), sorted(first))
+
+    def test_disliked_ingredients_change_the_key(self):
+        select_meals(self.users[0])
+        DislikedIngredients.objects.create(user=self.users[1], ingredient=Ingredient.objects.create(name="Salt"))
+        select_meals(self.users[1])
+
+        self.assertEqual(plan_cache.stats()['hits'], 0)
+
+    def test_recipe_change_invalidates_cache(self):
+        select_meals(self.users[0])
+        recipe = Recipe.objects.get(title="Recipe 0")
+        recipe.protein = 500
+        recipe.save()
+
+        selected = select_meals(self.users[1])
+
+        self.assertEqual(plan_cache.stats()['hits'], 0)
+        self.assertIn(recipe.id, selected.values_list('id', flat=True))
+
+    def test_plans_stored_before_a_catalog_write_commits_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.get(title="Recipe 0")
+            recipe.protein = 500
+            recipe.save()
+            plan_cache.set('solved from the old rows', ([recipe.id], 'cbc'))
+        self.assertEqual(plan_cache.stats()['entries'], 0)
+
+    def test_catalog_version_bumps_from_other_processes_change_the_key(self):
+        select_meals(self.users[0])
+        VersionStamp.objects.filter(key=CATALOG_VERSION_KEY).update(value=F('value') + 1)
+        select_meals(self.users[1])
+
+        self.assertEqual(plan_cache.stats()['hits'], 0)
+
+    def test_lru_eviction_and_ttl(self):
+        cache = PlanCache(max_entries=2, ttl=60)
+        cache.set('a', [1])
+        cache.set('b', [2])
+        cache.get('a')
+        cache.set('c', [3])
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), [1])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        expired = PlanCache(max_entries=2, ttl=-1)
+        expired.set('a', [1])
+        self.assertIsNone(expired.get('a'))
+        self.assertEqual(expired.stats()['expirations'], 1)
+
+    def test_stats_endpoint_is_staff_only(self):
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.get('/api/planner/cache-stats/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        staff = User.objects.create_user(email='staff@example.com', password='password123', is_staff=True)
+        self.client.force_authenticate(user=staff)
+        response = self.client.get('/api/planner/cache-stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('hit_rate', response.data)
+
+
+class PlannerTimingsTests(APITestCase):
+    def setUp(self):
+        plan_cache.clear()
+        planner_timings.clear()
+
+        self.user = User.objects.create_user(email='timed@example.com', password='password123')
+        UserNutrientPreferences.objects.create(user=self.user, min_calories=500, max_calories=2000)
+        for index, meal_type in enumerate(["breakfast", "lunch", "dinner", "snack"] * 2):
+            Recipe.objects.create(
+                title=f"Recipe {index}", description="Des",
+                total_calories=200 + index * 10, sugars=5, protein=10 + index, fat=5,
+                carbohydrates=10, fiber=2, iron=1, potassium=100,
+                preparation_time=15, preparation_guide="Prepare", meal_type=meal_type
+            )
+
+    def test_select_meals_records_stage_spans(self):
+        with self.assertLogs('api.timings', 'INFO') as logs:
+            select_meals(self.user)
+            select_meals(self.user)
+
+        stages = planner_timings.stats()['stages']
+        self.assertEqual(stages['candidates']['means']['candidates'], 8)
+        self.assertEqual(stages['build']['means']['variables'], stages['prune']['means']['after_top_k'])
+        self.assertGreater(stages['build']['means']['constraints'], 0)
+        self.assertEqual(stages['solve']['counts']['status'], {'optimal': 1})
+        self.assertEqual(stages['select_day']['count'], 2)
+        self.assertEqual(stages['select_day']['counts']['cached'], {'False': 1, 'True': 1})
+        self.assertTrue(any("planner solve took" in line for line in logs.output))
+
+    def test_plan_week_spans(self):
+        plan_meals_for_week(self.user, mode='daily')
+
+        stages = planner_timings.stats()['stages']
+        for stage in ('plan_week', 'load_week', 'select_day', 'persist'):
+            self.assertEqual(stages[stage]['total'], 7 if stage == 'select_day' else 1)
+        self.assertEqual(stages['plan_week']['means']['pending_days'], 7)
+
+    def test_rolling_window_percentiles(self):
+        timings = PlannerTimings(window=3)
+        for seconds in [5, 0.001, 0.002, 0.003, 0.004]:
+            timings.record('solve', seconds, {'status': 'optimal'})
+
+        solve = timings.stats()['stages']['solve']
+        self.assertEqual((solve['count'], solve['total']), (3, 5))
+        self.assertAlmostEqual(solve['p50_ms'], 3.0)
+        self.assertAlmostEqual(solve['max_ms'], 4.0)
+
+    def test_span_records_errors(self):
+        with self.assertRaises(ValueError):
+            with span('solve'):
+                raise ValueError()
+        self.assertEqual(planner_timings.stats()['stages']['solve']['counts']['error'], {'ValueError': 1})
+
+    def test_timings_endpoint_is_staff_only(self):
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get('/api/planner/timings/').status_code, status.HTTP_403_FORBIDDEN)
+
+        select_meals(self.user)
+        staff = User.objects.create_user(email='staff@example.com', password='password123', is_staff=True)
+        self.client.force_authenticate(user=staff)
+        response = self.client.get('/api/planner/timings/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('p95_ms', response.data['stages']['solve'])
+
+
+class PlanAllUsersCommandTests(TestCase):
+    def setUp(self):
+        self.users = []
+        for email in ['first@example.com', 'second@example.com', 'third@example.com']:
+            user = User.objects.create_user(email=email, password='password123')
+            UserNutrientPreferences.objects.create(user=user, min_calories=500, max_calories=2000)
+            self.users.append(user)
+
+        onion = Ingredient.objects.create(name="Onion")
+        for index, meal_type in enumerate(["breakfast", "lunch", "dinner", "snack"] * 8):
+            recipe = Recipe.objects.create(
+                title=f"Recipe {index}", description="Des",
+                total_calories=150 + index * 5, sugars=5, protein=10 + index, fat=5,
+                carbohydrates=10, fiber=2, iron=1, potassium=100,
+                preparation_time=15, preparation_guide="Prepare", meal_type=meal_type
+            )
+            if index % 3 == 0:
+                RecipeIngredients.objects.create(recipe=recipe, ingredient=onion, quantity=1.0, unit="g")
+        DislikedIngredients.objects.create(user=self.users[0], ingredient=onion)
+
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+
+    def test_catalog_candidates_match_database(self):
+        catalog = RecipeCatalog.load()
+        disliked = DislikedIngredients.objects.filter(user=self.users[0]).values_list('ingredient_id', flat=True)
+        excluded = list(Recipe.objects.values_list('id', flat=True)[:4])
+
+        from_catalog = catalog.candidates(excluded, list(disliked))
+        from_database = load_candidate_recipes(self.users[0], excluded)
+
+        self.assertEqual(sorted(from_catalog['id']), sorted(from_database['id']))
+
+    def test_plans_every_user_and_writes_checkpoint(self):
+        out = StringIO()
+        call_command('plan_all_users', '--workers', '1', '--checkpoint', self.checkpoint, stdout=out)
+
+        for user in self.users:
+            self.assertEqual(DayPlan.objects.filter(user=user).count(), 7)
+            self.assertTrue(DayPlanRecipes.objects.filter(day_plan__user=user).exists())
+        with open(self.checkpoint) as checkpoint_file:
+            self.assertEqual(sorted(json.load(checkpoint_file)['done']), sorted(user.id for user in self.users))
+        self.assertIn("users/s", out.getvalue())
+        self.assertIsNone(get_active_catalog())
+
+    def test_resume_skips_finished_users(self):
+        with open(self.checkpoint, 'w') as checkpoint_file:
+            json.dump({'done': [self.users[0].id], 'failed': {}}, checkpoint_file)
+
+        call_command('plan_all_users', '--workers', '1', '--checkpoint', self.checkpoint, '--resume', stdout=StringIO())
+
+        self.assertFalse(DayPlan.objects.filter(user=self.users[0]).exists())
+        self.assertTrue(DayPlan.objects.filter(user=self.users[1]).exists())
+
+
+class NumericNutrientsTests(TransactionTestCase):
+    def test_backfill_parses_nutrient_strings(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('api', '0020_userrecipeusage_user_last_used')])
+        OldRecipe = executor.loader.project_state(('api', '0020_userrecipeusage_user_last_used')).apps.get_model('api', 'Recipe')
+        values = dict(total_calories='320', sugars='2,5', protein='12 g', fat=' 7.25 ', carbohydrates='n/a',
+                      fiber='', iron='.5', potassium='120mg')
+        recipe_id = OldRecipe.objects.create(
+            title="Old", description="Des", preparation_time=10, preparation_guide="Prepare", meal_type='lunch', **values
+        ).id
+
+        out = StringIO()
+        with redirect_stdout(out):
+            executor = MigrationExecutor(connection)
+            executor.loader.build_graph()
+            executor.migrate(executor.loader.graph.leaf_nodes('api'))
+
+        recipe = Recipe.objects.get(id=recipe_id)
+        self.assertEqual(
+            [recipe.total_calories, recipe.sugars, recipe.protein, recipe.fat, recipe.iron, recipe.potassium],
+            [320, 2.5, 12, 7.25, 0.5, 120]
+        )
+        self.assertIsNone(recipe.carbohydrates)
+        self.assertIsNone(recipe.fiber)
+        self.assertIn("1 recipe nutrient value(s) could not be parsed", out.getvalue())
+        self.assertIn("carbohydrates: 'n/a'", out.getvalue())
+
+    def test_upload_parses_nutrients(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as f:
+            f.write("name;short_description;total_calories;carbohydrates;fat;fiber;sugars;protein;iron;potassium;"
+                    "preparation_time;preparation_guide;meal_type;ingredients\n")
+            f.write("Porridge;Oats;350;60;6,5;2.5 g;12;11;1;200;10;Cook;breakfast;Oats:50 g\n")
+            f.write("Salad;Greens;120;?;3;4;2;5;1;300;5;Mix;lunch;Lettuce:1 head\n")
+        self.addCleanup(os.remove, f.name)
+
+        with self.assertLogs('api.utils', 'WARNING'):
+            success, message = upload_recipes_from_csv(f.name)
+
+        self.assertTrue(success, message)
+        self.assertIn("1 nutrient value(s) could not be parsed", message)
+        porridge = Recipe.objects.get(title="Porridge")
+        self.assertEqual((porridge.fat, porridge.fiber), (6.5, 2.5))
+        self.assertIsNone(Recipe.objects.get(title="Salad").carbohydrates)
+
+    def test_upload_bumps_the_catalog_version_once(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as f:
+            f.write("name;short_description;total_calories;carbohydrates;fat;fiber;sugars;protein;iron;potassium;"
+                    "preparation_time;preparation_guide;meal_type;ingredients\n")
+            f.write("Porridge;Oats;350;60;6;2;12;11;1;200;10;Cook;breakfast;Oats:50 g,Milk:200 ml\n")
+            f.write("Salad;Greens;120;8;3;4;2;5;1;300;5;Mix;lunch;Lettuce:1 head,Olive oil:1 tbsp\n")
+            f.write("Stew;Beans;450;50;9;12;6;20;3;800;40;Simmer;dinner;Beans:200 g,Onion:1\n")
+        self.addCleanup(os.remove, f.name)
+        previous = get_stamps([CATALOG_VERSION_KEY])[0]
+
+        with CaptureQueriesContext(connection) as queries:
+            success, message = upload_recipes_from_csv(f.name)
+
+        self.assertTrue(success, message)
+        self.assertEqual(Recipe.objects.count(), 3)
+        stamp_queries = [query['sql'] for query in queries if 'api_versionstamp' in query['sql']]
+        self.assertEqual(len(stamp_queries), 2, stamp_queries)
+        self.assertTrue(stamp_queries[1].startswith('UPDATE'))
+        self.assertGreater(get_stamps([CATALOG_VERSION_KEY])[0], previous)
+
+    def test_weekly_nutrition_keeps_fractions(self):
+        user = User.objects.create_user(email='fractions@example.com', password='password123')
+        day_plan = DayPlan.objects.create(user=user, date=now().date())
+        for meal_type in ['lunch', 'dinner']:
+            recipe = Recipe.objects.create(
+                title="Recipe", description="Des", preparation_time=15, preparation_guide="Prepare", meal_type=meal_type,
+                total_calories=300, sugars=5, protein=10, fat=5, carbohydrates=10, fiber=2.5, iron=0.4, potassium=100,
+            )
+            DayPlanRecipes.objects.create(day_plan=day_plan, recipe=recipe)
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        today = str(now().date())
+        response = client.get('/api/weekly-nutrition/', {'start_date': today, 'end_date': today})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        day = next(day for week in response.data for day in week['days'] if day['date'] == today)
+        self.assertEqual(Decimal(day['daily_totals']['fiber']), 5)
+        self.assertEqual(Decimal(day['daily_totals']['iron']), Decimal('0.8'))
+
+
+class SummaryBackfillTests(TransactionTestCase):
+    def test_migration_fills_the_rollups_of_existing_plans(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('api', '0027_versionstamp')])
+        apps = executor.loader.project_state(('api', '0027_versionstamp')).apps
+        user = apps.get_model('api', 'User').objects.create(email='backfill@example.com', password='x')
+        recipe = apps.get_model('api', 'Recipe').objects.create(
+            title="Old", description="Des", preparation_time=10, preparation_guide="Prepare", meal_type='lunch',
+            total_calories=300, sugars=5, protein=10, fat=5, carbohydrates=10, fiber=2, iron=1, potassium=100,
+        )
+        today = now().date()
+        for days in (0, 1, 7):
+            day_plan = apps.get_model('api', 'DayPlan').objects.create(user=user, date=today + timedelta(days=days))
+            apps.get_model('api', 'DayPlanRecipes').objects.create(day_plan=day_plan, recipe=recipe)
+        apps.get_model('api', 'DayPlanItem').objects.create(
+            user=user, date=today, item_name="Tea", total_calories=2, quantity=3
+        )
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes('api'))
+
+        self.assertEqual(check_summaries(), [])
+        daily = DailySummary.objects.get(user_id=user.id, date=today)
+        self.assertEqual((daily.entries, daily.total_calories), (2, 306))
+        self.assertEqual(WeeklySummary.objects.filter(user_id=user.id).count(), 2)
+
+
+class NutritionSummaryTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='rollups@example.com', password='password123')
+        self.client.force_authenticate(user=self.user)
+        seed_version_stamps(self.user)
+        self.today = now().date()
+        self.recipes = [
+            Recipe.objects.create(
+                title=f"Recipe {i}", description="Des", preparation_time=15, preparation_guide="Prepare",
+                meal_type='lunch', total_calories=300 + i * 100, sugars=5, protein=10 + i, fat=5,
+                carbohydrates=10, fiber=2.5, iron=1, potassium=100,
+            )
+            for i in range(3)
+        ]
+        self.day_plan = DayPlan.objects.create(user=self.user, date=self.today)
+
+    def daily(self, date=None):
+        return DailySummary.objects.get(user=self.user, date=date or self.today)
+
+    def test_planned_recipes_update_the_rollups(self):
+        DayPlanRecipes.objects.create(day_plan=self.day_plan, recipe=self.recipes[0])
+        DayPlanRecipes.objects.create(day_plan=self.day_plan, recipe=self.recipes[1])
+        self.assertEqual((self.daily().entries, self.daily().total_calories, self.daily().total_fiber), (2, 700, 5))
+
+        weekly = WeeklySummary.objects.get(user=self.user)
+        self.assertEqual(weekly.week_start, self.today - timedelta(days=self.today.weekday()))
+        self.assertEqual(weekly.week_end, weekly.week_start + timedelta(days=6))
+        self.assertEqual(weekly.total_calories, 700)
+
+        response = self.client.patch('/api/weekly-meal-plan/', {
+            'day': str(self.today), 'current_recipe_id': self.recipes[0].id, 'new_recipe_id': self.recipes[2].id,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((self.daily().entries, self.daily().total_calories), (2, 900))
+
+        self.recipes[1].total_calories = 450
+        self.recipes[1].save()
+        self.assertEqual(self.daily().total_calories, 950)
+
+        self.recipes[2].delete()
+        self.assertEqual((self.daily().entries, self.daily().total_calories), (1, 450))
+        self.assertEqual(check_summaries(), [])
+
+        DayPlanRecipes.objects.filter(day_plan=self.day_plan).delete()
+        self.assertFalse(DailySummary.objects.filter(user=self.user).exists())
+        self.assertFalse(WeeklySummary.objects.filter(user=self.user).exists())
+
+    def test_day_plan_items_update_the_rollups(self):
+        response = self.client.post('/api/day-plan-items/', {
+            'date': str(self.today), 'items': [{'item_name': 'Apple', 'total_calories': 80, 'total_protein': 1.5}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        item = DayPlanItem.objects.get(user=self.user)
+        self.assertEqual((self.daily().total_calories, self.daily().total_protein), (80, 1.5))
+
+        tomorrow = self.today + timedelta(days=1)
+        self.client.patch(f'/api/weekly-plan/items/{item.id}/', {'quantity': 3, 'date': str(tomorrow)}, format='json')
+        self.assertFalse(DailySummary.objects.filter(user=self.user, date=self.today).exists())
+        self.assertEqual(self.daily(tomorrow).total_calories, 240)
+
+        self.client.delete(f'/api/day-plan-items/{item.id}/')
+        self.assertFalse(DailySummary.objects.filter(user=self.user).exists())
+        self.assertEqual(check_summaries(), [])
+
+    def test_reset_keeps_the_items_rollups(self):
+        DayPlanRecipes.objects.create(day_plan=self.day_plan, recipe=self.recipes[0])
+        DayPlanItem.objects.create(user=self.user, date=self.today, item_name="Apple", total_calories=80, quantity=2)
+
+        response = self.client.delete('/api/reset-meal-plans/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((self.daily().entries, self.daily().total_calories), (1, 160))
+        self.assertEqual(check_summaries(), [])
+
+    def test_rollups_do_not_drift_with_float_deltas(self):
+        first = DayPlanItem.objects.create(user=self.user, date=self.today, item_name="Mint", total_calories=0.1)
+        DayPlanItem.objects.create(user=self.user, date=self.today, item_name="Tea", total_calories=0.2)
+        first.delete()
+
+        self.assertEqual(self.daily().total_calories, 0.2)
+        self.assertEqual(WeeklySummary.objects.get(user=self.user).total_calories, 0.2)
+        self.assertEqual(check_summaries(), [])
+
+        today = str(self.today)
+        response = self.client.get('/api/weekly-nutrition/', {'start_date': today, 'end_date': today})
+        day = next(day for week in response.data for day in week['days'] if day['date'] == today)
+        self.assertEqual(day['daily_totals']['calories'], '0.2')
+
+        DailySummary.objects.filter(user=self.user).update(total_calories=0.2 + 1e-9)
+        self.assertEqual([difference[3] for difference in check_summaries()], ['total_calories'])
+
+    def test_weekly_nutrition_reads_the_rollups(self):
+        DayPlanRecipes.objects.create(day_plan=self.day_plan, recipe=self.recipes[0])
+        DayPlanItem.objects.create(user=self.user, date=self.today, item_name="Apple", total_calories=80, quantity=2)
+        DayPlanRecipes.objects.all().update(recipe=self.recipes[1])
+
+        today = str(self.today)
+        response = self.client.get('/api/weekly-nutrition/', {'start_date': today, 'end_date': today})
+
+        day = next(day for week in response.data for day in week['days'] if day['date'] == today)
+        # the queryset update bypassed the signals, so the rollup still has recipe 0
+        self.assertEqual(day['daily_totals']['calories'], '460.0')
+
+    def test_weekly_nutrition_runs_one_summary_query(self):
+        for days, recipe in [(-9, 0), (-8, 1), (-6, 2), (-1, 0), (0, 1), (2, 2)]:
+            plan_date = self.today + timedelta(days=days)
+            DayPlanRecipes.objects.create(day_plan=DayPlan.objects.get_or_create(user=self.user, date=plan_date)[0],
+                                          recipe=self.recipes[recipe])
+        DayPlanItem.objects.create(user=self.user, date=self.today - timedelta(days=8), item_name="Tea",
+                                   total_calories=0.1, total_protein=0.2, quantity=3)
+
+        start, end = self.today - timedelta(days=10), self.today + timedelta(days=3)
+        # the version stamps of the entity tag, then the summaries
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/weekly-nutrition/', {'start_date': str(start), 'end_date': str(end)})
+
+        summaries = {summary.date: summary for summary in DailySummary.objects.filter(user=self.user)}
+        days = [day for week in response.data for day in week['days']]
+        self.assertEqual(days[0]['date'], str(start - timedelta(days=start.weekday())))
+        self.assertEqual(days[-1]['date'], str(end))
+        for day in days:
+            day_date = datetime.strptime(day['date'], '%Y-%m-%d').date()
+            week_start = day_date - timedelta(days=day_date.weekday())
+            summary = summaries.get(day_date)
+            self.assertEqual(day['daily_totals']['protein'], str(Decimal(str(summary.total_protein)) if summary else 0))
+            self.assertEqual(day['cumulative_totals']['calories'], str(sum(
+                (Decimal(str(s.total_calories)) for d, s in summaries.items() if week_start <= d <= day_date),
+                Decimal('0')
+            )))
+
+    def test_nutrient_summary_aggregates_the_window(self):
+        UserNutrientPreferences.objects.create(user=self.user, min_calories=1000, max_calories=2000)
+        for days, recipe in [(-30, 2), (-2, 0), (0, 1), (3, 2), (9, 0)]:
+            plan_date = self.today + timedelta(days=days)
+            DayPlanRecipes.objects.create(day_plan=DayPlan.objects.get_or_create(user=self.user, date=plan_date)[0],
+                                          recipe=self.recipes[recipe])
+
+        start, end = self.today - timedelta(days=2), self.today + timedelta(days=2)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/nutrient-summary/', {'start_date': str(start), 'end_date': str(end)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['start_date'], response.data['days']), (str(start), 5))
+        calories = response.data['comparisons']['total_calories']
+        self.assertEqual((calories['total'], calories['min'], calories['max']), (700, 5000, 10000))
+        self.assertEqual((calories['min_7_days'], calories['max_7_days']), (7000, 14000))
+
+        # without a range the whole history is summed, as before windows existed
+        response = self.client.get('/api/nutrient-summary/')
+        self.assertEqual(list(response.data), ['comparisons'])
+        protein = response.data['comparisons']['protein']
+        self.assertEqual(protein['total'], sum(self.recipes[recipe].protein for recipe in [2, 0, 1, 2, 0]))
+        self.assertEqual(sorted(protein), ['max_7_days', 'min_7_days', 'total'])
+
+        response = self.client.get('/api/nutrient-summary/', {'start_date': str(end), 'end_date': str(start)})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/nutrient-summary/', {'start_date': '18.10.2026'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_command_repairs_drift(self):
+        DayPlanRecipes.objects.create(day_plan=self.day_plan, recipe=self.recipes[0])
+        DailySummary.objects.filter(user=self.user).update(total_protein=99)
+        WeeklySummary.objects.filter(user=self.user).delete()
+
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_summaries', '--check', stdout=out)
+        self.assertIn("total_protein: stored 99.0, expected 10.0", out.getvalue())
+        self.assertIn("WeeklySummary", out.getvalue())
+
+        call_command('rebuild_summaries', stdout=StringIO())
+        self.assertEqual(check_summaries(), [])
+        self.assertEqual(self.daily().total_protein, 10)
+
+
+class RecipeSerializationQueryTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='prefetch@example.com', password='password123')
+        self.client.force_authenticate(user=self.user)
+        seed_version_stamps(self.user)
+        ingredients = [Ingredient.objects.create(name=f"Ingredient {i}") for i in range(4)]
+        self.recipes = []
+        for i in range(6):
+            recipe = Recipe.objects.create(
+                title=f"Recipe {i}", description="Des", preparation_time=15, preparation_guide="Prepare",
+                meal_type=['breakfast', 'lunch'][i % 2], total_calories=300, sugars=5, protein=10, fat=5,
+                carbohydrates=10, fiber=2, iron=1, potassium=100,
+            )
+            for ingredient in ingredients[:i % 4 + 1]:
+                RecipeIngredients.objects.create(recipe=recipe, ingredient=ingredient, quantity=2, unit="g")
+            self.recipes.append(recipe)
+
+    def test_recipe_endpoints_run_a_constant_number_of_queries(self):
+        # the version stamps of the entity tag and the cache key, then the recipes
+        # and their ingredients
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(len(response.json()), 6)
+        self.assertEqual(
+            [ingredient['ingredient_name'] for ingredient in response.json()[3]['ingredients']],
+            ["Ingredient 0", "Ingredient 1", "Ingredient 2", "Ingredient 3"]
+        )
+
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/recipes/by-type/', {'meal_type': 'lunch'})
+        self.assertEqual(len(response.json()), 3)
+
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/recipes/{self.recipes[2].id}/')
+        self.assertEqual(len(response.json()['ingredients']), 3)
+
+    def test_weekly_plan_prefetches_the_ingredients(self):
+        today = now().date()
+        for i, recipe in enumerate(self.recipes):
+            day_plan = DayPlan.objects.get_or_create(user=self.user, date=today + timedelta(days=i % 3))[0]
+            DayPlanRecipes.objects.create(day_plan=day_plan, recipe=recipe)
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/weekly-meal-plan/')
+        planned = response.data['planned_recipes']
+        self.assertEqual(sum(len(recipes) for recipes in planned.values()), 6)
+        self.assertEqual(len(planned[str(today)][0]['ingredients']), 1)
+
+    def test_recipe_listing_pages_by_id(self):
+        ids, url = [], '/api/recipes/?limit=4'
+        while url:
+            with self.assertNumQueries(4):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [recipe['id'] for recipe in response.json()['results']]
+            url = response.json()['next']
+        self.assertEqual(ids, sorted(recipe.id for recipe in self.recipes))
+
+        response = self.client.get('/api/recipes/by-type/', {'meal_type': 'breakfast', 'limit': 2})
+        self.assertEqual([recipe['title'] for recipe in response.json()['results']], ["Recipe 0", "Recipe 2"])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([recipe['title'] for recipe in response.json()['results']], ["Recipe 4"])
+        self.assertIsNone(response.json()['next'])
+
+    def test_recipe_listing_projects_fields(self):
+        with self.assertNumQueries(3) as queries:
+            response = self.client.get('/api/recipes/', {'fields': 'id,title,total_calories'})
+        self.assertEqual(list(response.json()[0]), ['id', 'title', 'total_calories'])
+        self.assertNotIn('preparation_guide', queries.captured_queries[2]['sql'])
+
+        response = self.client.get('/api/recipes/by-type/', {'meal_type': 'lunch', 'compact': '1', 'limit': 10})
+        self.assertEqual(list(response.json()['results'][0]), RecipeSerializer.COMPACT_FIELDS)
+
+        response = self.client.get('/api/recipes/', {'fields': 'title,ingredients'})
+        self.assertEqual(len(response.json()[1]['ingredients']), 2)
+
+        response = self.client.get('/api/recipes/', {'fields': 'title,secret'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeResponseCacheTests(APITestCase):
+    def setUp(self):
+        recipe_responses.reset_stats()
+        self.user = User.objects.create_user(email='responses@example.com', password='password123')
+        self.client.force_authenticate(user=self.user)
+        seed_version_stamps(self.user)
+        self.ingredient = Ingredient.objects.create(name="Basil")
+        self.recipe = Recipe.objects.create(
+            title="Pesto", description="Des", preparation_time=15, preparation_guide="Prepare",
+            meal_type='lunch', total_calories=300, sugars=5, protein=10, fat=5,
+            carbohydrates=10, fiber=2, iron=1, potassium=100,
+        )
+        RecipeIngredients.objects.create(recipe=self.recipe, ingredient=self.ingredient, quantity=2, unit="g")
+
+    def test_repeated_reads_are_served_from_the_cache(self):
+        for url in ['/api/recipes/', f'/api/recipes/{self.recipe.id}/', '/api/recipes/by-type/?meal_type=lunch&limit=5']:
+            first = self.client.get(url)
+            # the version stamps of the entity tag and the cache key
+            with self.assertNumQueries(2):
+                second = self.client.get(url)
+            self.assertEqual(second.content, first.content)
+            self.assertEqual(second['Content-Type'], 'application/json')
+        self.assertEqual((recipe_responses.stats()['hits'], recipe_responses.stats()['misses']), (3, 3))
+
+        self.assertEqual(self.client.get('/api/recipes/by-type/?meal_type=dinner').json(), [])
+        self.assertEqual(self.client.get('/api/recipes/999999/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_catalog_writes_invalidate_the_cache(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assertEqual(self.client.get(url).json()['title'], "Pesto")
+
+        self.recipe.title = "Green pesto"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        self.assertEqual(self.client.get(url).json()['title'], "Green pesto")
+        self.assertEqual(self.client.get('/api/recipes/').json()[0]['title'], "Green pesto")
+
+        self.ingredient.name = "Thai basil"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.save()
+        self.assertEqual(self.client.get(url).json()['ingredients'][0]['ingredient_name'], "Thai basil")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredients.objects.create(
+                recipe=self.recipe, ingredient=Ingredient.objects.create(name="Pine nuts"), quantity=1, unit="g"
+            )
+        self.assertEqual(len(self.client.get('/api/recipes/').json()[0]['ingredients']), 2)
+
+    def test_writes_invalidate_responses_rendered_before_them(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        # another connection renders and caches the old row under the version
+        # it sees until this write commits
+        cache.set(recipe_responses.make_key('recipe', self.recipe.id), b'{"title": "Pesto"}')
+        self.recipe.title = "Committed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        self.assertEqual(self.client.get(url).json()['title'], "Committed")
+
+    def test_stats_are_staff_only(self):
+        self.assertEqual(self.client.get('/api/recipes/cache-stats/').status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get('/api/recipes/')
+        response = self.client.get('/api/recipes/cache-stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['misses'], 1)
+
+
+
+
+class RecipeSearchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='search@example.com', password='password123')
+        self.client.force_authenticate(user=self.user)
+        self.garlic = Ingredient.objects.create(name="Garlic")
+        self.recipes = {}
+        for title, meal_type, calories, protein, minutes in [
+            ("Omelette", 'breakfast', 350, 25, 10), ("Porridge", 'breakfast', 300, 8, 5),
+            ("Chicken bowl", 'lunch', 480, 42, 25), ("Steak", 'dinner', 700, 55, 20),
+            ("Tofu stir fry", 'dinner', 450, 30, 15), ("Garlic prawns", 'dinner', 400, 35, 10),
+        ]:
+            self.recipes[title] = Recipe.objects.create(
+                title=title, description="Des", preparation_time=minutes, preparation_guide="Prepare",
+                meal_type=meal_type, total_calories=calories, sugars=5, protein=protein, fat=5,
+                carbohydrates=10, fiber=2, iron=1, potassium=100,
+            )
+        RecipeIngredients.objects.create(recipe=self.recipes["Garlic prawns"], ingredient=self.garlic)
+
+    def titles(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [recipe['title'] for recipe in response.json()['results']]
+
+    def test_search_filters_and_sorts(self):
+        response = self.client.get('/api/recipes/search/', {
+            'min_protein': 25, 'max_total_calories': 500, 'max_preparation_time': 20, 'sort': '-protein',
+        })
+        self.assertEqual(self.titles(response), ["Garlic prawns", "Tofu stir fry", "Omelette"])
+
+        response = self.client.get('/api/recipes/search/', {'meal_type': 'dinner', 'sort': 'total_calories'})
+        self.assertEqual(self.titles(response), ["Garlic prawns", "Tofu stir fry", "Steak"])
+
+        DislikedIngredients.objects.create(user=self.user, ingredient=self.garlic)
+        response = self.client.get('/api/recipes/search/', {'meal_type': 'dinner', 'sort': 'total_calories'})
+        self.assertEqual(self.titles(response), ["Tofu stir fry", "Steak"])
+
+    def test_search_pages_in_sort_order(self):
+        titles, url = [], '/api/recipes/search/?sort=-total_calories&limit=2&compact=1'
+        while url:
+            response = self.client.get(url)
+            titles += self.titles(response)
+            url = response.json()['next']
+        self.assertEqual(titles, ["Steak", "Chicken bowl", "Tofu stir fry", "Garlic prawns", "Omelette", "Porridge"])
+
+        response = self.client.get('/api/recipes/search/', {'sort': 'protein', 'fields': 'id,title', 'limit': 1})
+        self.assertEqual(response.json()['results'], [{'id': self.recipes["Porridge"].id, 'title': "Porridge"}])
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in [{'min_protein': 'lots'}, {'min_fat': 10, 'max_fat': 5}, {'sort': 'title'}]:
+            response = self.client.get('/api/recipes/search/', params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_range_filters_use_the_indexes(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # the test tables are too small for the planner to prefer an index on its own
+                cursor.execute("SET enable_seqscan = off")
+            for params, sort in [
+                ({'min_protein': 30}, '-protein'),
+                ({'max_preparation_time': 10, 'min_total_calories': 300}, '-total_calories'),
+                ({'meal_type': 'dinner', 'max_total_calories': 500}, 'id'),
+            ]:
+                plan = search_recipes(self.user, sort=sort, **params).explain()
+                self.assertNotIn('SCAN api_recipe\n', plan + '\n', plan)
+                self.assertNotIn('Seq Scan on api_recipe ', plan)
+                self.assertRegex(plan, r'USING INDEX api_recipe_\w+_idx|Index .*Scan')
+
+
+
+class RecipeTextSearchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='fulltext@example.com', password='password123')
+        self.client.force_authenticate(user=self.user)
+        seed_version_stamps(self.user)
+        self.prawn = Ingredient.objects.create(name="Tiger prawn")
+        self.recipes = {}
+        for title, meal_type, description, guide, ingredients in [
+            ("Garlic prawns", 'dinner', "Quick and spicy", "Fry the garlic", [self.prawn]),
+            ("Prawn noodle soup", 'lunch', "Light broth", "Simmer", [self.prawn]),
+            ("Seafood paella", 'dinner', "Rice with prawns and mussels", "Cook the rice", []),
+            ("Paella valenciana", 'dinner', "Chicken and rabbit", "Cook the rice slowly", []),
+            ("Lentil soup", 'lunch', "Hearty and warm", "Simmer the lentils", []),
+        ]:
+            recipe = Recipe.objects.create(
+                title=title, description=description, preparation_time=15, preparation_guide=guide,
+                meal_type=meal_type, total_calories=300, sugars=5, protein=10, fat=5,
+                carbohydrates=10, fiber=2, iron=1, potassium=100,
+            )
+            for ingredient in ingredients:
+                RecipeIngredients.objects.create(recipe=recipe, ingredient=ingredient, quantity=100, unit="g")
+            self.recipes[title] = recipe
+
+    def search(self, q, **params):
+        response = self.client.get('/api/recipes/text-search/', {'q': q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [recipe['title'] for recipe in response.json()['results']]
+
+    def test_results_are_ranked(self):
+        # title matches first, then ingredient, then description matches
+        self.assertEqual(self.search("prawns"), ["Garlic prawns", "Prawn noodle soup", "Seafood paella"])
+        # ties keep the id order
+        self.assertEqual(self.search("soup"), ["Prawn noodle soup", "Lentil soup"])
+        self.assertEqual(self.search("Paella, rice!"), ["Seafood paella", "Paella valenciana"])
+        self.assertEqual(self.search("paella prawn"), ["Seafood paella"])
+        self.assertEqual(self.search("tiger"), ["Garlic prawns", "Prawn noodle soup"])
+        self.assertEqual(self.search("truffle"), [])
+
+        response = self.client.get('/api/recipes/text-search/', {'q': "soup", 'compact': '1', 'limit': 1})
+        result = response.json()['results'][0]
+        self.assertEqual(list(result), [*RecipeSerializer.COMPACT_FIELDS, 'rank'])
+        self.assertGreater(result['rank'], 0)
+
+    def test_filters(self):
+        self.assertEqual(self.search("prawns", meal_type='lunch'), ["Prawn noodle soup"])
+        DislikedIngredients.objects.create(user=self.user, ingredient=self.prawn)
+        self.assertEqual(self.search("prawns", exclude_disliked='1'), ["Seafood paella"])
+        self.assertEqual(self.client.get('/api/recipes/text-search/').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get('/api/recipes/text-search/', {'q': 'soup', 'limit': 0}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+
+    def test_writes_update_the_index(self):
+        self.assertEqual(self.search("broth"), ["Prawn noodle soup"])
+        recipe = self.recipes["Lentil soup"]
+        recipe.description = "Hearty broth"
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        self.assertEqual(self.search("broth"), ["Prawn noodle soup", "Lentil soup"])
+
+        self.prawn.name = "King prawn"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prawn.save()
+        self.assertEqual(self.search("king"), ["Garlic prawns", "Prawn noodle soup"])
+        self.assertEqual(self.search("tiger"), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredients.objects.create(recipe=recipe, ingredient=Ingredient.objects.create(name="Cumin"))
+        self.assertEqual(self.search("cumin"), ["Lentil soup"])
+
+    def test_search_reads_recipes_by_id(self):
+        self.search("soup")
+        with CaptureQueriesContext(connection) as queries:
+            self.search("paella")
+        queries = [query for query in queries if 'api_versionstamp' not in query['sql']]
+        self.assertEqual(len(queries), 2)
+        self.assertIn('"api_recipe"."id" IN', queries[0]['sql'])
+        if connection.vendor != 'postgresql':
+            with connection.cursor() as cursor:
+                columns = [column.name for column in connection.introspection.get_table_description(cursor, 'api_recipe')]
+            self.assertNotIn('search_vector', columns)
+
+
+@skipUnless(connection.vendor == 'postgresql', "search vectors only exist on PostgreSQL")
+class RecipeSearchVectorTests(TransactionTestCase):
+    def setUp(self):
+        self.prawn = Ingredient.objects.create(name="Tiger prawn")
+        self.recipes = {}
+        for title, description, ingredients in [
+            ("Garlic prawns", "Quick and spicy", [self.prawn]),
+            ("Prawn noodle soup", "Light broth", [self.prawn]),
+            ("Seafood paella", "Rice with prawns and mussels", []),
+            ("Lentil soup", "Hearty and warm", []),
+        ]:
+            self.recipes[title] = self.create_recipe(title, description, ingredients)
+
+    def create_recipe(self, title, description, ingredients=()):
+        recipe = Recipe.objects.create(
+            title=title, description=description, preparation_time=15, preparation_guide="Cook",
+            meal_type='dinner', total_calories=300, sugars=5, protein=10, fat=5,
+            carbohydrates=10, fiber=2, iron=1, potassium=100,
+        )
+        for ingredient in ingredients:
+            RecipeIngredients.objects.create(recipe=recipe, ingredient=ingredient, quantity=100, unit="g")
+        return recipe
+
+    def search(self, query, **kwargs):
+        titles = dict(Recipe.objects.values_list('id', 'title'))
+        return [titles[recipe_id] for recipe_id, _ in search_recipe_text(query, **kwargs)]
+
+    def test_migration_adds_a_gin_index(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, 'api_recipe')
+        self.assertEqual(constraints['api_recipe_search_vector_idx']['columns'], ['search_vector'])
+        self.assertEqual(constraints['api_recipe_search_vector_idx']['type'], 'gin')
+
+    def test_results_are_ranked_by_field_weight(self):
+        self.assertEqual(self.search("prawn"), ["Garlic prawns", "Prawn noodle soup", "Seafood paella"])
+        # ties keep the id order
+        self.assertEqual(self.search("soup"), ["Prawn noodle soup", "Lentil soup"])
+        self.assertEqual(self.search("prawn", excluded_ids=[self.recipes["Garlic prawns"].id]),
+                         ["Prawn noodle soup", "Seafood paella"])
+        self.assertEqual(self.search("prawn", limit=1), ["Garlic prawns"])
+        self.assertEqual(self.search("prawn", meal_type='lunch'), [])
+
+    def test_vectors_follow_writes(self):
+        recipe = self.recipes["Lentil soup"]
+        recipe.description = "Hearty broth"
+        recipe.save()
+        self.assertEqual(self.search("broth"), ["Prawn noodle soup", "Lentil soup"])
+
+        self.prawn.name = "King prawn"
+        self.prawn.save()
+        self.assertEqual(self.search("king"), ["Garlic prawns", "Prawn noodle soup"])
+        self.assertEqual(self.search("tiger"), [])
+
+        link = RecipeIngredients.objects.get(recipe=self.recipes["Garlic prawns"])
+        link.delete()
+        self.assertEqual(self.search("king"), ["Prawn noodle soup"])
+
+    def test_a_transaction_updates_its_vectors_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                garlic = Ingredient.objects.create(name="Garlic")
+                for i in range(5):
+                    self.create_recipe(f"Garlic bread {i}", "Crusty", [garlic, self.prawn])
+                self.assertEqual(self.search("crusty"), [])
+        updates = [query for query in queries if 'SET search_vector' in query['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(len(self.search("crusty")), 5)
+
+        with transaction.atomic():
+            self.create_recipe("Rolled back", "Crusty")
+            transaction.set_rollback(True)
+        self.create_recipe("Committed", "Crusty")
+        self.assertEqual(len(self.search("crusty")), 6)
+
+    def test_queries_use_the_gin_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+            cursor.execute("EXPLAIN " + SEARCH, {
+                'config': SEARCH_CONFIG, 'query': "prawn", 'meal_type': None, 'excluded': [], 'limit': 20,
+            })
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+            cursor.execute("RESET enable_seqscan")
+        self.assertIn("api_recipe_search_vector_idx", plan)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='etags@example.com', password='password123')
+        self.client.force_authenticate(user=self.user)
+        self.recipe = Recipe.objects.create(
+            title="Soup", description="Des", preparation_time=15, preparation_guide="Prepare",
+            meal_type='lunch', total_calories=300, sugars=5, protein=10, fat=5,
+            carbohydrates=10, fiber=2, iron=1, potassium=100,
+        )
+        UserNutrientPreferences.objects.create(user=self.user, min_calories=1000, max_calories=2000)
+
+    def assertNotModified(self, url, etag):
+        # only the version stamps are read
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def assertModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        return response['ETag']
+
+    def test_unchanged_responses_are_not_modified(self):
+        urls = ['/api/recipes/', '/api/recipes/by-type/?meal_type=lunch', f'/api/recipes/{self.recipe.id}/',
+                '/api/weekly-meal-plan/', '/api/cart/', '/api/weights/', '/api/nutrient-summary/',
+                '/api/weekly-nutrition/']
+        etags = set()
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+            self.assertTrue(response['ETag'].startswith('"'), url)
+            etags.add(response['ETag'])
+            self.assertNotModified(url, response['ETag'])
+        self.assertEqual(len(etags), len(urls))
+
+        response = self.client.get('/api/nutrient-summary/', {'start_date': 'today'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_user_writes_change_the_tags(self):
+        plan, cart, weights, summary = (self.client.get(url)['ETag'] for url in
+                                        ['/api/weekly-meal-plan/', '/api/cart/', '/api/weights/', '/api/nutrient-summary/'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DayPlanRecipes.objects.create(day_plan=DayPlan.objects.create(user=self.user, date=now().date()),
+                                          recipe=self.recipe)
+        plan = self.assertModified('/api/weekly-meal-plan/', plan)
+        summary = self.assertModified('/api/nutrient-summary/', summary)
+        self.assertNotModified('/api/cart/', cart)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/cart/', {
+                'ingredients': [{'ingredient_name': 'Salt', 'quantity': 1, 'unit': 'g'}]
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertModified('/api/cart/', cart)
+        self.assertNotModified('/api/weights/', weights)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/update-weight/', {'weight': 70}, format='json')
+        self.assertModified('/api/weights/', weights)
+        self.assertNotModified('/api/weekly-meal-plan/', plan)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/preferences/', {'min_calories': 1200}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertModified('/api/nutrient-summary/', summary)
+
+    def test_catalog_writes_change_the_recipe_tags(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        etag = self.client.get(url)['ETag']
+        self.recipe.title = "Cold soup"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        self.assertModified(url, etag)
+
+        plan = self.client.get('/api/weekly-meal-plan/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name="Salt")
+        self.assertNotModified('/api/weekly-meal-plan/', plan)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.filter(name="Salt").get().delete()
+        self.assertModified('/api/weekly-meal-plan/', plan)
+
+    def test_tags_follow_bumps_from_other_processes(self):
+        # the stamps are rows, so a bump made by a worker process is seen here
+        etag = self.client.get('/api/cart/')['ETag']
+        VersionStamp.objects.filter(key=user_version_key(self.user.id, 'cart')).update(value=F('value') + 1)
+        etag = self.assertModified('/api/cart/', etag)
+        VersionStamp.objects.all().delete()
+        self.assertModified('/api/cart/', etag)
+
+    def test_rolled_back_bumps_are_not_reused(self):
+        previous = get_stamps([CATALOG_VERSION_KEY])[0]
+        try:
+            with transaction.atomic():
+                rolled_back = bump_catalog_version()[1]
+                raise DatabaseError
+        except DatabaseError:
+            pass
+        self.assertEqual(get_stamps([CATALOG_VERSION_KEY])[0], previous)
+        self.assertEqual(bump_catalog_version()[0], previous)
+        self.assertGreater(get_stamps([CATALOG_VERSION_KEY])[0], rolled_back)
+
+
+class SharedRecipeCatalogTests(TransactionTestCase):
+    def setUp(self):
+        recipe_catalog.clear()
+        self.user = User.objects.create_user(email='catalog@example.com', password='password123')
+        self.onion = Ingredient.objects.create(name="Onion")
+
+    def create_recipe(self, **nutrients):
+        values = dict(
+            total_calories='300', sugars='5', protein='10', fat='5', carbohydrates='10',
+            fiber='2', iron='1', potassium='100',
+        )
+        values.update(nutrients)
+        return Recipe.objects.create(
+            title="Recipe", description="Des", preparation_time=15, preparation_guide="Prepare",
+            meal_type='lunch', **values
+        )
+
+    def test_changes_are_applied_without_a_rebuild(self):
+        first = self.create_recipe()
+        catalog = recipe_catalog.get()
+        builds = recipe_catalog.builds
+        self.assertEqual(list(catalog.ids), [first.id])
+
+        second = self.create_recipe(protein='25')
+        first.protein = '40'
+        first.save()
+        RecipeIngredients.objects.create(recipe=second, ingredient=self.onion, quantity=1.0, unit="g")
+
+        catalog = recipe_catalog.get()
+        self.assertEqual(list(catalog.ids), [first.id, second.id])
+        self.assertEqual(catalog.nutrient_totals([first.id, second.id])['protein'], 65)
+        self.assertEqual(list(catalog.candidates((), [self.onion.id])['id']), [first.id])
+
+        second.delete()
+        self.assertEqual(list(recipe_catalog.get().ids), [first.id])
+        self.assertEqual(recipe_catalog.builds, builds)
+        self.assertGreaterEqual(recipe_catalog.updates, 4)
+
+    def test_ingredient_bitsets_follow_recipe_ingredient_changes(self):
+        recipes = [self.create_recipe() for _ in range(3)]
+        ingredients = [self.onion] + [Ingredient.objects.create(name=f"Ingredient {i}") for i in range(11)]
+        recipe_catalog.get()
+
+        for ingredient in ingredients:
+            RecipeIngredients.objects.create(recipe=recipes[0], ingredient=ingredient, quantity=1.0, unit="g")
+        link = RecipeIngredients.objects.create(recipe=recipes[1], ingredient=self.onion, quantity=1.0, unit="g")
+        catalog = recipe_catalog.get()
+        self.assertEqual(catalog.ingredient_bits.shape[1], 2)
+        self.assertEqual(list(catalog.containing([ingredients[-1].id])), [True, False, False])
+        self.assertEqual(list(catalog.containing([self.onion.id])), [True, True, False])
+
+        link.ingredient = ingredients[-1]
+        link.save()
+        RecipeIngredients.objects.filter(recipe=recipes[0], ingredient=self.onion).delete()
+        catalog = recipe_catalog.get()
+        self.assertEqual(list(catalog.containing([self.onion.id])), [False, False, False])
+        self.assertEqual(list(catalog.containing([ingredients[-1].id, ingredients[1].id])), [True, True, False])
+
+        reloaded = RecipeCatalog.load()
+        for ingredient in ingredients:
+            self.assertEqual(list(catalog.containing([ingredient.id])), list(reloaded.containing([ingredient.id])))
+
+    def test_writes_from_other_processes_rebuild_the_catalog(self):
+        kept, deleted = self.create_recipe(), self.create_recipe()
+        recipe_catalog.get()
+        builds = recipe_catalog.builds
+
+        # what another process commits: rows changed without this process's
+        # signals, then its bump of the shared catalog version
+        Recipe.objects.filter(pk=kept.pk).update(protein=30)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM api_recipe WHERE id = %s', [deleted.pk])
+        self.assertEqual(list(recipe_catalog.get().ids), [kept.id, deleted.id])
+        VersionStamp.objects.filter(key=CATALOG_VERSION_KEY).update(value=F('value') + 1)
+
+        catalog = recipe_catalog.get()
+        self.assertEqual(recipe_catalog.builds, builds + 1)
+        self.assertEqual(list(catalog.ids), [kept.id])
+        self.assertEqual(catalog.nutrient_totals([kept.id])['protein'], 30)
+
+    def test_missing_nutrients_are_kept_out_of_candidates(self):
+        broken = self.create_recipe(protein=None)
+        catalog = recipe_catalog.get()
+
+        self.assertIn(broken.id, list(catalog.ids))
+        self.assertTrue(load_candidate_recipes(self.user).empty)
+        self.assertEqual(catalog.nutrient_totals([broken.id])['protein'], 0)
+        self.assertEqual(catalog.nutrient_totals([broken.id])['total_calories'], 300)
+
+    def test_nutrient_summary_sums_the_planned_recipes(self):
+        recipe = self.create_recipe(iron=None)
+        UserNutrientPreferences.objects.create(user=self.user, min_calories=1000, max_calories=2000)
+        day_plan = DayPlan.objects.create(user=self.user, date=now().date())
+        DayPlanRecipes.objects.create(day_plan=day_plan, recipe=recipe)
+        DayPlanRecipes.objects.create(
+            day_plan=DayPlan.objects.create(user=self.user, date=now().date() + timedelta(days=1)), recipe=recipe
+        )
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get('/api/nutrient-summary/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        comparisons = response.data['comparisons']
+        self.assertEqual(comparisons['total_calories']['total'], 600)
+        self.assertEqual(comparisons['total_calories']['max_7_days'], 14000)
+        self.assertEqual(comparisons['iron']['total'], 0)
+
+
 class CartTestCase(APITestCase):
     def setUp(self):
         self.user_data = {
@@ -640,6 +2174,7 @@ class DayPlanRecipesTests(APITestCase):
 
         weekly_plan = response.data.get("weekly_plan", [])
         self.assertEqual(len(weekly_plan), 7) 
+        self.assertIn("engine", response.data)
         for day_plan in weekly_plan:
             self.assertIn("date", day_plan)
             self.assertIn("recipes", day_plan)
@@ -693,6 +2228,40 @@ class DayPlanRecipesTests(APITestCase):
         response = self.client.patch("/api/weekly-meal-plan/", patch_data, format='json')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_background_planning_job(self):
+        response = self.client.post("/api/weekly-meal-plan/jobs/")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = response.data["job_id"]
+
+        duplicate = self.client.post("/api/weekly-meal-plan/jobs/")
+        self.assertEqual(duplicate.data["job_id"], job_id)
+
+        response = self.client.get(f"/api/weekly-meal-plan/jobs/{job_id}/")
+        self.assertEqual(response.data["status"], PlanningJob.STATUS_PENDING)
+
+        call_command('run_planning_jobs', '--once', stdout=StringIO())
+
+        response = self.client.get(f"/api/weekly-meal-plan/jobs/{job_id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], PlanningJob.STATUS_DONE)
+        self.assertEqual(response.data["progress"], 100)
+        self.assertEqual(len(response.data["result"]["weekly_plan"]), 7)
+
+    def test_planning_job_of_another_user(self):
+        other = User.objects.create_user(email='other@example.com', password='password123')
+        job = PlanningJob.objects.create(user=other)
+
+        response = self.client.get(f"/api/weekly-meal-plan/jobs/{job.id}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_planning_job_urls_reject_other_methods(self):
+        job = PlanningJob.objects.create(user=self.user)
+
+        response = self.client.get("/api/weekly-meal-plan/jobs/")
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        response = self.client.post(f"/api/weekly-meal-plan/jobs/{job.id}/")
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
     def test_patch_duplicate_recipe(self):
         today = datetime.today().date()
         day_plan = DayPlan.objects.create(user=self.user, date=today)
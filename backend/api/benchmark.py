@@ -0,0 +1,264 @@
+"""
+Planner benchmark on seeded synthetic catalogs, see the benchmark_planner
+management command. Everything here writes to the database, so callers run
+it inside a transaction that is rolled back afterwards.
+"""
+import os
+import platform
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pulp
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from .cache import bump_catalog_version, plan_cache
+from .catalog import RecipeCatalog, activate_catalog
+from .models import Recipe, Ingredient, RecipeIngredients, DislikedIngredients, UserNutrientPreferences
+from .solvers import (MODEL_BUILDERS, BranchAndBoundBackend, build_model_arrays, build_weekly_model,
+                      get_solver_backend, run_cbc)
+from .utils import (resolve_objective, get_disliked_ingredient_ids, load_candidate_recipes, prune_candidates,
+                    get_pruning_options, get_planning_deadline, load_week_plans, save_week_plans, solve_week,
+                    plan_meals_for_week)
+
+
+# share of the catalog and mean calories per meal type
+MEAL_TYPE_PROFILES = {
+    'breakfast': (0.25, 380),
+    'lunch': (0.30, 620),
+    'dinner': (0.30, 700),
+    'snack': (0.15, 220),
+}
+
+DIET_TYPES = ['high_protein', 'low_calories', 'high_fat', 'low_carbohydrates', 'high_fiber']
+
+
+def generate_catalog(size, rng, ingredient_count=1000, fan_out=8):
+    """
+    Creates `size` recipes with plausible nutrients and, on average,
+    `fan_out` ingredients each. Ingredient popularity follows a Zipf-like
+    curve, as in real recipe collections (salt and onion everywhere, saffron
+    almost nowhere). Returns the ingredient ids, most popular first, and
+    the number of recipe-ingredient links.
+    """
+    ingredients = Ingredient.objects.bulk_create([
+        Ingredient(name=f"Benchmark ingredient {i}") for i in range(ingredient_count)
+    ])
+    ingredient_ids = np.array([ingredient.id for ingredient in ingredients])
+
+    meal_types = rng.choice(
+        list(MEAL_TYPE_PROFILES), size, p=[share for share, _ in MEAL_TYPE_PROFILES.values()]
+    )
+    calories = np.array([MEAL_TYPE_PROFILES[meal_type][1] for meal_type in meal_types])
+    calories = np.clip(rng.normal(calories, calories * 0.3), 50, None)
+    protein_share, fat_share, carb_share = rng.dirichlet([3, 3, 5], size).T
+    carbohydrates = calories * carb_share / 4
+
+    nutrients = {
+        'total_calories': calories,
+        'protein': calories * protein_share / 4,
+        'fat': calories * fat_share / 9,
+        'carbohydrates': carbohydrates,
+        'sugars': carbohydrates * rng.uniform(0.05, 0.4, size),
+        'fiber': carbohydrates * rng.uniform(0.02, 0.15, size),
+        'iron': rng.gamma(2.0, 1.2, size),
+        'potassium': np.clip(rng.normal(450, 200, size), 20, None),
+    }
+
+    recipes = Recipe.objects.bulk_create([
+        Recipe(
+            title=f"Benchmark recipe {i}", description="Synthetic", preparation_time=int(rng.integers(5, 90)),
+            preparation_guide="Synthetic", meal_type=meal_types[i],
+            **{field: round(float(values[i]), 1) for field, values in nutrients.items()}
+        )
+        for i in range(size)
+    ], batch_size=2000)
+
+    popularity = 1 / np.arange(1, ingredient_count + 1) ** 1.1
+    popularity /= popularity.sum()
+    links = []
+    for recipe, count in zip(recipes, np.minimum(rng.poisson(fan_out - 2, size) + 2, ingredient_count)):
+        for ingredient_id in rng.choice(ingredient_ids, count, replace=False, p=popularity):
+            links.append(RecipeIngredients(recipe_id=recipe.id, ingredient_id=ingredient_id, quantity=1.0, unit="g"))
+    RecipeIngredients.objects.bulk_create(links, batch_size=5000)
+
+    return ingredient_ids, len(links)
+
+
+def generate_users(count, rng, ingredient_ids, prefix):
+    """
+    Creates `count` users cycling through the diet types, with bounds
+    around typical daily targets and a few disliked ingredients each.
+    """
+    User = get_user_model()
+    users = User.objects.bulk_create([
+        User(email=f"{prefix}-{i}@benchmark.invalid", name="Benchmark", surname=str(i), password='!')
+        for i in range(count)
+    ])
+
+    preferences, disliked = [], []
+    for i, user in enumerate(users):
+        calories = rng.uniform(1600, 2600)
+        preferences.append(UserNutrientPreferences(
+            user=user, diet_type=DIET_TYPES[i % len(DIET_TYPES)],
+            min_calories=int(calories * 0.85), max_calories=int(calories * 1.15),
+            min_protein=int(rng.uniform(50, 90)), max_protein=int(rng.uniform(150, 220)),
+            min_fat=int(rng.uniform(30, 50)), max_fat=int(rng.uniform(90, 130)),
+            min_carbohydrates=int(rng.uniform(120, 180)), max_carbohydrates=int(rng.uniform(280, 380)),
+            min_fiber=int(rng.uniform(10, 20)), max_fiber=int(rng.uniform(50, 80)),
+            min_sugars=0, max_sugars=0, min_iron=0, max_iron=0, min_potassium=0, max_potassium=0,
+        ))
+        for ingredient_id in rng.choice(ingredient_ids[:200], int(rng.integers(0, 6)), replace=False):
+            disliked.append(DislikedIngredients(user=user, ingredient_id=ingredient_id))
+    UserNutrientPreferences.objects.bulk_create(preferences)
+    DislikedIngredients.objects.bulk_create(disliked)
+    return users
+
+
+class Stopwatch:
+    def __init__(self):
+        self.timings = {}
+
+    def __call__(self, stage, function, *args, **kwargs):
+        started = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.timings[stage] = time.perf_counter() - started
+        return result
+
+
+def benchmark_user(user, solver=None, engine=None, days=7):
+    """
+    Runs the planner stages for one user one at a time and times each:
+    candidate loading, pruning, model build and solve for a day and for the
+    joint week, persistence of the week, and finally the whole
+    plan_meals_for_week call end to end.
+    """
+    engine = engine or getattr(settings, 'MEAL_PLANNER_ENGINE', 'vectorized')
+    backend = get_solver_backend(solver)
+    watch = Stopwatch()
+
+    preferences = UserNutrientPreferences.objects.get(user=user)
+    optimize_field, objective = resolve_objective(preferences.diet_type)
+    disliked_ids = get_disliked_ingredient_ids(user)
+    prune, top_k = get_pruning_options()
+
+    df = watch('candidates', load_candidate_recipes, user, (), disliked_ids)
+    record = {'user': user.id, 'diet_type': preferences.diet_type, 'candidates': len(df)}
+
+    pruned = watch('prune', prune_candidates, df, preferences, optimize_field, objective, 1, top_k)[0] if prune else df
+    record['pruned_candidates'] = len(pruned)
+
+    deadline = get_planning_deadline()
+    if isinstance(backend, BranchAndBoundBackend):
+        # the backend cuts the frame and builds its arrays inside solve, so
+        # both are timed as the solve stage
+        arrays = build_model_arrays(pruned, preferences, optimize_field)
+        record['variables'] = min(len(pruned), backend.max_candidates)
+        record['constraints'] = 2 * len(arrays['lower']) + len(arrays['groups']) + 1
+        record['status'] = watch('solve', backend.solve, pruned, preferences, optimize_field, objective, deadline)[1]
+    else:
+        model, _ = watch('build', MODEL_BUILDERS[engine], pruned, preferences, optimize_field, objective)
+        record['variables'], record['constraints'] = len(model.variables()), len(model.constraints)
+        record['status'] = watch('solve', run_cbc, model, deadline)
+
+    if backend.supports_weekly:
+        week_candidates = prune_candidates(df, preferences, optimize_field, objective, days, top_k)[0] if prune else df
+        model, _ = watch('week_build', build_weekly_model, week_candidates, preferences, optimize_field, objective, days)
+        record['week_variables'], record['week_constraints'] = len(model.variables()), len(model.constraints)
+        record['week_status'] = watch(
+            'week_solve', run_cbc, model, get_planning_deadline(),
+            gapRel=getattr(settings, 'MEAL_PLANNER_WEEKLY_GAP', 0.005)
+        )
+
+    today = datetime.today().date()
+    dates = [today + timedelta(days=i) for i in range(days)]
+    selections, record['week_solved_by'] = solve_week(
+        user, preferences, optimize_field, objective, days, (), disliked_ids, engine, solver=backend.name
+    )
+    watch('persist', lambda: save_week_plans(user, load_week_plans(user, dates), dict(zip(dates, selections)), today))
+
+    plan_cache.clear()
+    record['plan_solved_by'] = watch(
+        'plan_week', plan_meals_for_week, user, start_date=today + timedelta(days=days), solver=backend.name,
+        engine=engine
+    )
+
+    record['seconds'] = watch.timings
+    return record
+
+
+def summarize(records):
+    """
+    Count, mean, median, p95 and max seconds of every stage.
+    """
+    stages = {}
+    for record in records:
+        for stage, seconds in record['seconds'].items():
+            stages.setdefault(stage, []).append(seconds)
+
+    return {
+        stage: {
+            'runs': len(values),
+            'mean': float(np.mean(values)),
+            'p50': float(np.percentile(values, 50)),
+            'p95': float(np.percentile(values, 95)),
+            'max': float(np.max(values)),
+        }
+        for stage, values in stages.items()
+    }
+
+
+def run_benchmark(size, users=5, seed=0, ingredient_count=1000, fan_out=8, solver=None, engine=None):
+    """
+    Generates one catalog of `size` recipes and `users` users from `seed`,
+    then benchmarks every user. The catalog is activated for the planner
+    directly, so the shared process-wide catalog is not touched.
+    """
+    rng = np.random.default_rng(seed)
+    generate_started = time.perf_counter()
+    ingredient_ids, link_count = generate_catalog(size, rng, ingredient_count, fan_out)
+    benchmark_users = generate_users(users, rng, ingredient_ids, prefix=f"{size}-{seed}")
+    generate_seconds = time.perf_counter() - generate_started
+
+    # bulk_create sends no signals
+    bump_catalog_version()
+    plan_cache.clear()
+
+    catalog_started = time.perf_counter()
+    catalog = RecipeCatalog.load()
+    catalog_seconds = time.perf_counter() - catalog_started
+
+    activate_catalog(catalog)
+    try:
+        records = [benchmark_user(user, solver, engine) for user in benchmark_users]
+    finally:
+        activate_catalog(None)
+
+    return {
+        'size': size,
+        'users': users,
+        'seed': seed,
+        'ingredients': ingredient_count,
+        'fan_out': fan_out,
+        'links': link_count,
+        'generate_seconds': generate_seconds,
+        'catalog_load_seconds': catalog_seconds,
+        'stages': summarize(records),
+        'records': records,
+    }
+
+
+def environment(solver=None, engine=None):
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pulp': pulp.__version__,
+        'database': settings.DATABASES['default']['ENGINE'],
+        'solver': get_solver_backend(solver).name,
+        'engine': engine or getattr(settings, 'MEAL_PLANNER_ENGINE', 'vectorized'),
+        'time_limit': getattr(settings, 'MEAL_PLANNER_TIME_LIMIT', 5),
+        'pruning': getattr(settings, 'MEAL_PLANNER_PRUNING', {}),
+    }
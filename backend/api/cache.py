@@ -0,0 +1,259 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import VersionStamp
+
+
+CATALOG_VERSION_KEY = 'recipe_catalog_version'
+
+# per-user data that read endpoints depend on, see get_user_version
+USER_SCOPES = ('plan', 'cart', 'weights', 'preferences')
+
+
+def get_stamps(keys):
+    """
+    Version stamps under `keys`, read with one query. They live in the
+    VersionStamp table rather than the Django cache, whose default backend
+    is private to each process, so a bump made by a worker or a management
+    command is seen by the web processes too. A missing key is seeded with
+    the current time so a lost counter can never come back with an old
+    value.
+    """
+    stamps = dict(VersionStamp.objects.filter(key__in=keys).values_list('key', 'value'))
+    missing = [key for key in keys if key not in stamps]
+    if missing:
+        seed = time.time_ns()
+        VersionStamp.objects.bulk_create(
+            [VersionStamp(key=key, value=seed) for key in missing], ignore_conflicts=True
+        )
+        stamps.update(VersionStamp.objects.filter(key__in=missing).values_list('key', 'value'))
+    return [stamps[key] for key in keys]
+
+
+def bump_stamp(key):
+    """
+    Moves the stamp under `key` on and returns the (previous, new) values.
+    The row is locked until the current transaction ends, so concurrent
+    bumps are applied one after the other and other connections see the
+    new value together with the writes it stands for. The new value is at
+    least the current time, so a bump that was rolled back is never handed
+    out again.
+    """
+    with transaction.atomic(savepoint=False):
+        stamp = VersionStamp.objects.select_for_update().filter(key=key).first()
+        if stamp is None:
+            value = get_stamps([key])[0]
+            return None, value
+        value = max(stamp.value + 1, time.time_ns())
+        VersionStamp.objects.filter(pk=stamp.pk).update(value=value)
+        return stamp.value, value
+
+
+def get_catalog_version():
+    """
+    Version stamp of the recipe catalog, bumped by every recipe write.
+    """
+    return get_stamps([CATALOG_VERSION_KEY])[0]
+
+
+def bump_catalog_version():
+    """
+    Moves the catalog version on, see bump_stamp.
+    """
+    return bump_stamp(CATALOG_VERSION_KEY)
+
+
+def user_version_key(user_id, scope):
+    return f'user_version:{scope}:{user_id}'
+
+
+def bump_user_version(user_id, scope):
+    """
+    Marks the user's `scope` data (one of USER_SCOPES) as changed once the
+    current transaction commits. Bumping any earlier would let a reader
+    stamp the old rows with the new version.
+    """
+    transaction.on_commit(lambda: bump_stamp(user_version_key(user_id, scope)))
+
+
+def make_etag(request, user_scopes=(), catalog=False, dated=False):
+    """
+    Strong entity tag of a GET response built from version stamps instead
+    of the body: the full path, the stamps of the user's `user_scopes`, the
+    catalog version when the response shows recipe or ingredient data, and today's date when the response depends on it.
+    The stamps are read with one query.
+    """
+    keys = [user_version_key(request.user.id, scope) for scope in user_scopes]
+    if catalog:
+        keys.append(CATALOG_VERSION_KEY)
+    parts = [request.get_full_path(), get_stamps(keys)]
+    if dated:
+        parts.append(str(date.today()))
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:32]
+
+
+class PlanCache:
+    """
+    In-process LRU cache of planner results with a per-entry TTL.
+
+    Keys are fingerprints of everything the solve depends on (see make_key),
+    so identical preference profiles share one entry.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(kind, preferences, optimize_field, objective, disliked_ids, excluded_ids, **extra):
+        from .solvers import NUTRIENT_BOUNDS
+
+        fingerprint = {
+            'kind': kind,
+            'catalog_version': get_catalog_version(),
+            'diet_type': preferences.diet_type,
+            'bounds': [
+                (getattr(preferences, min_attr), getattr(preferences, max_attr))
+                for field, min_attr, max_attr, label in NUTRIENT_BOUNDS
+            ],
+            'optimize_field': optimize_field,
+            'objective': objective,
+            'disliked': sorted(set(int(i) for i in disliked_ids)),
+            'excluded': sorted(set(int(i) for i in excluded_ids)),
+            'extra': extra,
+        }
+        payload = json.dumps(fingerprint, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+_plan_cache_settings = getattr(settings, 'MEAL_PLAN_CACHE', {})
+
+plan_cache = PlanCache(
+    max_entries=_plan_cache_settings.get('MAX_ENTRIES', 1024),
+    ttl=_plan_cache_settings.get('TTL', 3600),
+)
+
+
+
+class RecipeResponseCache:
+    """
+    Rendered JSON bytes of recipe responses (one recipe, one listing page)
+    in the Django cache, so a repeated read costs a cache lookup instead of
+    queries and serialization.
+
+    Keys carry the catalog version, which other connections only see move
+    once the write behind it commits, so a response rendered from the old
+    rows in the meantime is stored under the old version. Entries of old
+    versions are never read again and expire with `timeout`.
+    """
+
+    def __init__(self, timeout=3600):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, *parts):
+        digest = hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+        return f"recipe_response:{get_catalog_version()}:{digest}"
+
+    def get_or_render(self, parts, render):
+        """
+        The cached bytes for `parts`, or the bytes `render()` returns, which
+        are stored for the next request. Nothing is stored when render raises.
+        """
+        key = self.make_key(*parts)
+        content = cache.get(key) if self.timeout > 0 else None
+        with self._lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if content is None:
+            content = render()
+            if self.timeout > 0:
+                cache.set(key, content, timeout=self.timeout)
+        return content
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'timeout': self.timeout,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+recipe_responses = RecipeResponseCache(
+    timeout=getattr(settings, 'RECIPE_RESPONSE_CACHE', {}).get('TIMEOUT', 3600),
+)
@@ -0,0 +1,390 @@
+import re
+import threading
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+
+from .cache import get_catalog_version
+from .models import Recipe, RecipeIngredients
+from .timings import span
+
+
+NUTRIENT_FIELDS = ['total_calories', 'sugars', 'protein', 'fat', 'carbohydrates', 'fiber', 'iron', 'potassium']
+MEAL_TYPES = ['lunch', 'dinner', 'snack', 'breakfast']
+
+# a number with an optional decimal comma and an optional unit
+NUMBER = re.compile(r'^([-+]?(?:\d+(?:[.,]\d*)?|[.,]\d+))\s*([a-zA-Zµ]+)?$')
+
+
+def parse_nutrients(values):
+    """
+    Floats for nutrient values as read from Recipe, NaN where a value is missing.
+    """
+    return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+
+def parse_nutrient(text):
+    """
+    Float for a nutrient as written in recipe data ('2.5', '2,5', '120 kcal'),
+    None for a value that is empty or does not parse.
+    """
+    match = NUMBER.match(str(text).strip())
+    if match is None:
+        return None
+    return float(match.group(1).replace(',', '.'))
+
+
+def ingredient_bit_masks(columns):
+    """
+    Byte index and bit mask of every ingredient column in a packed row.
+    """
+    columns = np.asarray(columns, dtype=np.int64)
+    return columns >> 3, np.left_shift(1, columns & 7).astype(np.uint8)
+
+
+class RecipeCatalog:
+    """
+    In-memory copy of everything the planner reads from the recipe tables:
+    recipe ids (sorted), meal type codes, a contiguous float matrix of the
+    nutrient columns and a packed recipe x ingredient bit matrix (one bit
+    per ingredient, eight to a byte, `ingredient_columns` maps ingredient
+    ids to bit positions).
+
+    Missing nutrients are stored as NaN; such recipes are left out of
+    `candidates`, as in the database-backed planner. A catalog is never
+    changed in place: `with_changes` returns an updated copy, so readers
+    holding a catalog always see a consistent one.
+    """
+
+    def __init__(self, ids, meal_type_codes, meal_type_names, nutrients, ingredient_bits, ingredient_columns):
+        self.ids = ids
+        self.meal_type_codes = meal_type_codes
+        self.meal_type_names = meal_type_names
+        self.nutrients = nutrients
+        self.ingredient_bits = ingredient_bits
+        self.ingredient_columns = ingredient_columns
+        self.complete = ~np.isnan(nutrients).any(axis=1)
+
+    @classmethod
+    def load(cls):
+        with span('catalog_query') as attributes:
+            recipe_rows = list(Recipe.objects.order_by('id').values('id', *NUTRIENT_FIELDS, 'meal_type'))
+            links = list(RecipeIngredients.objects.values_list('recipe_id', 'ingredient_id'))
+            attributes.update(recipes=len(recipe_rows), links=len(links))
+
+        with span('catalog_build', recipes=len(recipe_rows)):
+            recipes = pd.DataFrame(recipe_rows, columns=['id', *NUTRIENT_FIELDS, 'meal_type'])
+
+            nutrients = recipes[NUTRIENT_FIELDS].to_numpy(dtype=float, na_value=np.nan)
+
+            meal_type_names = MEAL_TYPES + sorted(set(recipes['meal_type']) - set(MEAL_TYPES))
+            codes = pd.Categorical(recipes['meal_type'], categories=meal_type_names).codes
+
+            ids = recipes['id'].to_numpy(dtype=np.int64)
+            pairs = np.array(links, dtype=np.int64).reshape(-1, 2)
+            rows = np.searchsorted(ids, pairs[:, 0])
+            # rows of recipes created after the recipe query are left out
+            known = rows < len(ids)
+            known[known] = ids[rows[known]] == pairs[known, 0]
+            pairs, rows = pairs[known], rows[known]
+
+            ingredient_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+            bits = np.zeros((len(ids), (len(ingredient_ids) + 7) // 8), dtype=np.uint8)
+            byte, mask = ingredient_bit_masks(columns)
+            np.bitwise_or.at(bits, (rows, byte), mask)
+
+        return cls(
+            ids=ids,
+            meal_type_codes=codes.astype(np.int16),
+            meal_type_names=meal_type_names,
+            nutrients=np.ascontiguousarray(nutrients, dtype=float),
+            ingredient_bits=bits,
+            ingredient_columns=dict(zip(ingredient_ids.tolist(), range(len(ingredient_ids)))),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def meal_types(self):
+        return np.array(self.meal_type_names, dtype=object)[self.meal_type_codes]
+
+    def positions(self, recipe_ids):
+        """
+        Rows of `recipe_ids` in the catalog; ids that are not in it are skipped.
+        """
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        positions = np.searchsorted(self.ids, recipe_ids)
+        found = positions < len(self.ids)
+        found[found] = self.ids[positions[found]] == recipe_ids[found]
+        return positions[found]
+
+    def containing(self, ingredient_ids):
+        """
+        Mask of the recipes that contain any of `ingredient_ids`.
+        """
+        columns = [self.ingredient_columns[i] for i in ingredient_ids if i in self.ingredient_columns]
+        if not columns:
+            return np.zeros(len(self.ids), dtype=bool)
+
+        probe = np.zeros(self.ingredient_bits.shape[1], dtype=np.uint8)
+        byte, mask = ingredient_bit_masks(columns)
+        np.bitwise_or.at(probe, byte, mask)
+        used = np.flatnonzero(probe)
+        return (self.ingredient_bits[:, used] & probe[used]).any(axis=1)
+
+    def candidates(self, excluded_ids=(), disliked_ingredients=()):
+        """
+        Same frame as the one the planner used to build from the database,
+        without touching the database.
+        """
+        mask = self.complete & ~self.containing(disliked_ingredients)
+        excluded_ids = list(excluded_ids)
+        if excluded_ids:
+            mask[self.positions(excluded_ids)] = False
+
+        df = pd.DataFrame(self.nutrients[mask], columns=NUTRIENT_FIELDS)
+        df.insert(0, 'id', self.ids[mask])
+        df['meal_type'] = self.meal_types[mask]
+        return df
+
+    @cached_property
+    def normalized_nutrients(self):
+        """
+        Nutrient matrix scaled to zero mean and unit variance per nutrient
+        over the complete recipes, so no single nutrient (calories, say)
+        dominates distances. Built once per catalog.
+        """
+        complete = self.nutrients[self.complete]
+        if not len(complete):
+            return np.zeros_like(self.nutrients)
+        scale = complete.std(axis=0)
+        scale[scale == 0] = 1
+        return (self.nutrients - complete.mean(axis=0)) / scale
+
+    def nearest(self, recipe_id, count=5, excluded_ids=(), disliked_ingredients=()):
+        """
+        The `count` recipes with the same meal type closest to `recipe_id` in
+        normalized nutrient space, as (recipe id, distance) pairs, closest
+        first. Recipes with a disliked ingredient are left out. Returns None
+        when the recipe is not in the catalog.
+        """
+        positions = self.positions([recipe_id])
+        if not len(positions):
+            return None
+        position = positions[0]
+        if not self.complete[position]:
+            return []
+
+        mask = self.complete & (self.meal_type_codes == self.meal_type_codes[position])
+        mask &= ~self.containing(disliked_ingredients)
+        mask[self.positions([recipe_id, *excluded_ids])] = False
+        candidates = np.flatnonzero(mask)
+
+        distances = np.sqrt(((self.normalized_nutrients[candidates] - self.normalized_nutrients[position]) ** 2).sum(axis=1))
+        count = min(count, len(candidates))
+        closest = np.argpartition(distances, count - 1)[:count] if count else np.array([], dtype=int)
+        closest = closest[np.lexsort((self.ids[candidates[closest]], distances[closest]))]
+        return [(int(self.ids[candidates[i]]), float(distances[i])) for i in closest]
+
+    def nutrient_totals(self, recipe_ids):
+        """
+        Sum of every nutrient over `recipe_ids` (repeats count every time).
+        Values that do not parse count as 0.
+        """
+        totals = np.nansum(self.nutrients[self.positions(recipe_ids)], axis=0)
+        return dict(zip(NUTRIENT_FIELDS, totals.tolist()))
+
+    def with_changes(self, changes):
+        """
+        Copy with `changes` applied in order. A change is one of
+
+        ('recipe', recipe_id, meal_type, nutrients)    insert or update a recipe
+        ('delete', recipe_id)                          remove a recipe
+        ('add_ingredient', recipe_id, ingredient_id)
+        ('remove_ingredient', recipe_id, ingredient_id)
+        ('set_ingredients', recipe_id, ingredient_ids)
+        ('ingredient', ingredient_id)                  an ingredient was renamed, nothing to apply
+
+        The arrays are copied once for the whole batch, not once per change.
+        """
+        recipes = {}
+        for change in changes:
+            if change[0] == 'recipe':
+                recipes[change[1]] = change[2:]
+            elif change[0] == 'delete':
+                recipes[change[1]] = None
+
+        touched = np.array(list(recipes), dtype=np.int64)
+        keep = ~np.isin(self.ids, touched)
+        upserts = [(recipe_id, row) for recipe_id, row in recipes.items() if row is not None]
+
+        meal_type_names = self.meal_type_names + sorted(
+            {meal_type for _, (meal_type, _) in upserts} - set(self.meal_type_names)
+        )
+        new_ids = np.array([recipe_id for recipe_id, _ in upserts], dtype=np.int64)
+        new_bits = np.zeros((len(upserts), self.ingredient_bits.shape[1]), dtype=np.uint8)
+        previous = np.searchsorted(self.ids, new_ids)
+        for row, position in enumerate(previous):
+            if position < len(self.ids) and self.ids[position] == new_ids[row]:
+                new_bits[row] = self.ingredient_bits[position]
+
+        ids = np.concatenate([self.ids[keep], new_ids])
+        order = np.argsort(ids, kind='stable')
+        ids = ids[order]
+        codes = np.concatenate([
+            self.meal_type_codes[keep],
+            np.array([meal_type_names.index(meal_type) for _, (meal_type, _) in upserts], dtype=np.int16),
+        ])[order]
+        nutrients = np.concatenate([
+            self.nutrients[keep],
+            np.array([nutrients for _, (_, nutrients) in upserts], dtype=float).reshape(-1, len(NUTRIENT_FIELDS)),
+        ])[order]
+        bits = np.concatenate([self.ingredient_bits[keep], new_bits])[order]
+
+        ingredient_columns = dict(self.ingredient_columns)
+        for change in changes:
+            if change[0] not in ('add_ingredient', 'remove_ingredient', 'set_ingredients'):
+                continue
+            recipe_id = change[1]
+            position = np.searchsorted(ids, recipe_id)
+            if position == len(ids) or ids[position] != recipe_id:
+                continue
+
+            if change[0] == 'add_ingredient':
+                added = [change[2]]
+            elif change[0] == 'set_ingredients':
+                bits[position] = 0
+                added = list(change[2])
+            else:
+                added = []
+            for ingredient_id in added:
+                ingredient_columns.setdefault(ingredient_id, len(ingredient_columns))
+            width = (len(ingredient_columns) + 7) // 8
+            if width > bits.shape[1]:
+                bits = np.pad(bits, ((0, 0), (0, width - bits.shape[1])))
+
+            if change[0] == 'remove_ingredient':
+                if change[2] in ingredient_columns:
+                    byte, mask = ingredient_bit_masks([ingredient_columns[change[2]]])
+                    bits[position, byte] &= ~mask
+            else:
+                byte, mask = ingredient_bit_masks([ingredient_columns[i] for i in added])
+                np.bitwise_or.at(bits[position], byte, mask)
+
+        return RecipeCatalog(
+            ids, codes, meal_type_names, np.ascontiguousarray(nutrients), bits, ingredient_columns
+        )
+
+
+class SharedRecipeCatalog:
+    """
+    The process-wide catalog. Built lazily on first use, kept current by the
+    recipe signals (see api/signals.py) one change at a time, and rebuilt
+    from the database when the catalog version moved on without it, e.g.
+    after a write in another process or a rolled back transaction.
+
+    A thread with uncommitted recipe writes gets a private catalog read
+    from its own transaction, so it sees its writes and nobody else does.
+    """
+
+    # past this many queued changes the catalog is dropped and rebuilt instead
+    max_queued_changes = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._catalog = None
+        self._version = None
+        self._queue = []
+        self._generation = 0
+        self.builds = 0
+        self.updates = 0
+
+    def clear(self):
+        with self._lock:
+            self._catalog = None
+            self._version = None
+            self._queue = []
+            self._generation += 1
+
+    def get(self):
+        if getattr(self._local, 'pending', False):
+            if connection.in_atomic_block:
+                return RecipeCatalog.load()
+            self._local.pending = False
+
+        version = get_catalog_version()
+        with self._lock:
+            if self._queue:
+                self._apply_queue()
+            if self._catalog is not None and self._version == version:
+                return self._catalog
+            generation = self._generation
+
+        catalog = RecipeCatalog.load()
+        with self._lock:
+            self.builds += 1
+            # a change committed while loading may be missing from `catalog`
+            if generation == self._generation:
+                self._catalog, self._version = catalog, version
+        return catalog
+
+    def stage(self, change, versions):
+        """
+        Queues `change` (see RecipeCatalog.with_changes) once the current
+        transaction commits. `versions` is called then and returns the
+        catalog versions before and after the transaction's changes, as
+        bump_catalog_version does.
+        """
+        if connection.in_atomic_block:
+            self._local.pending = True
+        transaction.on_commit(lambda: self._enqueue(change, versions()))
+
+    def _enqueue(self, change, versions):
+        with self._lock:
+            self._generation += 1
+            if self._catalog is None:
+                return
+            if len(self._queue) >= self.max_queued_changes:
+                self._catalog, self._version, self._queue = None, None, []
+                return
+            self._queue.append((change, versions))
+
+    def _apply_queue(self):
+        self._catalog = self._catalog.with_changes([change for change, _ in self._queue])
+        self.updates += len(self._queue)
+        for _, (previous, version) in self._queue:
+            # Only move forward when this is the next change after the one the
+            # catalog is stamped with. Otherwise some change was not seen here,
+            # so the version stays behind and the next get() rebuilds.
+            if self._version is not None and previous == self._version:
+                self._version = version
+        self._queue = []
+
+
+recipe_catalog = SharedRecipeCatalog()
+
+
+_active_catalog = None
+
+
+def activate_catalog(catalog):
+    """
+    Makes the planner in this process read candidates from `catalog` instead
+    of the shared catalog. Pass None to go back to the shared one.
+    """
+    global _active_catalog
+    _active_catalog = catalog
+
+
+def get_active_catalog():
+    return _active_catalog
+
+
+def get_recipe_catalog():
+    if _active_catalog is not None:
+        return _active_catalog
+    return recipe_catalog.get()
@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.benchmark import environment, run_benchmark
+from api.cache import bump_catalog_version, plan_cache
+from api.catalog import recipe_catalog
+
+
+class Command(BaseCommand):
+    help = ("Times the meal planner stages on seeded synthetic catalogs. "
+            "Nothing is kept: every catalog is generated in a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                            help="Catalog sizes in recipes, e.g. 1000 10000 100000.")
+        parser.add_argument('--users', type=int, default=5, help="Users planned per catalog.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--ingredients', type=int, default=1000, help="Size of the ingredient pool.")
+        parser.add_argument('--fan-out', type=float, default=8, help="Mean number of ingredients per recipe.")
+        parser.add_argument('--solver', help="Solver backend (defaults to the setting).")
+        parser.add_argument('--engine', help="Model builder (defaults to the setting).")
+        parser.add_argument('--output', help="Write the JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        results = {'environment': environment(options['solver'], options['engine']), 'catalogs': []}
+
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    results['catalogs'].append(run_benchmark(
+                        size, users=options['users'], seed=options['seed'],
+                        ingredient_count=options['ingredients'], fan_out=options['fan_out'],
+                        solver=options['solver'], engine=options['engine'],
+                    ))
+                    transaction.set_rollback(True)
+            finally:
+                # the rolled back recipes may have reached the caches
+                recipe_catalog.clear()
+                plan_cache.clear()
+                bump_catalog_version()
+
+            catalog = results['catalogs'][-1]
+            self.stderr.write(f"{size} recipes: " + ", ".join(
+                f"{stage} p50 {stats['p50'] * 1000:.1f}ms" for stage, stats in catalog['stages'].items()
+            ))
+
+        output = json.dumps(results, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+            self.stderr.write(self.style.SUCCESS(f"Results written to {options['output']}."))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from api.utils import evaluate_pruning
+
+
+class Command(BaseCommand):
+    help = "Compares planner solutions with and without candidate pruning."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-ids', type=int, nargs='+', help="Only evaluate these users.")
+        parser.add_argument('--limit', type=int, default=20, help="Evaluate at most this many users.")
+        parser.add_argument('--top-k', type=int, help="Top-K per meal type to evaluate (defaults to the setting).")
+        parser.add_argument('--days', type=int, default=1, help="Evaluate a joint plan of this many days.")
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.filter(is_active=True).order_by('id')
+        if options['user_ids']:
+            users = users.filter(id__in=options['user_ids'])
+
+        reports = [
+            evaluate_pruning(user, top_k=options['top_k'], days=options['days'])
+            for user in users[:options['limit']]
+        ]
+        reports = [report for report in reports if 'full_seconds' in report]
+
+        for report in reports:
+            self.stdout.write(
+                f"user {report['user']}: {report['candidates']} -> {report['pruned_candidates']} candidates, "
+                f"objective {report['full_objective']} -> {report['pruned_objective']}, "
+                f"{report['full_seconds']:.3f}s -> {report['pruned_seconds']:.3f}s"
+            )
+
+        if not reports:
+            self.stdout.write("No users with candidate recipes.")
+            return
+
+        losses = [
+            abs(report['full_objective'] - report['pruned_objective']) / abs(report['full_objective'])
+            for report in reports if report['full_objective']
+        ]
+        full_time = sum(report['full_seconds'] for report in reports)
+        pruned_time = sum(report['pruned_seconds'] for report in reports)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(reports)} user(s): mean objective change {100 * sum(losses) / max(len(losses), 1):.2f}%, "
+            f"max {100 * max(losses, default=0):.2f}%, solve time {full_time:.2f}s -> {pruned_time:.2f}s."
+        ))
@@ -0,0 +1,148 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+def init_worker():
+    """
+    Runs once in every worker process: fresh database connections and a
+    single load of the recipe catalog shared by all users the worker plans.
+    """
+    if not django.apps.apps.ready:
+        django.setup()
+    connections.close_all()
+
+    from api.catalog import RecipeCatalog, activate_catalog
+    activate_catalog(RecipeCatalog.load())
+
+
+def plan_user(user_id, start_date):
+    from django.contrib.auth import get_user_model
+    from api.utils import plan_meals_for_week
+
+    try:
+        user = get_user_model().objects.get(id=user_id)
+        plan_meals_for_week(user, start_date=start_date)
+        return user_id, None
+    except Exception as e:
+        return user_id, str(e)
+
+
+class Command(BaseCommand):
+    help = "Plans the coming week for every active user (or the given ones) across a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Number of worker processes. 1 plans in the current process."
+        )
+        parser.add_argument(
+            '--user-ids', type=int, nargs='+',
+            help="Only plan for these users."
+        )
+        parser.add_argument(
+            '--include-inactive', action='store_true',
+            help="Also plan for users with is_active=False."
+        )
+        parser.add_argument(
+            '--start-date',
+            help="First day of the planned week (YYYY-MM-DD). Defaults to today."
+        )
+        parser.add_argument(
+            '--checkpoint', default='plan_all_users.checkpoint.json',
+            help="File that records finished users so an interrupted run can resume."
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help="Skip users recorded as finished in the checkpoint file."
+        )
+        parser.add_argument(
+            '--checkpoint-every', type=int, default=50,
+            help="Write the checkpoint after this many finished users."
+        )
+
+    def handle(self, *args, **options):
+        from django.contrib.auth import get_user_model
+        from api.catalog import RecipeCatalog, activate_catalog
+
+        try:
+            start_date = (
+                datetime.strptime(options['start_date'], '%Y-%m-%d').date()
+                if options['start_date'] else None
+            )
+        except ValueError:
+            raise CommandError("Invalid --start-date. Use YYYY-MM-DD.")
+
+        users = get_user_model().objects.order_by('id')
+        if not options['include_inactive']:
+            users = users.filter(is_active=True)
+        if options['user_ids']:
+            users = users.filter(id__in=options['user_ids'])
+        user_ids = list(users.values_list('id', flat=True))
+
+        checkpoint_path = options['checkpoint']
+        checkpoint = {'done': [], 'failed': {}}
+        if options['resume'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, encoding='utf-8') as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+
+        done = set(checkpoint['done'])
+        pending = [user_id for user_id in user_ids if user_id not in done]
+        self.stdout.write(f"Planning {len(pending)} user(s), {len(done)} already done.")
+
+        started = time.perf_counter()
+        finished = 0
+
+        def record(user_id, error):
+            nonlocal finished
+            finished += 1
+            if error:
+                checkpoint['failed'][str(user_id)] = error
+                self.stdout.write(self.style.ERROR(f"User {user_id} failed: {error}"))
+            else:
+                checkpoint['done'].append(user_id)
+                checkpoint['failed'].pop(str(user_id), None)
+            if finished % options['checkpoint_every'] == 0:
+                self.write_checkpoint(checkpoint_path, checkpoint)
+
+        try:
+            if options['workers'] <= 1:
+                activate_catalog(RecipeCatalog.load())
+                try:
+                    for user_id in pending:
+                        record(*plan_user(user_id, start_date))
+                finally:
+                    activate_catalog(None)
+            else:
+                connections.close_all()
+                with ProcessPoolExecutor(
+                    max_workers=options['workers'],
+                    mp_context=multiprocessing.get_context('fork'),
+                    initializer=init_worker,
+                ) as pool:
+                    futures = [pool.submit(plan_user, user_id, start_date) for user_id in pending]
+                    for future in as_completed(futures):
+                        record(*future.result())
+        finally:
+            self.write_checkpoint(checkpoint_path, checkpoint)
+
+        elapsed = time.perf_counter() - started
+        throughput = finished / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Planned {finished} user(s) in {elapsed:.2f}s "
+            f"({throughput:.2f} users/s, {len(checkpoint['failed'])} failed)."
+        ))
+
+    @staticmethod
+    def write_checkpoint(path, checkpoint):
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        os.replace(temporary_path, path)
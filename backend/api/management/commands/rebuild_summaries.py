@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.summaries import check_summaries, rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = ("Checks the daily and weekly nutrition rollups against a full recompute "
+            "and rebuilds the users whose rollups drifted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-ids', type=int, nargs='+', help="Only check these users.")
+        parser.add_argument('--check', action='store_true', help="Report differences without repairing them.")
+        parser.add_argument('--all', action='store_true', help="Rebuild every checked user, drifted or not.")
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        differences = check_summaries(user_ids)
+
+        for model_name, user_id, key, field, stored, expected in differences:
+            self.stdout.write(f"{model_name} user {user_id} {key} {field}: stored {stored}, expected {expected}")
+
+        if options['check']:
+            if differences:
+                raise CommandError(f"{len(differences)} rollup value(s) differ from a full recompute.")
+            self.stdout.write(self.style.SUCCESS("Rollups match a full recompute."))
+            return
+
+        if not options['all']:
+            user_ids = sorted({user_id for _, user_id, *_ in differences})
+            if not user_ids:
+                self.stdout.write(self.style.SUCCESS("Rollups match a full recompute, nothing to rebuild."))
+                return
+
+        daily, weekly = rebuild_summaries(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {daily} daily and {weekly} weekly rollup(s)"
+            + (f" for {len(user_ids)} user(s)." if user_ids is not None else ".")
+        ))
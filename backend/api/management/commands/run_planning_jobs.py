@@ -0,0 +1,57 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api.utils import claim_planning_job, run_planning_job, requeue_stale_planning_jobs
+
+
+class Command(BaseCommand):
+    help = "Drains the queue of background meal planning jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit as soon as the queue is empty instead of polling for new jobs."
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=2.0,
+            help="Seconds to wait between polls of an empty queue."
+        )
+        parser.add_argument(
+            '--max-jobs', type=int, default=0,
+            help="Exit after this many jobs (0 means no limit)."
+        )
+        parser.add_argument(
+            '--stale-after', type=int, default=600,
+            help="Requeue jobs that have been running for longer than this many seconds."
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        stale_after = timedelta(seconds=options['stale_after'])
+
+        while True:
+            requeued = requeue_stale_planning_jobs(stale_after)
+            if requeued:
+                self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale job(s)."))
+
+            job = claim_planning_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            job = run_planning_job(job)
+            processed += 1
+
+            if job.status == job.STATUS_DONE:
+                self.stdout.write(f"Job {job.id} for {job.user} done.")
+            else:
+                self.stdout.write(self.style.ERROR(f"Job {job.id} for {job.user} failed: {job.error}"))
+
+            if options['max_jobs'] and processed >= options['max_jobs']:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} planning job(s)."))
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 02:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_planningjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userrecipeusage',
+            index=models.Index(fields=['user', 'last_used'], name='api_userrec_user_id_6d7bbb_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_userrecipeusage_user_last_used'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='total_calories_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='carbohydrates_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='fat_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='fiber_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='sugars_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='protein_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='iron_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='potassium_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
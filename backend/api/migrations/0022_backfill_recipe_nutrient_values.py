@@ -0,0 +1,64 @@
+import re
+
+from django.db import migrations
+
+
+NUTRIENT_FIELDS = ['total_calories', 'carbohydrates', 'fat', 'fiber', 'sugars', 'protein', 'iron', 'potassium']
+
+# a number with an optional decimal comma and an optional unit: '2.5', '2,5', '120 kcal'
+NUMBER = re.compile(r'^([-+]?(?:\d+(?:[.,]\d*)?|[.,]\d+))\s*([a-zA-Zµ]+)?$')
+
+
+def parse(text):
+    match = NUMBER.match(text.strip())
+    if match is None:
+        return None
+    return float(match.group(1).replace(',', '.'))
+
+
+def backfill_nutrient_values(apps, schema_editor):
+    """
+    Parses the nutrient strings into the new float columns. Values that do
+    not parse are left NULL and listed, so they can be fixed by hand.
+    """
+    Recipe = apps.get_model('api', 'Recipe')
+
+    unparseable = []
+    recipes = list(Recipe.objects.only('id', *NUTRIENT_FIELDS).order_by('id'))
+    for recipe in recipes:
+        for field in NUTRIENT_FIELDS:
+            text = getattr(recipe, field)
+            value = parse(text) if text else None
+            if value is None and text and text.strip():
+                unparseable.append((recipe.id, field, text))
+            setattr(recipe, f'{field}_value', value)
+
+    Recipe.objects.bulk_update(recipes, [f'{field}_value' for field in NUTRIENT_FIELDS], batch_size=1000)
+
+    if unparseable:
+        print(f"\n  {len(unparseable)} recipe nutrient value(s) could not be parsed and were left empty:")
+        for recipe_id, field, text in unparseable:
+            print(f"    recipe {recipe_id} {field}: {text!r}")
+
+
+def restore_nutrient_strings(apps, schema_editor):
+    Recipe = apps.get_model('api', 'Recipe')
+
+    recipes = list(Recipe.objects.only('id', *[f'{field}_value' for field in NUTRIENT_FIELDS]))
+    for recipe in recipes:
+        for field in NUTRIENT_FIELDS:
+            value = getattr(recipe, f'{field}_value')
+            setattr(recipe, field, '' if value is None else str(int(value)) if value.is_integer() else str(value))
+
+    Recipe.objects.bulk_update(recipes, NUTRIENT_FIELDS, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_recipe_nutrient_values'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_nutrient_values, restore_nutrient_strings),
+    ]
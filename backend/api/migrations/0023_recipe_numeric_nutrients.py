@@ -0,0 +1,85 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:14
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_backfill_recipe_nutrient_values'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='recipe',
+            name='total_calories',
+        ),
+        migrations.RenameField(
+            model_name='recipe',
+            old_name='total_calories_value',
+            new_name='total_calories',
+        ),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='carbohydrates',
+        ),
+        migrations.RenameField(
+            model_name='recipe',
+            old_name='carbohydrates_value',
+            new_name='carbohydrates',
+        ),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='fat',
+        ),
+        migrations.RenameField(
+            model_name='recipe',
+            old_name='fat_value',
+            new_name='fat',
+        ),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='fiber',
+        ),
+        migrations.RenameField(
+            model_name='recipe',
+            old_name='fiber_value',
+            new_name='fiber',
+        ),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='sugars',
+        ),
+        migrations.RenameField(
+            model_name='recipe',
+            old_name='sugars_value',
+            new_name='sugars',
+        ),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='protein',
+        ),
+        migrations.RenameField(
+            model_name='recipe',
+            old_name='protein_value',
+            new_name='protein',
+        ),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='iron',
+        ),
+        migrations.RenameField(
+            model_name='recipe',
+            old_name='iron_value',
+            new_name='iron',
+        ),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='potassium',
+        ),
+        migrations.RenameField(
+            model_name='recipe',
+            old_name='potassium_value',
+            new_name='potassium',
+        ),
+    ]
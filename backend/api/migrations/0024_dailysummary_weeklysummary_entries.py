@@ -0,0 +1,40 @@
+# Generated by Django 5.1.1 on 2026-10-18 03:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_recipe_numeric_nutrients'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weeklysummary',
+            name='entries',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='DailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('entries', models.PositiveIntegerField(default=0)),
+                ('total_calories', models.FloatField(default=0.0)),
+                ('total_carbohydrates', models.FloatField(default=0.0)),
+                ('total_fat', models.FloatField(default=0.0)),
+                ('total_protein', models.FloatField(default=0.0)),
+                ('total_fiber', models.FloatField(default=0.0)),
+                ('total_sugars', models.FloatField(default=0.0)),
+                ('total_iron', models.FloatField(default=0.0)),
+                ('total_potassium', models.FloatField(default=0.0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'date')},
+            },
+        ),
+    ]
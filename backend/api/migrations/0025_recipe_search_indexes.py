@@ -0,0 +1,53 @@
+# Generated by Django 5.1.1 on 2026-10-18 03:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_dailysummary_weeklysummary_entries'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['meal_type', 'id'], name='api_recipe_meal_ty_9f4d73_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['total_calories'], name='api_recipe_total_c_39ca29_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['carbohydrates'], name='api_recipe_carbohy_2e8ce9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['fat'], name='api_recipe_fat_348193_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['fiber'], name='api_recipe_fiber_e7aaa7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['sugars'], name='api_recipe_sugars_3d2867_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['protein'], name='api_recipe_protein_05f683_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['iron'], name='api_recipe_iron_4c0fa8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['potassium'], name='api_recipe_potassi_6e8b79_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['preparation_time'], name='api_recipe_prepara_e06128_idx'),
+        ),
+    ]
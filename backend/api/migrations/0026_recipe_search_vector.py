@@ -0,0 +1,45 @@
+from django.db import migrations
+
+
+# The column and its GIN index only exist on PostgreSQL and are not part
+# of the Recipe model, see api/search.py.
+CONFIG = 'english'
+
+UPDATE_SEARCH_VECTORS = """
+    UPDATE api_recipe AS recipe SET search_vector =
+        setweight(to_tsvector(%(config)s, coalesce(recipe.title, '')), 'A') ||
+        setweight(to_tsvector(%(config)s, coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM api_recipeingredients AS link
+            JOIN api_ingredient AS ingredient ON ingredient.id = link.ingredient_id
+            WHERE link.recipe_id = recipe.id
+        ), '')), 'B') ||
+        setweight(to_tsvector(%(config)s, coalesce(recipe.description, '')), 'C') ||
+        setweight(to_tsvector(%(config)s, coalesce(recipe.preparation_guide, '')), 'D')
+"""
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("ALTER TABLE api_recipe ADD COLUMN search_vector tsvector")
+    schema_editor.execute(UPDATE_SEARCH_VECTORS, {'config': CONFIG})
+    schema_editor.execute("CREATE INDEX api_recipe_search_vector_idx ON api_recipe USING GIN (search_vector)")
+
+
+def remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS api_recipe_search_vector_idx")
+    schema_editor.execute("ALTER TABLE api_recipe DROP COLUMN IF EXISTS search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_recipe_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, remove_search_vector),
+    ]
@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from django.db import migrations
+from django.db.models import Count, F, Sum
+
+
+# rollup field -> Recipe field
+RECIPE_FIELDS = {
+    'total_calories': 'total_calories',
+    'total_carbohydrates': 'carbohydrates',
+    'total_fat': 'fat',
+    'total_protein': 'protein',
+    'total_fiber': 'fiber',
+    'total_sugars': 'sugars',
+    'total_iron': 'iron',
+    'total_potassium': 'potassium',
+}
+
+# rollup field -> DayPlanItem field, multiplied by the item quantity
+ITEM_FIELDS = {
+    'total_calories': 'total_calories',
+    'total_carbohydrates': 'total_carbs',
+    'total_fat': 'total_fats',
+    'total_protein': 'total_protein',
+    'total_fiber': 'total_fiber',
+    'total_sugars': 'total_sugars',
+    'total_iron': 'total_iron',
+    'total_potassium': 'total_potassium',
+}
+
+
+def round_total(value):
+    # as summaries.round_total
+    return round(value, 6) + 0.0
+
+
+def add(rollups, key, entries, totals):
+    rollup = rollups.setdefault(key, [0, dict.fromkeys(RECIPE_FIELDS, 0.0)])
+    rollup[0] += entries
+    for field, value in totals.items():
+        rollup[1][field] += value
+
+
+def backfill_summaries(apps, schema_editor):
+    """
+    Fills DailySummary and WeeklySummary from the planned recipes and day
+    plan items that existed before the rollups were kept current, the same
+    recompute as summaries.rebuild_summaries.
+    """
+    DayPlanRecipes = apps.get_model('api', 'DayPlanRecipes')
+    DayPlanItem = apps.get_model('api', 'DayPlanItem')
+    DailySummary = apps.get_model('api', 'DailySummary')
+    WeeklySummary = apps.get_model('api', 'WeeklySummary')
+
+    recipe_rows = DayPlanRecipes.objects.values(user_id=F('day_plan__user_id'), date=F('day_plan__date')).annotate(
+        entries=Count('id'),
+        **{f'sum_{field}': Sum(f'recipe__{recipe_field}') for field, recipe_field in RECIPE_FIELDS.items()}
+    )
+    item_rows = DayPlanItem.objects.values('user_id', 'date').annotate(
+        entries=Count('id'),
+        **{f'sum_{field}': Sum(F(item_field) * F('quantity')) for field, item_field in ITEM_FIELDS.items()}
+    )
+
+    daily, weekly = {}, {}
+    for row in [*recipe_rows, *item_rows]:
+        totals = {field: row[f'sum_{field}'] or 0.0 for field in RECIPE_FIELDS}
+        add(daily, (row['user_id'], row['date']), row['entries'], totals)
+    for (user_id, date), (entries, totals) in daily.items():
+        add(weekly, (user_id, date - timedelta(days=date.weekday())), entries, totals)
+
+    DailySummary.objects.all().delete()
+    DailySummary.objects.bulk_create([
+        DailySummary(user_id=user_id, date=date, entries=entries,
+                     **{field: round_total(value) for field, value in totals.items()})
+        for (user_id, date), (entries, totals) in daily.items()
+    ], batch_size=1000)
+    WeeklySummary.objects.all().delete()
+    WeeklySummary.objects.bulk_create([
+        WeeklySummary(user_id=user_id, week_start=week_start, week_end=week_start + timedelta(days=6),
+                      entries=entries, **{field: round_total(value) for field, value in totals.items()})
+        for (user_id, week_start), (entries, totals) in weekly.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_versionstamp'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
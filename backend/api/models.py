@@ -13,19 +13,28 @@ class Ingredient(models.Model):
 class Recipe(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
-    total_calories = models.CharField(max_length=255) 
-    carbohydrates = models.CharField(max_length=255) 
-    fat = models.CharField(max_length=255) 
-    fiber = models.CharField(max_length=255) 
-    sugars = models.CharField(max_length=255)
-    protein = models.CharField(max_length=255)
-    iron = models.CharField(max_length=255)
-    potassium = models.CharField(max_length=255)
+    total_calories = models.FloatField(null=True, blank=True)
+    carbohydrates = models.FloatField(null=True, blank=True)
+    fat = models.FloatField(null=True, blank=True)
+    fiber = models.FloatField(null=True, blank=True)
+    sugars = models.FloatField(null=True, blank=True)
+    protein = models.FloatField(null=True, blank=True)
+    iron = models.FloatField(null=True, blank=True)
+    potassium = models.FloatField(null=True, blank=True)
     preparation_time = models.IntegerField()
     preparation_guide = models.TextField()
     meal_type = models.CharField(max_length=255)
     ingredients = models.ManyToManyField(Ingredient, through='RecipeIngredients')
 
+    class Meta:
+        # range filters of the recipe search, see utils.search_recipes
+        indexes = [
+            models.Index(fields=['meal_type', 'id']),
+            *[models.Index(fields=[field]) for field in [
+                'total_calories', 'carbohydrates', 'fat', 'fiber', 'sugars', 'protein', 'iron', 'potassium',
+                'preparation_time',
+            ]],
+        ]
     
     def __str__(self):
         return self.title
@@ -158,6 +167,34 @@ class UserRecipeUsage(models.Model):
     
     class Meta:
         unique_together = ('user', 'recipe') 
+        indexes = [models.Index(fields=['user', 'last_used'])]
+
+class PlanningJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    progress = models.PositiveSmallIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Planning job {self.pk} for {self.user} ({self.status})"
 
 # user_screen
 class UserWeight(models.Model):
@@ -170,6 +207,8 @@ class WeeklySummary(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     week_start = models.DateField()  
     week_end = models.DateField()  
+    # planned recipes and items counted in the totals
+    entries = models.PositiveIntegerField(default=0)
     total_calories = models.FloatField(default=0.0)
     total_carbohydrates = models.FloatField(default=0.0)
     total_fat = models.FloatField(default=0.0)
@@ -188,6 +227,27 @@ class WeeklySummary(models.Model):
 
     def __str__(self):
         return f"Weekly Summary ({self.week_start} - {self.week_end}) for {self.user}"
+
+
+class DailySummary(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    # planned recipes and items counted in the totals
+    entries = models.PositiveIntegerField(default=0)
+    total_calories = models.FloatField(default=0.0)
+    total_carbohydrates = models.FloatField(default=0.0)
+    total_fat = models.FloatField(default=0.0)
+    total_protein = models.FloatField(default=0.0)
+    total_fiber = models.FloatField(default=0.0)
+    total_sugars = models.FloatField(default=0.0)
+    total_iron = models.FloatField(default=0.0)
+    total_potassium = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = ('user', 'date')
+
+    def __str__(self):
+        return f"Daily Summary ({self.date}) for {self.user}"
     
 class DayPlanItem(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -205,5 +265,14 @@ class DayPlanItem(models.Model):
 
     def __str__(self):
         return f"{self.item_name} - {self.total_calories} kcal"
-    
-    
+
+
+# cache invalidation
+class VersionStamp(models.Model):
+    # counters behind the cache keys and entity tags of api/cache.py, kept
+    # in the database so every process reads the same value
+    key = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
@@ -0,0 +1,19 @@
+from rest_framework.pagination import CursorPagination
+
+
+class RecipeCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the recipe id: every page is `id > last id` with a
+    LIMIT, so a page costs the same however deep into the catalog it is and
+    pages stay stable while recipes are added. The cursor is opaque; `limit`
+    sets the page size.
+    """
+    ordering = ('id',)
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 500
+
+    @staticmethod
+    def requested(request):
+        # listings stay unpaginated unless the client asks for a page
+        return 'cursor' in request.query_params or 'limit' in request.query_params
@@ -0,0 +1,234 @@
+"""
+Ranked full-text search over recipe titles, ingredient names, descriptions
+and preparation guides, in that order of weight.
+
+On PostgreSQL every recipe row carries a precomputed `search_vector`
+tsvector column with a GIN index (migration 0026, outside the Django model
+so other databases never see it), refreshed by the signals in signals.py
+whenever a recipe, its ingredient links or an ingredient name changes: the
+recipes a transaction touches are collected and updated with one statement
+once it commits. A query is one index lookup ranked with ts_rank.
+
+Elsewhere (SQLite in development and tests) an in-process inverted index
+built from the same four fields answers the queries instead. It is rebuilt
+when the catalog version moves, like the shared recipe catalog.
+"""
+import math
+import re
+import threading
+from collections import Counter
+
+from django.db import connection, transaction
+
+from .cache import get_catalog_version
+from .models import Recipe, RecipeIngredients
+from .timings import span
+
+
+# text search configuration the vectors are built with, as in migration 0026
+SEARCH_CONFIG = 'english'
+
+# tsvector weight and in-process weight of every searched field
+FIELD_WEIGHTS = {
+    'title': ('A', 1.0),
+    'ingredients': ('B', 0.4),
+    'description': ('C', 0.2),
+    'preparation_guide': ('D', 0.1),
+}
+
+UPDATE_SEARCH_VECTORS = """
+    UPDATE api_recipe AS recipe SET search_vector =
+        setweight(to_tsvector(%(config)s, coalesce(recipe.title, '')), 'A') ||
+        setweight(to_tsvector(%(config)s, coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM api_recipeingredients AS link
+            JOIN api_ingredient AS ingredient ON ingredient.id = link.ingredient_id
+            WHERE link.recipe_id = recipe.id
+        ), '')), 'B') ||
+        setweight(to_tsvector(%(config)s, coalesce(recipe.description, '')), 'C') ||
+        setweight(to_tsvector(%(config)s, coalesce(recipe.preparation_guide, '')), 'D')
+    WHERE recipe.id = ANY(%(ids)s::bigint[])
+"""
+
+SEARCH = """
+    SELECT recipe.id, ts_rank(recipe.search_vector, query) AS rank
+    FROM api_recipe AS recipe, websearch_to_tsquery(%(config)s, %(query)s) AS query
+    WHERE recipe.search_vector @@ query
+      AND (%(meal_type)s::varchar IS NULL OR recipe.meal_type = %(meal_type)s)
+      AND NOT (recipe.id = ANY(%(excluded)s::bigint[]))
+    ORDER BY rank DESC, recipe.id
+    LIMIT %(limit)s
+"""
+
+STOP_WORDS = {'a', 'an', 'and', 'in', 'of', 'on', 'or', 'the', 'to', 'with', 'for'}
+
+WORD = re.compile(r'\w+')
+
+
+def uses_search_vector():
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(text):
+    """
+    Lowercased words of `text` without stop words and with a plural 's'
+    dropped, so 'Prawns' finds 'prawn'.
+    """
+    tokens = []
+    for word in WORD.findall(text.lower()):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def update_search_vectors(recipe_ids):
+    """
+    Recomputes the search vector of `recipe_ids` from their current rows.
+    Does nothing on databases without the column.
+    """
+    recipe_ids = sorted({int(recipe_id) for recipe_id in recipe_ids})
+    if not recipe_ids or not uses_search_vector():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(UPDATE_SEARCH_VECTORS, {'config': SEARCH_CONFIG, 'ids': recipe_ids})
+
+
+_pending = threading.local()
+
+
+def schedule_search_vector_update(recipe_ids):
+    """
+    Updates the search vectors of `recipe_ids` when the current transaction
+    commits, together with every other recipe it touched, so a transaction
+    writing many recipes runs one UPDATE. Does nothing on databases without
+    the column.
+    """
+    if not uses_search_vector():
+        return
+    _pending.__dict__.setdefault('recipe_ids', set()).update(recipe_ids)
+    # registered on every call: a rolled back transaction drops its callback,
+    # and the first callback of a committed one takes all collected ids
+    transaction.on_commit(_update_pending_search_vectors)
+
+
+def _update_pending_search_vectors():
+    update_search_vectors(_pending.__dict__.pop('recipe_ids', ()))
+
+
+def schedule_ingredient_search_vector_update(ingredient_id):
+    schedule_search_vector_update(RecipeIngredients.objects.filter(ingredient_id=ingredient_id).values_list(
+        'recipe_id', flat=True
+    ))
+
+
+class RecipeTextIndex:
+    """
+    Inverted index of the searched recipe fields: every term maps to the
+    recipes containing it and the field-weighted count of its occurrences.
+    A query scores the recipes holding all of its terms with
+    weight x idf summed over the terms.
+    """
+
+    def __init__(self, postings, meal_types):
+        self.postings = postings
+        self.meal_types = meal_types
+
+    @classmethod
+    def load(cls):
+        recipes = list(Recipe.objects.values_list('id', 'meal_type', 'title', 'description', 'preparation_guide'))
+        ingredient_names = {}
+        for recipe_id, name in RecipeIngredients.objects.values_list('recipe_id', 'ingredient__name'):
+            ingredient_names.setdefault(recipe_id, []).append(name)
+
+        postings, meal_types = {}, {}
+        for recipe_id, meal_type, title, description, guide in recipes:
+            meal_types[recipe_id] = meal_type
+            fields = {
+                'title': title,
+                'ingredients': ' '.join(ingredient_names.get(recipe_id, [])),
+                'description': description,
+                'preparation_guide': guide,
+            }
+            weights = Counter()
+            for field, text in fields.items():
+                for token in tokenize(text or ''):
+                    weights[token] += FIELD_WEIGHTS[field][1]
+            for token, weight in weights.items():
+                postings.setdefault(token, {})[recipe_id] = weight
+        return cls(postings, meal_types)
+
+    def search(self, query, limit, meal_type=None, excluded_ids=()):
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        matches = [self.postings.get(term, {}) for term in terms]
+        matches.sort(key=len)
+
+        excluded = set(excluded_ids)
+        results = []
+        for recipe_id in matches[0]:
+            if recipe_id in excluded or (meal_type and self.meal_types[recipe_id] != meal_type):
+                continue
+            if not all(recipe_id in postings for postings in matches[1:]):
+                continue
+            rank = sum(
+                postings[recipe_id] * math.log(1 + len(self.meal_types) / len(postings))
+                for postings in matches
+            )
+            results.append((recipe_id, rank))
+
+        results.sort(key=lambda result: (-result[1], result[0]))
+        return results[:limit]
+
+
+class SharedRecipeTextIndex:
+    """
+    The process-wide text index, rebuilt on first use after the catalog
+    version moved on.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self.builds = 0
+
+    def clear(self):
+        with self._lock:
+            self._index = self._version = None
+
+    def get(self):
+        version = get_catalog_version()
+        with self._lock:
+            if self._index is not None and self._version == version:
+                return self._index
+
+        with span('text_index_build') as attributes:
+            index = RecipeTextIndex.load()
+            attributes.update(recipes=len(index.meal_types), terms=len(index.postings))
+        with self._lock:
+            self._index, self._version = index, version
+            self.builds += 1
+        return index
+
+
+recipe_text_index = SharedRecipeTextIndex()
+
+
+def search_recipe_text(query, limit=20, meal_type=None, excluded_ids=()):
+    """
+    (recipe id, rank) of the best `limit` recipes matching every word of
+    `query`, best first.
+    """
+    if not uses_search_vector():
+        return recipe_text_index.get().search(query, limit, meal_type, excluded_ids)
+
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH, {
+            'config': SEARCH_CONFIG, 'query': query, 'meal_type': meal_type or None,
+            'excluded': [int(recipe_id) for recipe_id in excluded_ids], 'limit': limit,
+        })
+        return [(recipe_id, float(rank)) for recipe_id, rank in cursor.fetchall()]
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
 from django.utils.timezone import now
 
 from .models import (
@@ -58,12 +59,48 @@ class RecipeIngredientsSerializer(serializers.ModelSerializer):
 class RecipeSerializer(serializers.ModelSerializer):
     ingredients = serializers.SerializerMethodField()
 
+    # the list screens' representation, see ?compact=1
+    COMPACT_FIELDS = ['id', 'title', 'total_calories', 'preparation_time', 'meal_type']
+
     class Meta:
         model = Recipe
         fields = ['id', 'title', 'description', 'total_calories', 'sugars', 'protein', 'fat', 'carbohydrates', 'fiber',
                   'iron', 'potassium', 'preparation_time', 'preparation_guide', 
                   'meal_type', 'ingredients']
 
+    def __init__(self, *args, fields=None, **kwargs):
+        # `fields` limits the representation to those fields, in Meta order
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def parse_fields(cls, value):
+        """
+        The field names of a comma separated ?fields= value. Raises
+        ValidationError on names the serializer doesn't have.
+        """
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in cls.Meta.fields]
+        if unknown or not fields:
+            raise ValidationError({'fields': f"Unknown recipe fields: {', '.join(unknown)}" if unknown
+                                   else "Name at least one field."})
+        return fields
+
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=''):
+        """
+        Prefetches the ingredients get_ingredients reads, two queries for the
+        whole queryset instead of two per recipe. `prefix` is the lookup path
+        to the recipe when the queryset is of another model, e.g. 'recipe__'
+        for DayPlanRecipes.
+        """
+        return queryset.prefetch_related(Prefetch(
+            f'{prefix}recipeingredients_set',
+            queryset=RecipeIngredients.objects.select_related('ingredient')
+        ))
+
     def get_ingredients(self, obj):
         recipe_ingredients = obj.recipeingredients_set.all()
         ingredient_data = []
@@ -77,6 +114,36 @@ class RecipeSerializer(serializers.ModelSerializer):
         
         return ingredient_data
     
+class RecipeSearchSerializer(serializers.Serializer):
+    """
+    Query parameters of the recipe search: min_<field> and max_<field> for
+    every nutrient and the preparation time, meal_type, and sort (a range
+    field or id, descending with a leading '-').
+    """
+    RANGE_FIELDS = ['total_calories', 'sugars', 'protein', 'fat', 'carbohydrates', 'fiber', 'iron', 'potassium',
+                    'preparation_time']
+
+    meal_type = serializers.CharField(required=False)
+    sort = serializers.ChoiceField(
+        choices=[prefix + field for field in ['id', *RANGE_FIELDS] for prefix in ('', '-')],
+        default='id'
+    )
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for field in self.RANGE_FIELDS:
+            fields[f'min_{field}'] = serializers.FloatField(required=False)
+            fields[f'max_{field}'] = serializers.FloatField(required=False)
+        return fields
+
+    def validate(self, attrs):
+        for field in self.RANGE_FIELDS:
+            low, high = attrs.get(f'min_{field}'), attrs.get(f'max_{field}')
+            if low is not None and high is not None and low > high:
+                raise ValidationError({f'min_{field}': f"min_{field} must not be above max_{field}."})
+        return attrs
+
+
 class DayPlanRecipesSerializer(serializers.ModelSerializer):
     class Meta:
         model = DayPlanRecipes
@@ -0,0 +1,186 @@
+import threading
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version, bump_user_version, plan_cache
+from .catalog import recipe_catalog, parse_nutrients, NUTRIENT_FIELDS
+from .search import schedule_ingredient_search_vector_update, schedule_search_vector_update
+from .models import (Recipe, Ingredient, RecipeIngredients, DayPlanRecipes, DayPlanItem, CartIngredient, UserWeight,
+                     UserNutrientPreferences, DislikedIngredients)
+from .summaries import (RECIPE_FIELDS, add_delta, apply_summary_deltas, item_totals, recipe_change_deltas,
+                        recipe_totals, stored_item_deltas, stored_planned_recipe_deltas, summaries_are_suspended)
+
+
+# recipe catalog
+_catalog_commit = threading.local()
+
+
+def invalidate_recipe_catalog(change):
+    """
+    Records a recipe catalog write. `change` (see RecipeCatalog.with_changes)
+    reaches the shared catalog when the transaction commits, and the first
+    change applied then bumps the catalog version for all of them: bumping
+    per row would cost two queries each and lock the version row until the
+    transaction ends.
+    """
+    # cleared again at commit: a solve running meanwhile still reads the
+    # old rows and may store its plan before then
+    plan_cache.clear()
+    # the commit callbacks of earlier transactions have all run by now
+    _catalog_commit.versions = None
+    recipe_catalog.stage(change, committed_catalog_versions)
+
+
+def committed_catalog_versions():
+    """
+    The (previous, new) catalog versions of the transaction that just
+    committed, bumping the version on the first call.
+    """
+    if getattr(_catalog_commit, 'versions', None) is None:
+        _catalog_commit.versions = bump_catalog_version()
+        plan_cache.clear()
+    return _catalog_commit.versions
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_saving(sender, instance, raw=False, **kwargs):
+    if instance.pk is not None and not raw and not summaries_are_suspended():
+        instance._stored_nutrients = Recipe.objects.filter(pk=instance.pk).values(*RECIPE_FIELDS.values()).first()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    nutrients = parse_nutrients([getattr(instance, field) for field in NUTRIENT_FIELDS])
+    invalidate_recipe_catalog(('recipe', instance.id, instance.meal_type, nutrients))
+
+    stored = instance.__dict__.pop('_stored_nutrients', None)
+    if stored is not None:
+        apply_summary_deltas(recipe_change_deltas(instance, stored))
+    schedule_search_vector_update([instance.id])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    invalidate_recipe_catalog(('delete', instance.id))
+
+
+@receiver(post_save, sender=RecipeIngredients)
+def recipe_ingredient_saved(sender, instance, created, **kwargs):
+    if created:
+        change = ('add_ingredient', instance.recipe_id, instance.ingredient_id)
+    else:
+        # the row may have moved to another ingredient
+        change = ('set_ingredients', instance.recipe_id, list(
+            RecipeIngredients.objects.filter(recipe_id=instance.recipe_id).values_list('ingredient_id', flat=True)
+        ))
+    invalidate_recipe_catalog(change)
+    schedule_search_vector_update([instance.recipe_id])
+
+
+@receiver(post_delete, sender=RecipeIngredients)
+def recipe_ingredient_deleted(sender, instance, **kwargs):
+    invalidate_recipe_catalog(('remove_ingredient', instance.recipe_id, instance.ingredient_id))
+    schedule_search_vector_update([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    # a new ingredient is in no recipe yet; a renamed one changes how
+    # the recipes using it are serialized
+    if not created:
+        invalidate_recipe_catalog(('ingredient', instance.id))
+        schedule_ingredient_search_vector_update(instance.id)
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    invalidate_recipe_catalog(('ingredient', instance.id))
+
+
+# nutrition rollups, see summaries.py
+@receiver(pre_save, sender=DayPlanRecipes)
+def planned_recipe_saving(sender, instance, raw=False, **kwargs):
+    if instance.pk is not None and not raw and not summaries_are_suspended():
+        instance._stored_deltas = stored_planned_recipe_deltas(instance.pk)
+
+
+@receiver(post_save, sender=DayPlanRecipes)
+def planned_recipe_saved(sender, instance, raw=False, **kwargs):
+    if raw or summaries_are_suspended():
+        return
+    deltas = instance.__dict__.pop('_stored_deltas', {})
+    add_delta(deltas, instance.day_plan.user_id, instance.day_plan.date, 1, recipe_totals(instance.recipe))
+    apply_summary_deltas(deltas)
+
+
+@receiver(post_delete, sender=DayPlanRecipes)
+def planned_recipe_deleted(sender, instance, **kwargs):
+    if summaries_are_suspended():
+        return
+    apply_summary_deltas(add_delta(
+        {}, instance.day_plan.user_id, instance.day_plan.date, -1, recipe_totals(instance.recipe, -1)
+    ))
+
+
+@receiver(pre_save, sender=DayPlanItem)
+def day_plan_item_saving(sender, instance, raw=False, **kwargs):
+    if instance.pk is not None and not raw and not summaries_are_suspended():
+        instance._stored_deltas = stored_item_deltas(instance.pk)
+
+
+@receiver(post_save, sender=DayPlanItem)
+def day_plan_item_saved(sender, instance, raw=False, **kwargs):
+    if raw or summaries_are_suspended():
+        return
+    deltas = instance.__dict__.pop('_stored_deltas', {})
+    add_delta(deltas, instance.user_id, instance.date, 1, item_totals(instance))
+    apply_summary_deltas(deltas)
+
+
+@receiver(post_delete, sender=DayPlanItem)
+def day_plan_item_deleted(sender, instance, **kwargs):
+    if summaries_are_suspended():
+        return
+    apply_summary_deltas(add_delta({}, instance.user_id, instance.date, -1, item_totals(instance, -1)))
+
+
+
+# per-user version stamps of the conditional GETs, see cache.make_etag
+@receiver([post_save, post_delete], sender=DayPlanRecipes)
+def planned_recipe_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_user_version(instance.day_plan.user_id, 'plan')
+
+
+@receiver([post_save, post_delete], sender=DayPlanItem)
+def day_plan_item_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_user_version(instance.user_id, 'plan')
+
+
+@receiver([post_save, post_delete], sender=CartIngredient)
+def cart_ingredient_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    try:
+        user_id = instance.cart.user_id
+    except ObjectDoesNotExist:
+        # deleted together with the cart
+        return
+    bump_user_version(user_id, 'cart')
+
+
+@receiver([post_save, post_delete], sender=UserWeight)
+def weight_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_user_version(instance.user_id, 'weights')
+
+
+@receiver([post_save, post_delete], sender=UserNutrientPreferences)
+@receiver([post_save, post_delete], sender=DislikedIngredients)
+def preferences_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_user_version(instance.user_id, 'preferences')
@@ -0,0 +1,518 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from pulp import (LpProblem, LpVariable, LpAffineExpression, LpConstraint, lpSum,
+                  LpMaximize, LpMinimize, LpConstraintGE, LpConstraintLE, LpStatusInfeasible,
+                  LpSolutionOptimal, LpSolutionIntegerFeasible, PULP_CBC_CMD, PulpSolverError)
+
+from .catalog import NUTRIENT_FIELDS, MEAL_TYPES
+from .timings import span
+
+
+# (recipe field, min preference, max preference, constraint label) in constraint order
+NUTRIENT_BOUNDS = [
+    ('total_calories', 'min_calories', 'max_calories', 'Calories'),
+    ('sugars', 'min_sugars', 'max_sugars', 'Sugars'),
+    ('iron', 'min_iron', 'max_iron', 'Iron'),
+    ('potassium', 'min_potassium', 'max_potassium', 'Potassium'),
+    ('protein', 'min_protein', 'max_protein', 'Protein'),
+    ('fat', 'min_fat', 'max_fat', 'Fat'),
+    ('carbohydrates', 'min_carbohydrates', 'max_carbohydrates', 'Carbohydrates'),
+    ('fiber', 'min_fiber', 'max_fiber', 'Fiber'),
+]
+
+MAX_MEALS_PER_DAY = 6
+
+STATUS_OPTIMAL = 'optimal'
+STATUS_TIME_LIMIT = 'time_limit'
+STATUS_INFEASIBLE = 'infeasible'
+STATUS_NOT_SOLVED = 'not_solved'
+# optimal among a cut of the candidates only, see BranchAndBoundBackend
+STATUS_TRUNCATED = 'truncated'
+
+MIN_SOLVE_TIME = 0.05
+
+
+def objective_field(df, optimize_field):
+    """
+    Column holding the objective coefficients: 'score' when the planner
+    adjusted the optimized nutrient (see utils.apply_rotation_penalty),
+    else the nutrient itself. None when there is nothing to optimize.
+    """
+    if 'score' in df.columns:
+        return 'score'
+    if optimize_field in df.columns:
+        return optimize_field
+    return None
+
+
+def build_model_arrays(df, preferences, optimize_field):
+    """
+    Pulls the candidate nutrients into NumPy arrays and returns the whole
+    model as a coefficient matrix: one row per active min/max nutrient bound,
+    one column per candidate recipe.
+    """
+    nutrients = df[NUTRIENT_FIELDS].to_numpy(dtype=float)
+    meal_types = df['meal_type'].to_numpy()
+
+    bound_fields, lower, upper, labels = [], [], [], []
+    for field, min_attr, max_attr, label in NUTRIENT_BOUNDS:
+        min_value = getattr(preferences, min_attr)
+        max_value = getattr(preferences, max_attr)
+        if min_value > 0 and max_value > 0:
+            bound_fields.append(NUTRIENT_FIELDS.index(field))
+            lower.append(min_value)
+            upper.append(max_value)
+            labels.append(label)
+
+    objective = None
+    field = objective_field(df, optimize_field)
+    if field is not None:
+        objective = df[field].to_numpy(dtype=float)
+
+    return {
+        'ids': df['id'].to_numpy(),
+        'objective': objective,
+        'coefficients': nutrients[:, bound_fields].T,
+        'lower': np.array(lower, dtype=float),
+        'upper': np.array(upper, dtype=float),
+        'labels': labels,
+        'groups': [
+            (meal_type, np.flatnonzero(meal_types == meal_type))
+            for meal_type in MEAL_TYPES
+        ],
+    }
+
+
+def build_vectorized_model(df, preferences, optimize_field, objective):
+    arrays = build_model_arrays(df, preferences, optimize_field)
+
+    model = LpProblem("Meal_Selection", LpMaximize if objective == 'maximize' else LpMinimize)
+
+    meal_vars = [LpVariable(f"meal_{i}", cat='Binary') for i in range(len(df))]
+
+    model += lpSum(meal_vars) <= MAX_MEALS_PER_DAY, "Max_Meals"
+
+    if arrays['objective'] is not None:
+        model += LpAffineExpression(zip(meal_vars, arrays['objective'].tolist())), f"{objective.capitalize()}_{optimize_field.capitalize()}"
+
+    for row, min_value, max_value, label in zip(
+        arrays['coefficients'].tolist(), arrays['lower'], arrays['upper'], arrays['labels']
+    ):
+        model += LpConstraint(LpAffineExpression(zip(meal_vars, row)), LpConstraintGE, f"Min_{label}", min_value)
+        model += LpConstraint(LpAffineExpression(zip(meal_vars, row)), LpConstraintLE, f"Max_{label}", max_value)
+
+    for meal_type, indices in arrays['groups']:
+        if len(indices):
+            model += lpSum(meal_vars[i] for i in indices) >= 1, f"At_Least_One_{meal_type.capitalize()}"
+
+    return model, meal_vars
+
+
+def build_legacy_model(df, preferences, optimize_field, objective):
+    model = LpProblem("Meal_Selection", LpMaximize if objective == 'maximize' else LpMinimize)
+
+    meal_vars = [LpVariable(f"meal_{i}", cat='Binary') for i in df.index]
+
+    model += lpSum(meal_vars) <= MAX_MEALS_PER_DAY, "Max_Meals"
+
+    field = objective_field(df, optimize_field)
+    if field is not None:
+        model += lpSum(df.loc[i, field] * meal_vars[i] for i in df.index), f"{objective.capitalize()}_{optimize_field.capitalize()}"
+
+    for field, min_attr, max_attr, label in NUTRIENT_BOUNDS:
+        min_value = getattr(preferences, min_attr)
+        max_value = getattr(preferences, max_attr)
+        if min_value > 0 and max_value > 0:
+            model += lpSum(df.loc[i, field] * meal_vars[i] for i in df.index) >= min_value, f"Min_{label}"
+            model += lpSum(df.loc[i, field] * meal_vars[i] for i in df.index) <= max_value, f"Max_{label}"
+
+    for meal_type in MEAL_TYPES:
+        indices = df.index[df['meal_type'] == meal_type].tolist()
+        if indices:
+            model += lpSum(meal_vars[i] for i in indices) >= 1, f"At_Least_One_{meal_type.capitalize()}"
+
+    return model, meal_vars
+
+
+MODEL_BUILDERS = {
+    'vectorized': build_vectorized_model,
+    'legacy': build_legacy_model,
+}
+
+
+def build_weekly_model(df, preferences, optimize_field, objective, days):
+    """
+    One model for the whole week: every day gets its own copy of the daily
+    bounds and meal type coverage, and each recipe may be used on one day only.
+    """
+    arrays = build_model_arrays(df, preferences, optimize_field)
+    recipe_count = len(df)
+
+    model = LpProblem("Weekly_Meal_Selection", LpMaximize if objective == 'maximize' else LpMinimize)
+
+    meal_vars = [
+        [LpVariable(f"meal_{day}_{i}", cat='Binary') for i in range(recipe_count)]
+        for day in range(days)
+    ]
+
+    if arrays['objective'] is not None:
+        coefficients = arrays['objective'].tolist()
+        model += LpAffineExpression(
+            (var, coefficient)
+            for day_vars in meal_vars
+            for var, coefficient in zip(day_vars, coefficients)
+        ), f"{objective.capitalize()}_{optimize_field.capitalize()}"
+
+    rows = arrays['coefficients'].tolist()
+    for day, day_vars in enumerate(meal_vars):
+        model += lpSum(day_vars) <= MAX_MEALS_PER_DAY, f"Max_Meals_Day_{day}"
+
+        for row, min_value, max_value, label in zip(rows, arrays['lower'], arrays['upper'], arrays['labels']):
+            model += LpConstraint(LpAffineExpression(zip(day_vars, row)), LpConstraintGE, f"Min_{label}_Day_{day}", min_value)
+            model += LpConstraint(LpAffineExpression(zip(day_vars, row)), LpConstraintLE, f"Max_{label}_Day_{day}", max_value)
+
+        for meal_type, indices in arrays['groups']:
+            if len(indices):
+                model += lpSum(day_vars[i] for i in indices) >= 1, f"At_Least_One_{meal_type.capitalize()}_Day_{day}"
+
+    if days > 1:
+        for i in range(recipe_count):
+            model += lpSum(day_vars[i] for day_vars in meal_vars) <= 1, f"No_Repeat_{i}"
+
+    return model, meal_vars
+
+
+def greedy_day(df, preferences, optimize_field, objective):
+    """
+    Fast fallback when the model is infeasible or out of time. Takes the best
+    recipe of every meal type first, then more recipes in objective order
+    while all maximum bounds still hold. Minimum bounds are best effort only.
+    """
+    arrays = build_model_arrays(df, preferences, optimize_field)
+    coefficients = arrays['coefficients']
+    recipe_count = len(df)
+
+    if arrays['objective'] is None:
+        order = np.arange(recipe_count)
+    elif objective == 'maximize':
+        order = np.argsort(-arrays['objective'], kind='stable')
+    else:
+        order = np.argsort(arrays['objective'], kind='stable')
+
+    rank = np.empty(recipe_count, dtype=int)
+    rank[order] = np.arange(recipe_count)
+
+    totals = np.zeros(len(arrays['upper']))
+    chosen = []
+
+    def try_take(i):
+        nonlocal totals
+        if i in chosen or np.any(totals + coefficients[:, i] > arrays['upper']):
+            return False
+        chosen.append(i)
+        totals = totals + coefficients[:, i]
+        return True
+
+    for meal_type, indices in arrays['groups']:
+        if len(chosen) >= MAX_MEALS_PER_DAY:
+            break
+        for i in indices[np.argsort(rank[indices], kind='stable')]:
+            if try_take(i):
+                break
+
+    for i in order:
+        if len(chosen) >= MAX_MEALS_PER_DAY:
+            break
+        if objective == 'minimize' and np.all(totals >= arrays['lower']):
+            break
+        try_take(i)
+
+    return [df.loc[i, 'id'] for i in sorted(chosen)]
+
+
+def run_cbc(model, deadline, **options):
+    """
+    Solves `model` with CBC in the time left until `deadline` and returns
+    one of the STATUS_* values. STATUS_TIME_LIMIT means CBC stopped early
+    but left a usable integer solution in the variables.
+    """
+    remaining = deadline - time.monotonic()
+    if remaining < MIN_SOLVE_TIME:
+        return STATUS_NOT_SOLVED
+
+    try:
+        model.solve(PULP_CBC_CMD(msg=False, timeLimit=remaining, **options))
+    except PulpSolverError:
+        return STATUS_NOT_SOLVED
+
+    if model.sol_status == LpSolutionOptimal:
+        return STATUS_OPTIMAL
+    if model.sol_status == LpSolutionIntegerFeasible:
+        return STATUS_TIME_LIMIT
+    if model.status == LpStatusInfeasible:
+        return STATUS_INFEASIBLE
+    return STATUS_NOT_SOLVED
+
+
+class SolverBackend:
+    """
+    Solves the single-day meal model for a candidate frame. `solve` returns
+    the frame positions of the picked recipes (None when there is no usable
+    solution) and one of the STATUS_* values.
+    """
+    name = None
+    # whether the joint weekly model can be handed to this backend
+    supports_weekly = False
+
+    def solve(self, df, preferences, optimize_field, objective, deadline, engine='vectorized'):
+        raise NotImplementedError
+
+
+class CBCBackend(SolverBackend):
+    """
+    Builds a PuLP model with the given engine and runs the CBC binary on it.
+    """
+    name = 'cbc'
+    supports_weekly = True
+
+    def solve(self, df, preferences, optimize_field, objective, deadline, engine='vectorized'):
+        with span('build', engine=engine, candidates=len(df)) as attributes:
+            model, meal_vars = MODEL_BUILDERS[engine](df, preferences, optimize_field, objective)
+            attributes.update(variables=len(meal_vars), constraints=len(model.constraints))
+
+        with span('solve', solver=self.name) as attributes:
+            status = attributes['status'] = run_cbc(model, deadline)
+
+        if status not in (STATUS_OPTIMAL, STATUS_TIME_LIMIT):
+            return None, status
+        return [i for i, var in enumerate(meal_vars) if var.varValue == 1], status
+
+
+class BranchAndBoundBackend(SolverBackend):
+    """
+    Exact in-process solver: no subprocess and no model files. See
+    branch_and_bound for the search itself.
+
+    The search grows exponentially with the candidate count and needs
+    seconds where CBC needs milliseconds well before the few hundred
+    candidates the default top-K pruning leaves. Frames with more than
+    MAX_CANDIDATES recipes (MEAL_PLANNER_BRANCH_AND_BOUND setting) are
+    first cut to a share of every meal type, see best_candidates. The plan
+    is then only optimal among those and reported as STATUS_TRUNCATED. When
+    no plan fits the cut, the whole frame is searched in the time left, so
+    STATUS_INFEASIBLE always holds for the frame that was passed in.
+    """
+    name = 'branch_and_bound'
+
+    def __init__(self, max_candidates=None):
+        self.max_candidates = max_candidates or getattr(settings, 'MEAL_PLANNER_BRANCH_AND_BOUND', {}).get(
+            'MAX_CANDIDATES', 32
+        )
+
+    def solve(self, df, preferences, optimize_field, objective, deadline, engine='vectorized'):
+        if len(df) <= self.max_candidates:
+            return self.search(df, preferences, optimize_field, objective, deadline)
+
+        kept = best_candidates(df, optimize_field, objective, self.max_candidates)
+        positions, status = self.search(df.iloc[kept], preferences, optimize_field, objective, deadline)
+        if status == STATUS_INFEASIBLE:
+            return self.search(df, preferences, optimize_field, objective, deadline)
+        if positions is None:
+            return None, status
+        return [int(kept[i]) for i in positions], STATUS_TRUNCATED if status == STATUS_OPTIMAL else status
+
+    def search(self, df, preferences, optimize_field, objective, deadline):
+        with span('build', engine='arrays', candidates=len(df)) as attributes:
+            arrays = build_model_arrays(df, preferences, optimize_field)
+            attributes.update(
+                variables=len(df),
+                constraints=1 + 2 * len(arrays['lower']) + sum(1 for _, indices in arrays['groups'] if len(indices)),
+            )
+
+        with span('solve', solver=self.name) as attributes:
+            positions, attributes['status'] = branch_and_bound(arrays, objective, deadline)
+        return positions, attributes['status']
+
+
+def best_candidates(df, optimize_field, objective, count):
+    """
+    Sorted frame positions of `count` recipes for the search, an equal
+    share of every meal type: the best half of a share by objective, the
+    other half spread evenly over the rest of that meal type. Only the best
+    ones would overshoot a maximum bound on the optimized nutrient together.
+    """
+    field = objective_field(df, optimize_field)
+    if field is None:
+        order = np.arange(len(df))
+    else:
+        values = df[field].to_numpy(dtype=float)
+        order = np.argsort(-values if objective == 'maximize' else values, kind='stable')
+    meal_types = df['meal_type'].to_numpy()[order]
+    groups = [order[meal_types == meal_type] for meal_type in sorted(set(meal_types))]
+    share = -(-count // len(groups))
+    best = (share + 1) // 2
+
+    # ranks the recipes of every meal type by how early they are taken, then
+    # takes the groups round robin so that a small group leaves its share
+    ranked = []
+    for group in groups:
+        if len(group) > share:
+            spread = np.linspace(best, len(group) - 1, share - best).round().astype(int)
+            first = np.concatenate([np.arange(best), spread])
+            group = np.concatenate([group[first], np.delete(group, first)])
+        ranked.append(np.column_stack([np.arange(len(group)), group]))
+    ranked = np.concatenate(ranked)
+    return np.sort(ranked[np.argsort(ranked[:, 0], kind='stable')[:count], 1])
+
+
+def branch_and_bound(arrays, objective, deadline, max_items=MAX_MEALS_PER_DAY):
+    """
+    Depth-first search over "the next recipe to add", recipes sorted by
+    objective. Because at most `max_items` recipes are picked, the tree is
+    at most that deep. A branch is cut as soon as one of these monotone
+    bounds fails for its first candidate, which cuts every later one too:
+
+    - the objective can no longer beat the best plan found so far, judged by
+      the best remaining recipes, the slack left in every max bound and the
+      cheapest way to meet every min bound;
+    - the minimum bounds can no longer be reached with the picks left;
+    - a required meal type has no recipes left.
+
+    Nutrient coefficients must be non-negative, as they always are for recipes.
+    """
+    coefficients = arrays['coefficients']
+    lower, upper = arrays['lower'], arrays['upper']
+    bound_count, recipe_count = coefficients.shape
+
+    if np.any(coefficients < 0):
+        return None, STATUS_NOT_SOLVED
+
+    values = arrays['objective'] if arrays['objective'] is not None else np.zeros(recipe_count)
+    if objective != 'maximize':
+        values = -values
+
+    order = np.argsort(-values, kind='stable')
+    values = values[order]
+    coefficients = coefficients[:, order]
+    position = np.empty(recipe_count, dtype=int)
+    position[order] = np.arange(recipe_count)
+
+    group_of = np.full(recipe_count, -1)
+    group_last = []
+    for meal_type, indices in arrays['groups']:
+        if len(indices):
+            group_of[position[indices]] = len(group_last)
+            group_last.append(position[indices].max())
+
+    # reach[p, b, r]: the most r recipes from position p on can add to bound b
+    top = np.zeros((recipe_count + 1, bound_count, max_items))
+    for p in range(recipe_count - 1, -1, -1):
+        merged = np.concatenate([top[p + 1], coefficients[:, p:p + 1]], axis=1)
+        merged.sort(axis=1)
+        top[p] = merged[:, :0:-1]
+    reach = np.concatenate([np.zeros((recipe_count + 1, bound_count, 1)), np.cumsum(top, axis=2)], axis=2)
+
+    positive_prefix = np.concatenate([[0.0], np.cumsum(np.maximum(values, 0))])
+
+    # ratio[b, p]: the best objective per unit of bound b from position p on,
+    # so no pick from p on can add more than the slack of b times this
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(values > 0, values / coefficients, 0.0)
+    ratio = np.concatenate([ratio, np.zeros((bound_count, 1))], axis=1)
+    ratio = np.maximum.accumulate(ratio[:, ::-1], axis=1)[:, ::-1]
+
+    # cost[b, p]: the least objective given up per unit of bound b from
+    # position p on, so meeting the rest of min bound b costs at least the
+    # missing amount times this
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cost = np.where(coefficients > 0, np.maximum(-values, 0) / coefficients, np.inf)
+    cost = np.concatenate([cost, np.full((bound_count, 1), np.inf)], axis=1)
+    cost = np.minimum.accumulate(cost[:, ::-1], axis=1)[:, ::-1]
+    positions = np.arange(recipe_count + 1)
+    tolerance = 1e-9
+
+    best_value = -np.inf
+    best = None
+    nodes = 0
+    timed_out = False
+
+    def visit(start, chosen, totals, value, uncovered):
+        nonlocal best_value, best, nodes, timed_out
+
+        nodes += 1
+        if nodes % 256 == 0 and time.monotonic() > deadline:
+            timed_out = True
+        if timed_out:
+            return
+
+        if not uncovered and np.all(totals >= lower - tolerance) and value > best_value + tolerance:
+            best_value, best = value, list(chosen)
+
+        left = max_items - len(chosen)
+        if left == 0 or start >= recipe_count or len(uncovered) > left:
+            return
+
+        candidates = positions[start:recipe_count]
+        ends = np.minimum(candidates + left, recipe_count)
+        bound = value + values[candidates] + positive_prefix[ends] - positive_prefix[candidates + 1]
+        if bound_count:
+            # gains and costs bounded separately: at most this much gained ...
+            gain = positive_prefix[ends] - positive_prefix[candidates]
+            slack = (upper - totals)[:, None] * ratio[:, start:recipe_count]
+            slack[np.isinf(ratio[:, start:recipe_count])] = np.inf
+            gain = np.minimum(gain, slack.min(axis=0))
+            # ... and at least this much given up
+            missing = np.maximum(lower - totals, 0)[:, None] * cost[:, start:recipe_count]
+            missing[np.isnan(missing)] = 0
+            bound = np.minimum(bound, value + gain - missing.max(axis=0))
+        cutoff = len(candidates)
+        failing = np.flatnonzero(bound <= best_value + tolerance)
+        if len(failing):
+            cutoff = failing[0]
+        if uncovered:
+            cutoff = min(cutoff, min(group_last[g] for g in uncovered) - start + 1)
+        if bound_count:
+            unreachable = np.flatnonzero(np.any(totals + reach[candidates, :, left] < lower - tolerance, axis=1))
+            if len(unreachable):
+                cutoff = min(cutoff, unreachable[0])
+        candidates = candidates[:max(cutoff, 0)]
+        bound = bound[:len(candidates)]
+        if not len(candidates):
+            return
+
+        picked = totals[:, None] + coefficients[:, candidates]
+        usable = np.all(picked <= upper[:, None] + tolerance, axis=0)
+        usable &= np.all(picked + reach[candidates + 1, :, left - 1].T >= lower[:, None] - tolerance, axis=0)
+        if len(uncovered) == left:
+            usable &= np.isin(group_of[candidates], list(uncovered))
+
+        for j, j_bound in zip(candidates[usable], bound[usable]):
+            if j_bound <= best_value + tolerance:
+                break
+            chosen.append(j)
+            visit(j + 1, chosen, totals + coefficients[:, j], value + values[j], uncovered - {group_of[j]})
+            chosen.pop()
+            if timed_out:
+                return
+
+    visit(0, [], np.zeros(bound_count), 0.0, frozenset(range(len(group_last))))
+
+    if best is None:
+        return None, STATUS_NOT_SOLVED if timed_out else STATUS_INFEASIBLE
+    return sorted(int(order[j]) for j in best), STATUS_TIME_LIMIT if timed_out else STATUS_OPTIMAL
+
+
+SOLVER_BACKENDS = {
+    backend.name: backend
+    for backend in (CBCBackend, BranchAndBoundBackend)
+}
+
+
+def get_solver_backend(name=None):
+    name = name or getattr(settings, 'MEAL_PLANNER_SOLVER', 'cbc')
+    try:
+        return SOLVER_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown meal planner solver: {name}")
@@ -0,0 +1,309 @@
+"""
+Daily and weekly nutrition rollups (DailySummary, WeeklySummary).
+
+Every planned recipe and every day plan item adds its nutrients to the
+rollup of its day and of its week. The signal receivers in signals.py keep
+the rollups current one change at a time, in the transaction of the change;
+writers that bypass signals (bulk_create, queryset updates) must call
+apply_summary_deltas themselves or rebuild the affected users. Moving a
+DayPlan to another date is not tracked. rebuild_summaries and
+check_summaries recompute everything from scratch, see the
+rebuild_summaries management command.
+"""
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import DailySummary, WeeklySummary, DayPlanRecipes, DayPlanItem
+
+
+# rollup field -> Recipe field
+RECIPE_FIELDS = {
+    'total_calories': 'total_calories',
+    'total_carbohydrates': 'carbohydrates',
+    'total_fat': 'fat',
+    'total_protein': 'protein',
+    'total_fiber': 'fiber',
+    'total_sugars': 'sugars',
+    'total_iron': 'iron',
+    'total_potassium': 'potassium',
+}
+
+# rollup field -> DayPlanItem field, multiplied by the item quantity
+ITEM_FIELDS = {
+    'total_calories': 'total_calories',
+    'total_carbohydrates': 'total_carbs',
+    'total_fat': 'total_fats',
+    'total_protein': 'total_protein',
+    'total_fiber': 'total_fiber',
+    'total_sugars': 'total_sugars',
+    'total_iron': 'total_iron',
+    'total_potassium': 'total_potassium',
+}
+
+SUMMARY_FIELDS = list(RECIPE_FIELDS)
+
+# Stored totals are rounded to this many decimals on every write. Adding and
+# subtracting float deltas leaves binary noise behind (0.1 + 0.2 - 0.1 is
+# 0.20000000000000004) that would grow with every edit; nutrient values carry
+# far fewer decimals, so the rounded total is the exact one.
+SUMMARY_DECIMALS = 6
+
+_local = threading.local()
+
+
+def get_week_start(date):
+    return date - timedelta(days=date.weekday())
+
+
+def add_delta(deltas, user_id, date, entries, totals):
+    """
+    Adds one change to `deltas`, a dict (user id, date) -> [entries, totals].
+    """
+    if isinstance(date, datetime):
+        # DayPlanItem.date defaults to timezone.now
+        date = date.date()
+    delta = deltas.setdefault((user_id, date), [0, dict.fromkeys(SUMMARY_FIELDS, 0.0)])
+    delta[0] += entries
+    for field, value in totals.items():
+        delta[1][field] += value
+    return deltas
+
+
+def round_total(value):
+    # + 0.0 turns a rounded -0.0 into 0.0
+    return round(value, SUMMARY_DECIMALS) + 0.0
+
+
+def recipe_totals(recipe, sign=1):
+    return {
+        field: sign * float(getattr(recipe, recipe_field) or 0.0)
+        for field, recipe_field in RECIPE_FIELDS.items()
+    }
+
+
+def item_totals(item, sign=1):
+    quantity = int(item.quantity)
+    return {
+        field: sign * float(getattr(item, item_field) or 0.0) * quantity
+        for field, item_field in ITEM_FIELDS.items()
+    }
+
+
+@contextmanager
+def summaries_suspended():
+    """
+    The signal receivers leave the rollups alone inside the block. For bulk
+    changes that rebuild the rollups of the affected users afterwards.
+    """
+    previous = getattr(_local, 'suspended', False)
+    _local.suspended = True
+    try:
+        yield
+    finally:
+        _local.suspended = previous
+
+
+def summaries_are_suspended():
+    return getattr(_local, 'suspended', False)
+
+
+def apply_summary_deltas(deltas):
+    """
+    Adds `deltas` (see add_delta) to the daily rollups and to the weekly
+    rollups of their weeks. A rollup whose entry count drops to zero is
+    deleted, so an emptied day reads like a day that was never planned.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta[0] or any(delta[1].values())}
+    if not deltas:
+        return
+
+    weekly = {}
+    for (user_id, date), (entries, totals) in deltas.items():
+        add_delta(weekly, user_id, get_week_start(date), entries, totals)
+
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                _apply_deltas(DailySummary, 'date', deltas)
+                _apply_deltas(WeeklySummary, 'week_start', weekly)
+            return
+        except IntegrityError:
+            # a concurrent transaction created one of the rows first
+            if attempt:
+                raise
+
+
+def _apply_deltas(model, key_field, deltas):
+    rows = {
+        (row.user_id, getattr(row, key_field)): row
+        for row in model.objects.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in deltas}, **{f'{key_field}__in': {key for _, key in deltas}}
+        )
+    }
+
+    created, updated, emptied = [], [], []
+    for (user_id, key), (entries, totals) in deltas.items():
+        row = rows.get((user_id, key))
+        if row is None:
+            if entries <= 0:
+                # nothing left to subtract from, e.g. the user is being deleted
+                continue
+            row = model(user_id=user_id, **{key_field: key})
+            if model is WeeklySummary:
+                row.week_end = key + timedelta(days=6)
+            created.append(row)
+        elif row.entries + entries <= 0:
+            emptied.append(row.pk)
+            continue
+        else:
+            updated.append(row)
+
+        row.entries += entries
+        for field, value in totals.items():
+            setattr(row, field, round_total(getattr(row, field) + value))
+
+    if emptied:
+        model.objects.filter(pk__in=emptied).delete()
+    model.objects.bulk_update(updated, ['entries', *SUMMARY_FIELDS])
+    model.objects.bulk_create(created)
+
+
+def stored_planned_recipe_deltas(pk, sign=-1):
+    """
+    Deltas of the DayPlanRecipes row `pk` as currently stored, read before
+    the row is changed.
+    """
+    deltas = {}
+    row = DayPlanRecipes.objects.filter(pk=pk).values(
+        'day_plan__user_id', 'day_plan__date', *[f'recipe__{field}' for field in RECIPE_FIELDS.values()]
+    ).first()
+    if row is not None:
+        add_delta(deltas, row['day_plan__user_id'], row['day_plan__date'], sign, {
+            field: sign * (row[f'recipe__{recipe_field}'] or 0.0) for field, recipe_field in RECIPE_FIELDS.items()
+        })
+    return deltas
+
+
+def stored_item_deltas(pk, sign=-1):
+    deltas = {}
+    item = DayPlanItem.objects.filter(pk=pk).first()
+    if item is not None:
+        add_delta(deltas, item.user_id, item.date, sign, item_totals(item, sign))
+    return deltas
+
+
+def recipe_change_deltas(recipe, previous):
+    """
+    Deltas for every planned use of `recipe` when its nutrients change from
+    `previous` (a dict of Recipe field values) to the current ones.
+    """
+    change = {
+        field: float(getattr(recipe, recipe_field) or 0.0) - float(previous[recipe_field] or 0.0)
+        for field, recipe_field in RECIPE_FIELDS.items()
+    }
+    deltas = {}
+    if not any(change.values()):
+        return deltas
+
+    uses = DayPlanRecipes.objects.filter(recipe=recipe).values(
+        user_id=F('day_plan__user_id'), date=F('day_plan__date')
+    ).annotate(uses=Count('id'))
+    for use in uses:
+        add_delta(deltas, use['user_id'], use['date'], 0, {
+            field: value * use['uses'] for field, value in change.items()
+        })
+    return deltas
+
+
+def compute_daily_summaries(user_ids=None):
+    """
+    The daily rollups recomputed from DayPlanRecipes and DayPlanItem, as
+    deltas (see add_delta) keyed by (user id, date).
+    """
+    recipes = DayPlanRecipes.objects.all()
+    items = DayPlanItem.objects.all()
+    if user_ids is not None:
+        recipes = recipes.filter(day_plan__user_id__in=user_ids)
+        items = items.filter(user_id__in=user_ids)
+
+    deltas = {}
+    recipe_rows = recipes.values(user_id=F('day_plan__user_id'), date=F('day_plan__date')).annotate(
+        entries=Count('id'),
+        **{f'sum_{field}': Sum(f'recipe__{recipe_field}') for field, recipe_field in RECIPE_FIELDS.items()}
+    )
+    item_rows = items.values('user_id', 'date').annotate(
+        entries=Count('id'),
+        **{f'sum_{field}': Sum(F(item_field) * F('quantity')) for field, item_field in ITEM_FIELDS.items()}
+    )
+    for row in [*recipe_rows, *item_rows]:
+        add_delta(deltas, row['user_id'], row['date'], row['entries'], {
+            field: row[f'sum_{field}'] or 0.0 for field in SUMMARY_FIELDS
+        })
+    return deltas
+
+
+def _expected_rollups(user_ids=None):
+    daily = compute_daily_summaries(user_ids)
+    weekly = {}
+    for (user_id, date), (entries, totals) in daily.items():
+        add_delta(weekly, user_id, get_week_start(date), entries, totals)
+    return daily, weekly
+
+
+def rebuild_summaries(user_ids=None):
+    """
+    Replaces the rollups of `user_ids` (of every user when None) with a full
+    recompute. Returns the number of daily and weekly rows written.
+    """
+    daily, weekly = _expected_rollups(user_ids)
+
+    with transaction.atomic():
+        for model, expected, key_field in ((DailySummary, daily, 'date'), (WeeklySummary, weekly, 'week_start')):
+            existing = model.objects.all()
+            if user_ids is not None:
+                existing = existing.filter(user_id__in=user_ids)
+            existing.delete()
+
+            rows = []
+            for (user_id, key), (entries, totals) in expected.items():
+                row = model(user_id=user_id, entries=entries, **{key_field: key},
+                            **{field: round_total(value) for field, value in totals.items()})
+                if model is WeeklySummary:
+                    row.week_end = key + timedelta(days=6)
+                rows.append(row)
+            model.objects.bulk_create(rows, batch_size=1000)
+
+    return len(daily), len(weekly)
+
+
+def check_summaries(user_ids=None):
+    """
+    Compares the stored rollups exactly with a full recompute rounded to
+    SUMMARY_DECIMALS. Returns one (model name, user id, date or week start,
+    field, stored, expected) tuple per difference; a missing or surplus row
+    shows up as its entry count.
+    """
+    daily, weekly = _expected_rollups(user_ids)
+
+    differences = []
+    for model, expected, key_field in ((DailySummary, daily, 'date'), (WeeklySummary, weekly, 'week_start')):
+        stored = model.objects.all()
+        if user_ids is not None:
+            stored = stored.filter(user_id__in=user_ids)
+        stored = {(row.user_id, getattr(row, key_field)): row for row in stored}
+
+        for key in sorted(set(stored) | set(expected)):
+            row = stored.get(key)
+            entries, totals = expected.get(key, (0, dict.fromkeys(SUMMARY_FIELDS, 0.0)))
+            if row is None or row.entries != entries:
+                differences.append((model.__name__, *key, 'entries', row.entries if row else 0, entries))
+                continue
+            for field in SUMMARY_FIELDS:
+                if getattr(row, field) != round_total(totals[field]):
+                    differences.append((model.__name__, *key, field, getattr(row, field), round_total(totals[field])))
+
+    return differences
@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class PlannerTimings:
+    """
+    In-process record of the last `window` spans of every planner stage.
+
+    A span is the wall time of one stage (candidate loading, model build,
+    solve, ...) together with what it worked on: candidate, variable and
+    constraint counts, the solver status and so on. Every span is also
+    logged on this module's logger, so the same data can be collected
+    from the logs across processes.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._spans = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, attributes):
+        logger.info(
+            "planner %s took %.1f ms %s", stage, seconds * 1000, attributes,
+            extra={'planner_span': {'stage': stage, 'seconds': seconds, **attributes}},
+        )
+        if self.window <= 0:
+            return
+        with self._lock:
+            spans = self._spans.get(stage)
+            if spans is None:
+                spans = self._spans[stage] = deque(maxlen=self.window)
+            spans.append((seconds, attributes))
+            self._totals[stage] = self._totals.get(stage, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+            self._totals.clear()
+
+    def stats(self):
+        """
+        Per stage: the number of spans in the window and in total, latency
+        percentiles in milliseconds over the window, the mean of every
+        numeric attribute and the counts of every other attribute value.
+        """
+        with self._lock:
+            snapshot = {stage: list(spans) for stage, spans in self._spans.items()}
+            totals = dict(self._totals)
+
+        stages = {}
+        for stage, spans in snapshot.items():
+            milliseconds = np.array([seconds for seconds, _ in spans]) * 1000
+            numeric, counts = {}, {}
+            for _, attributes in spans:
+                for name, value in attributes.items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        numeric.setdefault(name, []).append(value)
+                    else:
+                        values = counts.setdefault(name, {})
+                        values[str(value)] = values.get(str(value), 0) + 1
+
+            stages[stage] = {
+                'count': len(spans),
+                'total': totals[stage],
+                'mean_ms': float(milliseconds.mean()),
+                'p50_ms': float(np.percentile(milliseconds, 50)),
+                'p90_ms': float(np.percentile(milliseconds, 90)),
+                'p95_ms': float(np.percentile(milliseconds, 95)),
+                'p99_ms': float(np.percentile(milliseconds, 99)),
+                'max_ms': float(milliseconds.max()),
+                'means': {name: float(np.mean(values)) for name, values in numeric.items()},
+                'counts': counts,
+            }
+
+        return {'window': self.window, 'stages': stages}
+
+
+planner_timings = PlannerTimings(
+    window=getattr(settings, 'MEAL_PLANNER_TIMINGS', {}).get('WINDOW', 1000),
+)
+
+
+@contextmanager
+def span(stage, **attributes):
+    """
+    Times the block as one span of `stage`. The yielded dict holds the
+    span's attributes, so the block can add what it only learns while
+    running (a solver status, a row count). A block that raises is recorded
+    with the exception's class name as 'error'.
+    """
+    started = time.perf_counter()
+    try:
+        yield attributes
+    except Exception as e:
+        attributes['error'] = type(e).__name__
+        raise
+    finally:
+        planner_timings.record(stage, time.perf_counter() - started, attributes)
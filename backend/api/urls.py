@@ -11,7 +11,11 @@ from .views import (
     NutrientSummaryView, WeeklyNutritionView,
     DayPlanItemView, RegisterView,
     CustomTokenObtainPairView,
-    LogoutView, ProtectedView
+    LogoutView, ProtectedView,
+    PlanCacheStatsView, PlanningJobView, PlanningJobStatusView,
+    RecipeSuggestionsView, PlannerTimingsView,
+    RecipeCacheStatsView, RecipeSearchView,
+    RecipeTextSearchView
 )
 
 from .views import upload_recipes_csv
@@ -27,12 +31,20 @@ urlpatterns = [
   # home
   path('recipes/', RecipeListView.as_view(), name='recipe-list'),
   path('recipes/by-type/', RecipeTypeView.as_view(), name='recipe-by-type'),
+  path('recipes/search/', RecipeSearchView.as_view(), name='recipe-search'),
+  path('recipes/text-search/', RecipeTextSearchView.as_view(), name='recipe-text-search'),
+  path('recipes/cache-stats/', RecipeCacheStatsView.as_view(), name='recipe-cache-stats'),
   path('recipes/<int:pk>/', RecipeDetailView.as_view(), name='recipe-detail'),
+  path('recipes/<int:pk>/suggestions/', RecipeSuggestionsView.as_view(), name='recipe-suggestions'),
   
   #planner
   path('weekly-meal-plan/', WeeklyMealPlanView.as_view(), name='weekly_meal_plan'),
+  path('weekly-meal-plan/jobs/', PlanningJobView.as_view(), name='weekly-meal-plan-jobs'),
+  path('weekly-meal-plan/jobs/<int:job_id>/', PlanningJobStatusView.as_view(), name='weekly-meal-plan-job-status'),
   path('reset-meal-plans/', ResetMealPlansView.as_view(), name='reset-meal-plans'),
   path('nutrient-summary/', NutrientSummaryView.as_view(), name='nutrient-summary'),
+  path('planner/cache-stats/', PlanCacheStatsView.as_view(), name='planner-cache-stats'),
+  path('planner/timings/', PlannerTimingsView.as_view(), name='planner-timings'),
 
   #planner/daily_items
   path('day-plan-items/', DayPlanItemView.as_view(), name='day-plan-items'),
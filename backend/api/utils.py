@@ -1,50 +1,318 @@
+import numpy as np
 import pandas as pd
-from pulp import LpProblem, LpVariable, lpSum, LpMaximize, LpMinimize, PULP_CBC_CMD
 from django.conf import settings
 from api.models import Recipe, Ingredient, RecipeIngredients, DislikedIngredients, UserNutrientPreferences
 from django.contrib.auth import get_user_model
 import csv
+import logging
+import time
 from django.db import transaction
 
+from .cache import bump_user_version, plan_cache
+from .catalog import get_recipe_catalog, parse_nutrient, NUTRIENT_FIELDS
+from .timings import span, planner_timings
+from .summaries import RECIPE_FIELDS, add_delta, apply_summary_deltas
+from .solvers import (NUTRIENT_BOUNDS, MIN_SOLVE_TIME, MODEL_BUILDERS, STATUS_OPTIMAL, STATUS_INFEASIBLE,
+                      STATUS_TRUNCATED, build_weekly_model, greedy_day, run_cbc, get_solver_backend, objective_field)
+
 
 
 
 # api/utils.py
 from datetime import datetime, timedelta
-from .models import DayPlan, DayPlanRecipes, UserRecipeUsage
-
-def plan_meals_for_week(user):
+from django.utils import timezone
+from .models import DayPlan, DayPlanRecipes, UserRecipeUsage, PlanningJob
+
+logger = logging.getLogger(__name__)
+
+def plan_meals_for_week(user, mode=None, progress=None, start_date=None, solver=None, engine=None):
+    """
+    Fills every day of the coming week that has fewer than three recipes.
+
+    In 'weekly' mode the pending days are planned with a single joint solve,
+    in 'daily' mode each day is solved on its own with select_meals.
+    `progress`, if given, is called with the finished fraction of the work.
+    The week starts today unless `start_date` is given. `solver` and
+    `engine` default to their settings.
+
+    All solves share one MEAL_PLANNER_TIME_LIMIT budget. Returns the weakest
+    engine used (see SOLVED_BY), or None if nothing had to be planned.
+    """
+    mode = mode or getattr(settings, 'MEAL_PLANNER_MODE', 'daily')
+    if mode not in ('weekly', 'daily'):
+        raise ValueError(f"Unknown meal planner mode: {mode}")
+
+    with span('plan_week', mode=mode) as attributes:
+        today = datetime.today().date()
+        start_date = start_date or today
+        deadline = get_planning_deadline()
+        solved_by = []
+
+        dates = [start_date + timedelta(days=i) for i in range(7)]
+        with span('load_week'):
+            week = load_week_plans(user, dates)
+            # repeats within the week are ruled out, older ones are only penalized
+            week_recipe_ids = set().union(*(recipe_ids for _, recipe_ids in week.values()))
+            recently_used = get_recent_recipe_usage(user, today)
+
+        pending_dates = [plan_date for plan_date in dates if len(week[plan_date][1]) < 3]
+        attributes['pending_days'] = len(pending_dates)
+        selections = {}
+
+        if mode == 'daily':
+            for i, plan_date in enumerate(dates):
+                if plan_date in pending_dates:
+                    selected_ids, day_solved_by = select_meal_ids(
+                        user, excluded_ids=week_recipe_ids, engine=engine, deadline=deadline, solver=solver,
+                        recently_used=recently_used
+                    )
+                    selections[plan_date] = selected_ids
+                    week_recipe_ids.update(selected_ids)
+                    solved_by.append(day_solved_by)
+                if progress:
+                    progress((i + 1) / 7)
+        elif pending_dates:
+            weekly_selection, week_solved_by = select_meal_ids_for_week(
+                user, days=len(pending_dates), excluded_ids=list(week_recipe_ids), engine=engine, deadline=deadline,
+                solver=solver, recently_used=recently_used
+            )
+            selections = dict(zip(pending_dates, weekly_selection))
+            solved_by.append(week_solved_by)
+            if progress:
+                progress(0.8)
+
+        with span('persist', recipes=sum(len(recipe_ids) for recipe_ids in selections.values())):
+            save_week_plans(user, week, selections, today)
+
+        if progress:
+            progress(1.0)
+
+        attributes['solved_by'] = weakest_solved_by(solved_by)
+        return attributes['solved_by']
+
+
+def get_rotation_options():
+    options = getattr(settings, 'MEAL_PLANNER_ROTATION', {})
+    return options.get('COOL_DOWN_DAYS', 14), options.get('PENALTY', 0.5)
+
+
+def get_recent_recipe_usage(user, today=None):
+    """
+    Recipes the user had within the cool-down window, mapped to the day
+    they were last used. Only the window is read, so the cost does not grow
+    with the length of the user's history.
+    """
+    today = today or datetime.today().date()
+    cool_down_days, penalty = get_rotation_options()
+    if cool_down_days <= 0 or penalty <= 0:
+        return {}
+
+    return dict(UserRecipeUsage.objects.filter(
+        user=user, last_used__gt=today - timedelta(days=cool_down_days)
+    ).values_list('recipe_id', 'last_used'))
+
+
+def apply_rotation_penalty(df, recently_used, optimize_field, objective, today=None):
+    """
+    Adds a 'score' column that the solvers optimize instead of the nutrient:
+    the nutrient value made worse by up to PENALTY (a fraction) for a recipe
+    used today, fading out linearly over the cool-down window.
+    """
+    if not recently_used or df.empty or optimize_field not in df.columns:
+        return df
+
+    today = today or datetime.today().date()
+    cool_down_days, penalty = get_rotation_options()
+    days_ago = np.array([
+        (today - recently_used[recipe_id]).days if recipe_id in recently_used else cool_down_days
+        for recipe_id in df['id']
+    ], dtype=float)
+    recency = np.clip(1 - days_ago / cool_down_days, 0, 1)
+
+    df = df.copy()
+    sign = -1 if objective == 'maximize' else 1
+    df['score'] = df[optimize_field].to_numpy(dtype=float) * (1 + sign * penalty * recency)
+    return df
+
+
+def load_week_plans(user, dates):
+    """
+    Reads the user's day plans for `dates` with one query. Returns a dict
+    date -> (day plan id or None, set of planned recipe ids).
+    """
+    week = {plan_date: (None, set()) for plan_date in dates}
+    rows = DayPlan.objects.filter(user=user, date__in=dates).values_list('id', 'date', 'recipes__recipe_id')
+    for day_plan_id, plan_date, recipe_id in rows:
+        week[plan_date] = (day_plan_id, week[plan_date][1])
+        if recipe_id is not None:
+            week[plan_date][1].add(recipe_id)
+    return week
+
+
+def save_week_plans(user, week, selections, today):
+    """
+    Writes a planned week in one transaction: the missing day plans, the
+    new day plan recipes and the recipe usage of the user, each with a
+    single bulk statement, and the nutrition rollups of the planned days.
+    `week` comes from load_week_plans and `selections` maps dates to the
+    recipe ids picked for them.
+
+    Planners of the same user (a planning job next to a request, say) take
+    turns on a lock of the user's row, and the week is read again under it,
+    so a concurrent writer's day plans are added to rather than created
+    twice.
+    """
+    def changes(week):
+        missing = [
+            DayPlan(user=user, date=plan_date) for plan_date, (day_plan_id, _) in week.items() if day_plan_id is None
+        ]
+        new_rows = [
+            (plan_date, recipe_id)
+            for plan_date, recipe_ids in selections.items()
+            for recipe_id in dict.fromkeys(recipe_ids)
+            if recipe_id not in week[plan_date][1]
+        ]
+        return missing, new_rows
+
+    missing, new_rows = changes(week)
+    if not missing and not new_rows:
+        return
+
+    with transaction.atomic():
+        get_user_model().objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True).get()
+        week = load_week_plans(user, list(week))
+        missing, new_rows = changes(week)
+
+        DayPlan.objects.bulk_create(missing)
+        day_plan_ids = {plan_date: day_plan_id for plan_date, (day_plan_id, _) in week.items()}
+        day_plan_ids.update({day_plan.date: day_plan.id for day_plan in missing})
+
+        if not new_rows:
+            return
+
+        DayPlanRecipes.objects.bulk_create([
+            DayPlanRecipes(day_plan_id=day_plan_ids[plan_date], recipe_id=recipe_id)
+            for plan_date, recipe_id in new_rows
+        ])
+        # bulk_create sends no signals, so the rollups are updated here
+        nutrients = {
+            recipe_id: values for recipe_id, *values in Recipe.objects.filter(
+                id__in={recipe_id for _, recipe_id in new_rows}
+            ).values_list('id', *RECIPE_FIELDS.values())
+        }
+        deltas = {}
+        for plan_date, recipe_id in new_rows:
+            add_delta(deltas, user.id, plan_date, 1, {
+                field: value or 0.0 for field, value in zip(RECIPE_FIELDS, nutrients[recipe_id])
+            })
+        apply_summary_deltas(deltas)
+        bump_user_version(user.id, 'plan')
+        UserRecipeUsage.objects.bulk_create(
+            [
+                UserRecipeUsage(user=user, recipe_id=recipe_id, last_used=today)
+                for recipe_id in dict.fromkeys(recipe_id for _, recipe_id in new_rows)
+            ],
+            update_conflicts=True,
+            unique_fields=['user', 'recipe'],
+            update_fields=['last_used'],
+        )
+
+
+def build_weekly_plan(user):
     today = datetime.today().date()
-    used_recipe_ids = DayPlanRecipes.objects.filter(
-        day_plan__user=user
-    ).values_list('recipe_id', flat=True)
 
+    weekly_plan = []
+    
     for i in range(7):
         plan_date = today + timedelta(days=i)
 
         day_plan, created = DayPlan.objects.get_or_create(user=user, date=plan_date)
 
-        if DayPlanRecipes.objects.filter(day_plan=day_plan).count() >= 3:
-            continue
+        recipes = DayPlanRecipes.objects.filter(day_plan=day_plan).select_related('recipe')
+        recipe_data = [
+            {
+                'id': recipe.recipe.id,
+                'title': recipe.recipe.title,
+                'meal_type': recipe.recipe.meal_type,
+                'total_calories': recipe.recipe.total_calories,
+                'description':recipe.recipe.description,
+            }
+            for recipe in recipes
+        ]
+
+        weekly_plan.append({
+            'date': plan_date.strftime('%Y-%m-%d'),  
+            'recipes': recipe_data,
+        })
+
+    return weekly_plan
+
+
+def enqueue_planning_job(user):
+    """
+    Returns the user's unfinished planning job, or queues a new one. A user
+    tapping "plan" repeatedly therefore never fills the queue with duplicates.
+    """
+    job = PlanningJob.objects.filter(
+        user=user,
+        status__in=[PlanningJob.STATUS_PENDING, PlanningJob.STATUS_RUNNING]
+    ).order_by('created_at').first()
 
-        selected_recipes = select_meals(user, excluded_ids=used_recipe_ids)
-        
-        for recipe in selected_recipes:
-            if not DayPlanRecipes.objects.filter(day_plan=day_plan, recipe=recipe).exists():
-                DayPlanRecipes.objects.create(day_plan=day_plan, recipe=recipe)
+    if job is None:
+        job = PlanningJob.objects.create(user=user)
+
+    return job
 
-                UserRecipeUsage.objects.update_or_create(
-                    user=user,
-                    recipe=recipe,
-                    defaults={'last_used': today}
-                )
 
+def claim_planning_job():
+    """
+    Takes the oldest pending job. The status check in the UPDATE makes the
+    claim safe when several workers poll the same queue.
+    """
+    candidates = PlanningJob.objects.filter(
+        status=PlanningJob.STATUS_PENDING
+    ).order_by('created_at').values_list('id', flat=True)[:10]
 
+    for job_id in candidates:
+        claimed = PlanningJob.objects.filter(
+            id=job_id, status=PlanningJob.STATUS_PENDING
+        ).update(status=PlanningJob.STATUS_RUNNING, started_at=timezone.now(), progress=0)
+        if claimed:
+            return PlanningJob.objects.select_related('user').get(id=job_id)
+
+    return None
+
+
+def run_planning_job(job):
+    def report(fraction):
+        PlanningJob.objects.filter(id=job.id).update(progress=int(fraction * 100))
+
+    try:
+        solved_by = plan_meals_for_week(job.user, progress=report)
+        job.result = {'weekly_plan': build_weekly_plan(job.user), 'engine': solved_by}
+        job.status = PlanningJob.STATUS_DONE
+        job.progress = 100
+    except Exception as e:
+        job.status = PlanningJob.STATUS_FAILED
+        job.error = str(e)
 
-def select_meals(user, optimize_field='protein', objective='maximize', excluded_ids=[]):
-    user_preferences = UserNutrientPreferences.objects.get(user=user)
-    diet_type = user_preferences.diet_type
+    job.finished_at = timezone.now()
+    job.save(update_fields=['result', 'status', 'progress', 'error', 'finished_at'])
+    return job
 
+
+def requeue_stale_planning_jobs(max_age):
+    """
+    Puts jobs that have been 'running' for longer than `max_age` back in the
+    queue, e.g. after a worker was killed mid-job.
+    """
+    return PlanningJob.objects.filter(
+        status=PlanningJob.STATUS_RUNNING,
+        started_at__lt=timezone.now() - max_age
+    ).update(status=PlanningJob.STATUS_PENDING, started_at=None, progress=0)
+
+
+def resolve_objective(diet_type, optimize_field='protein', objective='maximize'):
     if diet_type == 'low_calories':
         optimize_field = 'total_calories'
         objective = 'minimize'
@@ -58,9 +326,69 @@ def select_meals(user, optimize_field='protein', objective='maximize', excluded_
         if nutrient in valid_nutrients:
             optimize_field = nutrient
             objective = 'minimize' if diet_type.startswith('low_') else 'maximize'
-    
-    
-    
+
+    return optimize_field, objective
+
+
+def get_disliked_ingredient_ids(user):
+    return list(DislikedIngredients.objects.filter(user=user).values_list('ingredient_id', flat=True))
+
+
+def exclude_disliked_recipes(recipes, user, disliked_ids=None):
+    """
+    Drops every recipe with one of the user's disliked ingredients from the
+    `recipes` queryset, using the catalog's ingredient bitsets instead of a
+    join on RecipeIngredients. Pass `disliked_ids` when already loaded.
+    """
+    if disliked_ids is None:
+        disliked_ids = get_disliked_ingredient_ids(user)
+    if not disliked_ids:
+        return recipes
+    return recipes.exclude(id__in=get_disliked_recipe_ids(disliked_ids))
+
+
+def get_disliked_recipe_ids(disliked_ids):
+    """
+    Ids of the recipes with any of the `disliked_ids` ingredients, read
+    from the catalog's ingredient bitsets.
+    """
+    if not disliked_ids:
+        return []
+    catalog = get_recipe_catalog()
+    return catalog.ids[catalog.containing(disliked_ids)].tolist()
+
+
+def search_recipes(user, meal_type=None, sort='id', disliked_ids=None, **ranges):
+    """
+    Recipes within the min_<field>/max_<field> bounds of `ranges` (see
+    RecipeSearchSerializer), of `meal_type` when given and without the
+    user's disliked ingredients. Every bound and the meal type is served by
+    an index on Recipe. Recipes without a value for the `sort` field are
+    left out, so the cursor of a sorted page always has a position.
+    """
+    recipes = Recipe.objects.all()
+    if meal_type:
+        recipes = recipes.filter(meal_type=meal_type)
+    for name, value in ranges.items():
+        if value is not None:
+            bound, field = name.split('_', 1)
+            recipes = recipes.filter(**{f'{field}__{"gte" if bound == "min" else "lte"}': value})
+    if sort.lstrip('-') != 'id':
+        recipes = recipes.filter(**{f'{sort.lstrip("-")}__isnull': False})
+    return exclude_disliked_recipes(recipes, user, disliked_ids).order_by(sort, 'id')
+
+
+def load_candidate_recipes(user, excluded_ids=(), disliked_ingredients=None):
+    if disliked_ingredients is None:
+        disliked_ingredients = DislikedIngredients.objects.filter(user=user).values_list('ingredient_id', flat=True)
+
+    with span('candidates') as attributes:
+        df = get_recipe_catalog().candidates(excluded_ids, disliked_ingredients)
+        attributes['candidates'] = len(df)
+    return df
+
+
+def get_planner_preferences(user):
     preferences, created = UserNutrientPreferences.objects.get_or_create(
         user=user,
         defaults={
@@ -82,88 +410,333 @@ def select_meals(user, optimize_field='protein', objective='maximize', excluded_
             'max_potassium': 0
         }
     )
+    return preferences
 
-    disliked_ingredients = DislikedIngredients.objects.filter(user=user).values_list('ingredient_id', flat=True)
 
-    recipes = Recipe.objects.exclude(
-        recipeingredients__ingredient__in=disliked_ingredients
-    ).exclude(
-        id__in=excluded_ids
-    ).values(
-        'id', 'title', 'total_calories', 'sugars', 'protein', 'fat', 'carbohydrates', 'fiber', 'iron', 'potassium', 'meal_type'
-    )
+# Which engine produced a plan, from the best to the weakest guarantee.
+SOLVED_BY = [
+    'cbc', 'branch_and_bound', 'branch_and_bound_truncated',
+    'cbc_time_limit', 'branch_and_bound_time_limit',
+    'greedy', 'greedy_time_limit',
+]
 
-    df = pd.DataFrame(list(recipes))
+# Results produced under time pressure may be better next time, and a
+# truncated search is not optimal, so only these are cached.
+CACHEABLE_SOLVED_BY = {'cbc', 'branch_and_bound', 'greedy'}
 
-    if df.empty:
-        return Recipe.objects.none()
+OPTIMAL_SOLVED_BY = {'cbc', 'branch_and_bound'}
 
-    for field in ['total_calories', 'sugars', 'protein','fat','carbohydrates','fiber', 'iron', 'potassium']:
-        df[field] = pd.to_numeric(df[field], errors='coerce')
+def weakest_solved_by(values):
+    values = [value for value in values if value]
+    if not values:
+        return None
+    return max(values, key=SOLVED_BY.index)
 
-    df.dropna(subset=['total_calories', 'sugars', 'protein','fat','carbohydrates','fiber', 'iron', 'potassium'], inplace=True)
 
-    model = LpProblem("Meal_Selection", LpMaximize if objective == 'maximize' else LpMinimize)
+def get_planning_deadline():
+    return time.monotonic() + getattr(settings, 'MEAL_PLANNER_TIME_LIMIT', 5)
 
-    meal_vars = [LpVariable(f"meal_{i}", cat='Binary') for i in df.index]
 
-    model += lpSum(meal_vars) <= 6, "Max_Meals"
-    
-    
-    
-    if optimize_field in df.columns:
-        model += lpSum(df.loc[i, optimize_field] * meal_vars[i] for i in df.index), f"{objective.capitalize()}_{optimize_field.capitalize()}"
+def prune_candidates(df, preferences, optimize_field, objective, days=1, top_k=None):
+    """
+    Shrinks the candidate frame before the model is built:
 
+    1. recipes that alone exceed an active maximum bound can never be picked;
+    2. optionally only the `top_k` best recipes per meal type and day are
+       kept. Unlike the first stage this one can cost solution quality.
 
-    if preferences.min_calories > 0 and preferences.max_calories > 0:
-        model += lpSum(df.loc[i, 'total_calories'] * meal_vars[i] for i in df.index) >= preferences.min_calories, "Min_Calories"
-        model += lpSum(df.loc[i, 'total_calories'] * meal_vars[i] for i in df.index) <= preferences.max_calories, "Max_Calories"
-    
-    if preferences.min_sugars > 0 and preferences.max_sugars > 0:
-        model += lpSum(df.loc[i, 'sugars'] * meal_vars[i] for i in df.index) >= preferences.min_sugars, "Min_Sugars"
-        model += lpSum(df.loc[i, 'sugars'] * meal_vars[i] for i in df.index) <= preferences.max_sugars, "Max_Sugars"
-    
-    if preferences.min_iron > 0 and preferences.max_iron > 0:
-        model += lpSum(df.loc[i, 'iron'] * meal_vars[i] for i in df.index) >= preferences.min_iron, "Min_Iron"
-        model += lpSum(df.loc[i, 'iron'] * meal_vars[i] for i in df.index) <= preferences.max_iron, "Max_Iron"
-    
-    if preferences.min_potassium > 0 and preferences.max_potassium > 0:
-        model += lpSum(df.loc[i, 'potassium'] * meal_vars[i] for i in df.index) >= preferences.min_potassium, "Min_Potassium"
-        model += lpSum(df.loc[i, 'potassium'] * meal_vars[i] for i in df.index) <= preferences.max_potassium, "Max_Potassium"
-    
-    if preferences.min_protein > 0 and preferences.max_protein > 0:
-        model += lpSum(df.loc[i, 'protein'] * meal_vars[i] for i in df.index) >= preferences.min_protein, "Min_Protein"
-        model += lpSum(df.loc[i, 'protein'] * meal_vars[i] for i in df.index) <= preferences.max_protein, "Max_Protein"
-    
-    if preferences.min_fat > 0 and preferences.max_fat > 0:
-        model += lpSum(df.loc[i, 'fat'] * meal_vars[i] for i in df.index) >= preferences.min_fat, "Min_Fat"
-        model += lpSum(df.loc[i, 'fat'] * meal_vars[i] for i in df.index) <= preferences.max_fat, "Max_Fat"
-    
-    if preferences.min_carbohydrates > 0 and preferences.max_carbohydrates > 0:
-        model += lpSum(df.loc[i, 'carbohydrates'] * meal_vars[i] for i in df.index) >= preferences.min_carbohydrates, "Min_Carbohydrates"
-        model += lpSum(df.loc[i, 'carbohydrates'] * meal_vars[i] for i in df.index) <= preferences.max_carbohydrates, "Max_Carbohydrates"
-    
-    if preferences.min_fiber > 0 and preferences.max_fiber > 0:
-        model += lpSum(df.loc[i, 'fiber'] * meal_vars[i] for i in df.index) >= preferences.min_fiber, "Min_Fiber"
-        model += lpSum(df.loc[i, 'fiber'] * meal_vars[i] for i in df.index) <= preferences.max_fiber, "Max_Fiber"
-    
+    Returns the pruned frame and the candidate count after every stage.
+    """
+    started = time.perf_counter()
+    stats = {'candidates': len(df)}
 
-    for meal_type in ['lunch', 'dinner', 'snack', 'breakfast']:
-        indices = df.index[df['meal_type'] == meal_type].tolist()
-        if indices:
-            model += lpSum(meal_vars[i] for i in indices) >= 1, f"At_Least_One_{meal_type.capitalize()}"
+    mask = np.ones(len(df), dtype=bool)
+    for field, min_attr, max_attr, label in NUTRIENT_BOUNDS:
+        min_value = getattr(preferences, min_attr)
+        max_value = getattr(preferences, max_attr)
+        if min_value > 0 and max_value > 0:
+            mask &= df[field].to_numpy(dtype=float) <= max_value
+    pruned = df[mask]
+    stats['after_bounds'] = len(pruned)
 
-    model.solve(PULP_CBC_CMD(msg=False))
-    
-    selected_ids = [df.loc[i, 'id'] for i in df.index if meal_vars[i].varValue == 1]
+    if top_k:
+        field = objective_field(pruned, optimize_field)
+        if field is not None:
+            pruned = pruned.sort_values(field, ascending=(objective != 'maximize'), kind='stable')
+        pruned = pruned.groupby('meal_type', sort=False).head(top_k * days)
+    stats['after_top_k'] = len(pruned)
+
+    pruned = pruned.sort_index().reset_index(drop=True)
+    stats['seconds'] = time.perf_counter() - started
+
+    planner_timings.record('prune', stats['seconds'], {
+        name: value for name, value in stats.items() if name != 'seconds'
+    })
+    return pruned, stats
+
+
+def get_pruning_options(prune=None, top_k=None):
+    options = getattr(settings, 'MEAL_PLANNER_PRUNING', {})
+    return (
+        options.get('ENABLED', True) if prune is None else prune,
+        options.get('TOP_K') if top_k is None else top_k,
+    )
+
+
+def solve_day(df, preferences, optimize_field, objective, engine=None, deadline=None, prune=None, top_k=None,
+              solver=None):
+    """
+    Returns the selected recipe ids and the engine that produced them.
+    """
+    engine = engine or getattr(settings, 'MEAL_PLANNER_ENGINE', 'vectorized')
+    if engine not in MODEL_BUILDERS:
+        raise ValueError(f"Unknown meal planner engine: {engine}")
+    backend = get_solver_backend(solver)
+
+    deadline = deadline or get_planning_deadline()
+    if deadline - time.monotonic() < MIN_SOLVE_TIME:
+        return greedy_day(df, preferences, optimize_field, objective), 'greedy_time_limit'
+
+    prune, top_k = get_pruning_options(prune, top_k)
+    candidates = prune_candidates(df, preferences, optimize_field, objective, top_k=top_k)[0] if prune else df
+
+    positions, status = backend.solve(candidates, preferences, optimize_field, objective, deadline, engine)
+
+    if status == STATUS_INFEASIBLE and len(candidates) < len(df):
+        # the top-K cut may have removed every feasible combination
+        candidates = df
+        positions, status = backend.solve(candidates, preferences, optimize_field, objective, deadline, engine)
+
+    if positions is None:
+        fallback = 'greedy' if status == STATUS_INFEASIBLE else 'greedy_time_limit'
+        return greedy_day(df, preferences, optimize_field, objective), fallback
+
+    if status == STATUS_OPTIMAL:
+        solved_by = backend.name
+    elif status == STATUS_TRUNCATED:
+        solved_by = f'{backend.name}_truncated'
+    else:
+        solved_by = f'{backend.name}_time_limit'
+    return [candidates['id'].iat[i] for i in positions], solved_by
+
+
+def evaluate_pruning(user, top_k=None, days=1):
+    """
+    Solves the user's plan with and without candidate pruning and reports
+    the objective value and solve time of both, so the quality given up by
+    the top-K cut can be weighed against the time it saves.
+    """
+    preferences = get_planner_preferences(user)
+    optimize_field, objective = resolve_objective(preferences.diet_type)
+    disliked_ids = get_disliked_ingredient_ids(user)
+    top_k = top_k or get_pruning_options()[1]
+
+    df = load_candidate_recipes(user, (), disliked_ids)
+    report = {'user': user.id, 'candidates': len(df)}
+    if df.empty:
+        return report
+
+    report['pruned_candidates'] = prune_candidates(
+        df, preferences, optimize_field, objective, days=days, top_k=top_k
+    )[1]['after_top_k']
+
+    objective_values = df.set_index('id')[optimize_field] if optimize_field in df.columns else None
+    for label, prune in (('full', False), ('pruned', True)):
+        started = time.perf_counter()
+        deadline = time.monotonic() + 3600
+        if days == 1:
+            day_ids, solved_by = solve_day(
+                df, preferences, optimize_field, objective, deadline=deadline, prune=prune, top_k=top_k
+            )
+            selected_ids = [day_ids]
+        else:
+            selected_ids, solved_by = solve_week(
+                user, preferences, optimize_field, objective, days, (), disliked_ids,
+                deadline=deadline, prune=prune, top_k=top_k
+            )
+        report[f'{label}_seconds'] = time.perf_counter() - started
+        report[f'{label}_solved_by'] = solved_by
+        report[f'{label}_objective'] = (
+            float(sum(objective_values.loc[list(day_ids)].sum() for day_ids in selected_ids))
+            if objective_values is not None else None
+        )
+
+    return report
+
+
+def select_meal_ids(user, optimize_field='protein', objective='maximize', excluded_ids=(), engine=None, deadline=None,
+                    solver=None, recently_used=None):
+    """
+    Returns the ids picked for one day and the engine that picked them.
+    `recently_used` (see get_recent_recipe_usage) is read when not given.
+    """
+    with span('select_day') as attributes:
+        preferences = get_planner_preferences(user)
+        optimize_field, objective = resolve_objective(preferences.diet_type, optimize_field, objective)
+        engine = engine or getattr(settings, 'MEAL_PLANNER_ENGINE', 'vectorized')
+        solver = solver or get_solver_backend().name
+        if recently_used is None:
+            recently_used = get_recent_recipe_usage(user)
+
+        disliked_ids = get_disliked_ingredient_ids(user)
+        excluded_ids = list(excluded_ids)
+        cache_key = plan_cache.make_key(
+            'day', preferences, optimize_field, objective, disliked_ids, excluded_ids, engine=engine, solver=solver
+        )
+
+        cached = plan_cache.get(cache_key)
+        attributes['cached'] = cached is not None and fits_rotation(cached[0], cached[1], recently_used)
+        if attributes['cached']:
+            attributes['solved_by'] = cached[1]
+            return cached
+
+        df = load_candidate_recipes(user, excluded_ids, disliked_ids)
+        if df.empty:
+            return [], None
+        df = apply_rotation_penalty(df, recently_used, optimize_field, objective)
+
+        selected_ids, solved_by = solve_day(df, preferences, optimize_field, objective, engine, deadline, solver=solver)
+        selected_ids = [int(i) for i in selected_ids]
+        attributes['solved_by'] = solved_by
+        if solved_by in CACHEABLE_SOLVED_BY and not recently_used:
+            plan_cache.set(cache_key, (selected_ids, solved_by))
+
+        return selected_ids, solved_by
+
+
+def fits_rotation(selected_ids, solved_by, recently_used):
+    """
+    Whether a cached plan, solved without the rotation penalty, is also the
+    plan for a user who used `recently_used` lately. The penalty only makes
+    those recipes worse, so an optimal plan without any of them stays
+    optimal. Plans solved with a penalty are not cached: the shared entries
+    must not depend on one user's history.
+    """
+    if not recently_used:
+        return True
+    return solved_by in OPTIMAL_SOLVED_BY and recently_used.keys().isdisjoint(selected_ids)
+
+
+def select_meals(user, optimize_field='protein', objective='maximize', excluded_ids=[], engine=None, solver=None):
+    selected_ids, solved_by = select_meal_ids(user, optimize_field, objective, excluded_ids, engine, solver=solver)
     
     selected_meals = Recipe.objects.filter(id__in=selected_ids)
 
     return selected_meals
 
 
-    
+def select_meal_ids_for_week(user, days=7, optimize_field='protein', objective='maximize', excluded_ids=(), engine=None, deadline=None,
+                             solver=None, recently_used=None):
+    """
+    Plans `days` days with one data load and one joint solve. Returns one
+    list of recipe ids per day and the weakest engine used for any of them.
+    When the joint model is infeasible (usually a catalog too small for a
+    week without repeats) or unfinished within MEAL_PLANNER_WEEKLY_TIME_SHARE
+    of the time left, the days are solved one after another on the already
+    loaded candidates instead.
+    """
+    with span('select_week') as attributes:
+        preferences = get_planner_preferences(user)
+        optimize_field, objective = resolve_objective(preferences.diet_type, optimize_field, objective)
+
+        solver = solver or get_solver_backend().name
+        if recently_used is None:
+            recently_used = get_recent_recipe_usage(user)
+
+        disliked_ids = get_disliked_ingredient_ids(user)
+        excluded_ids = list(excluded_ids)
+        cache_key = plan_cache.make_key(
+            'week', preferences, optimize_field, objective, disliked_ids, excluded_ids, days=days, engine=engine,
+            solver=solver
+        )
+
+        cached = plan_cache.get(cache_key)
+        attributes['cached'] = cached is not None and fits_rotation(
+            [recipe_id for day_ids in cached[0] for recipe_id in day_ids], cached[1], recently_used
+        )
+        if attributes['cached']:
+            attributes['solved_by'] = cached[1]
+            return cached
+
+        selected_ids, solved_by = solve_week(
+            user, preferences, optimize_field, objective, days, excluded_ids, disliked_ids, engine, deadline,
+            solver=solver, recently_used=recently_used
+        )
+        attributes['solved_by'] = solved_by
+        if solved_by in CACHEABLE_SOLVED_BY and not recently_used:
+            plan_cache.set(cache_key, (selected_ids, solved_by))
+
+        return selected_ids, solved_by
+
+
+def select_meals_for_week(user, days=7, optimize_field='protein', objective='maximize', excluded_ids=(), engine=None,
+                          solver=None):
+    selected_ids, solved_by = select_meal_ids_for_week(
+        user, days, optimize_field, objective, excluded_ids, engine, solver=solver
+    )
 
+    recipes = Recipe.objects.in_bulk([recipe_id for day_ids in selected_ids for recipe_id in day_ids])
+
+    return [[recipes[recipe_id] for recipe_id in day_ids] for day_ids in selected_ids]
+
+
+def solve_week(user, preferences, optimize_field, objective, days, excluded_ids, disliked_ids, engine=None, deadline=None,
+               prune=None, top_k=None, solver=None, recently_used=None):
+    df = load_candidate_recipes(user, excluded_ids, disliked_ids)
+
+    if df.empty:
+        return [[] for _ in range(days)], None
+    df = apply_rotation_penalty(df, recently_used, optimize_field, objective)
+
+    deadline = deadline or get_planning_deadline()
+    backend = get_solver_backend(solver)
+
+    prune, top_k = get_pruning_options(prune, top_k)
+    candidates = df
+    if prune:
+        candidates = prune_candidates(df, preferences, optimize_field, objective, days=days, top_k=top_k)[0]
+
+    selected_ids = None
+    if backend.supports_weekly:
+        with span('week_build', candidates=len(candidates), days=days) as attributes:
+            model, meal_vars = build_weekly_model(candidates, preferences, optimize_field, objective, days)
+            attributes.update(variables=len(candidates) * days, constraints=len(model.constraints))
+
+        # the joint model only gets its share of the time left: a week it cannot
+        # finish in time is solved day by day in the rest, which is much faster
+        # than the joint model on big catalogs
+        time_share = getattr(settings, 'MEAL_PLANNER_WEEKLY_TIME_SHARE', 0.5)
+        week_deadline = time.monotonic() + time_share * (deadline - time.monotonic())
+        with span('week_solve', solver=backend.name) as attributes:
+            # The days are interchangeable, so proving the last fraction of a percent
+            # of optimality is very expensive. Stop at a small relative gap instead.
+            status = attributes['status'] = run_cbc(
+                model, week_deadline, gapRel=getattr(settings, 'MEAL_PLANNER_WEEKLY_GAP', 0.005)
+            )
+        if status == STATUS_OPTIMAL:
+            solved_by = backend.name
+            selected_ids = [
+                [candidates.loc[i, 'id'] for i in candidates.index if day_vars[i].varValue == 1]
+                for day_vars in meal_vars
+            ]
+
+    if selected_ids is None:
+        selected_ids = []
+        day_solved_by = []
+        remaining = df
+        for day in range(days):
+            if remaining.empty:
+                selected_ids.append([])
+                continue
+            day_ids, day_engine = solve_day(
+                remaining, preferences, optimize_field, objective, engine, deadline, prune, top_k, backend.name
+            )
+            selected_ids.append(day_ids)
+            day_solved_by.append(day_engine)
+            remaining = remaining[~remaining['id'].isin(day_ids)].reset_index(drop=True)
+        solved_by = weakest_solved_by(day_solved_by)
+
+    return [[int(recipe_id) for recipe_id in day_ids] for day_ids in selected_ids], solved_by
 
 
 def upload_recipes_from_csv(file_path):
@@ -171,6 +744,8 @@ def upload_recipes_from_csv(file_path):
         with open(file_path, newline='', encoding='utf-8') as csvfile:
             reader = csv.DictReader(csvfile, delimiter=';')
 
+            unparseable = []
+
             # Use a transaction to ensure atomicity
             with transaction.atomic():
                 for row in reader:
@@ -178,18 +753,14 @@ def upload_recipes_from_csv(file_path):
                     recipe_data = {
                         'title': row['name'],
                         'description': row['short_description'],
-                        'total_calories': row['total_calories'],
-                        'carbohydrates': row['carbohydrates'],
-                        'fat': row['fat'],
-                        'fiber': row['fiber'],
-                        'sugars': row['sugars'],
-                        'protein': row['protein'],
-                        'iron': row['iron'],
-                        'potassium': row['potassium'],
                         'preparation_time': int(row['preparation_time']),
                         'preparation_guide': row['preparation_guide'],
                         'meal_type': row['meal_type'],
                     }
+                    for field in NUTRIENT_FIELDS:
+                        recipe_data[field] = parse_nutrient(row[field])
+                        if recipe_data[field] is None and row[field].strip():
+                            unparseable.append(f"{row['name']} {field}: {row[field]!r}")
 
                     # Create the Recipe object
                     recipe = Recipe.objects.create(**recipe_data)
@@ -225,6 +796,9 @@ def upload_recipes_from_csv(file_path):
                                 unit=unit,
                             )
 
+        if unparseable:
+            logger.warning("Nutrient values left empty on upload: %s", "; ".join(unparseable))
+            return True, f"Recipes uploaded successfully! {len(unparseable)} nutrient value(s) could not be parsed and were left empty."
         return True, 'Recipes uploaded successfully!'
     except Exception as e:
         return False, str(e)
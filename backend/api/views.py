@@ -3,31 +3,63 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.utils.timezone import now
+from django.db import transaction
 from django.db.models import Case, When, Value, IntegerField, Sum, F
 from decimal import Decimal
-from django.db.models.functions import Cast
 from django.db.models.fields import IntegerField
 from datetime import timedelta, datetime
+from functools import wraps
 
 from .models import (Recipe, Ingredient,
                      DayPlan, DayPlanRecipes,
                      UserWeight,DislikedIngredients,
                      UserNutrientPreferences,Cart,
                      Ingredient, CartIngredient,
-                     DayPlanItem
+                     DayPlanItem, PlanningJob, DailySummary
 )
 
 from .serializers import (
     RecipeSerializer, UserWeightSerializer,
     DislikedIngredientsSerializer, UserNutrientPreferencesSerializer,
     DietTypeSerializer,RegisterSerializer,
-    AllIngredientSerializer
+    AllIngredientSerializer, RecipeSearchSerializer
 )
-from .utils import  upload_recipes_from_csv, plan_meals_for_week
+from .utils import  (upload_recipes_from_csv, plan_meals_for_week, build_weekly_plan, enqueue_planning_job,
+                      exclude_disliked_recipes, get_disliked_ingredient_ids, get_disliked_recipe_ids,
+                      search_recipes)
+from .cache import bump_user_version, make_etag, plan_cache, recipe_responses
+from .pagination import RecipeCursorPagination
+from .timings import planner_timings
+from .catalog import get_recipe_catalog
+from .summaries import summaries_suspended, rebuild_summaries
+from .search import search_recipe_text
+
+def conditional_get(**stamps):
+    """
+    Decorates a GET handler: a 200 response is tagged with the strong ETag
+    make_etag(request, **stamps) returns, and a request whose If-None-Match
+    has that tag is answered 304 Not Modified without running the handler.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            etag = quote_etag(make_etag(request, **stamps))
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = method(self, request, *args, **kwargs)
+            if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+                response.headers['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
 
 # user auth
 class RegisterView(APIView):
@@ -126,24 +158,169 @@ class UserDislikedIngredientsView(APIView):
                 for ingredient_id in ingredient_ids
             ]
             DislikedIngredients.objects.bulk_create(disliked_ingredients)
+            bump_user_version(user.id, 'preferences')
 
             return Response({"message": "Disliked ingredients saved successfully."}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # recipes
 class RecipeDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Recipe.objects.all()
+    queryset = RecipeSerializer.setup_eager_loading(Recipe.objects.all())
     serializer_class = RecipeSerializer
 
+    @conditional_get(catalog=True)
+    def retrieve(self, request, *args, **kwargs):
+        content = recipe_responses.get_or_render(
+            ('recipe', kwargs['pk']),
+            lambda: JSONRenderer().render(self.get_serializer(self.get_object()).data)
+        )
+        return HttpResponse(content, content_type='application/json')
+
+def wants_disliked_excluded(request):
+    return request.query_params.get('exclude_disliked', '').lower() in ('1', 'true', 'yes')
+
+def get_requested_recipe_fields(request):
+    """
+    The recipe fields asked for with ?fields=id,title,... or ?compact=1,
+    None for the full representation.
+    """
+    if 'fields' in request.query_params:
+        return RecipeSerializer.parse_fields(request.query_params['fields'])
+    if request.query_params.get('compact', '').lower() in ('1', 'true', 'yes'):
+        return RecipeSerializer.COMPACT_FIELDS
+    return None
+
+def render_recipes(request, recipes, view, paginator=None):
+    """
+    The `recipes` queryset rendered to JSON with the requested fields, as
+    one page of `paginator`, or of a RecipeCursorPagination when the
+    request has a cursor or a limit, and whole otherwise. Columns and
+    ingredients left out of the response are not loaded.
+    """
+    if paginator is None and RecipeCursorPagination.requested(request):
+        paginator = RecipeCursorPagination()
+
+    fields = get_requested_recipe_fields(request)
+    if fields is None or 'ingredients' in fields:
+        recipes = RecipeSerializer.setup_eager_loading(recipes)
+    if fields is not None:
+        loaded = [name for name in fields if name != 'ingredients']
+        if paginator is not None:
+            # the cursor is read from the first ordering field
+            loaded.append(paginator.ordering[0].lstrip('-'))
+        recipes = recipes.only(*loaded)
+
+    if paginator is not None:
+        page = paginator.paginate_queryset(recipes, request, view=view)
+        data = paginator.get_paginated_response(RecipeSerializer(page, many=True, fields=fields).data).data
+    else:
+        data = RecipeSerializer(recipes, many=True, fields=fields).data
+    return JSONRenderer().render(data)
+
+def list_recipes(request, recipes, view):
+    """
+    render_recipes through the response cache. The listing is the same for
+    every user except for the disliked ingredients it may leave out.
+    """
+    parts = ['list', request.build_absolute_uri()]
+    disliked_ids = None
+    if wants_disliked_excluded(request):
+        disliked_ids = get_disliked_ingredient_ids(request.user)
+        parts.append(sorted(disliked_ids))
+
+    def render():
+        listed = recipes if disliked_ids is None else exclude_disliked_recipes(recipes, request.user, disliked_ids)
+        return render_recipes(request, listed, view)
+
+    content = recipe_responses.get_or_render(parts, render)
+    return HttpResponse(content, content_type='application/json')
+
 class RecipeListView(APIView):
     permission_classes = [IsAuthenticated]
+    @conditional_get(user_scopes=('preferences',), catalog=True)
     def get(self, request):
-        recipes = Recipe.objects.all()
-        serializer = RecipeSerializer(recipes, many=True)
-        return Response(serializer.data)
+        return list_recipes(request, Recipe.objects.all(), self)
     
+class RecipeSearchView(APIView):
+    """
+    Recipes by nutrient and preparation time ranges, see
+    RecipeSearchSerializer for the parameters. Always paginated and always
+    without the caller's disliked ingredients; takes fields and compact
+    like the recipe list.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @conditional_get(user_scopes=('preferences',), catalog=True)
+    def get(self, request):
+        params = RecipeSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        disliked_ids = get_disliked_ingredient_ids(request.user)
+
+        def render():
+            paginator = RecipeCursorPagination()
+            paginator.ordering = (params.validated_data['sort'], 'id')
+            recipes = search_recipes(request.user, disliked_ids=disliked_ids, **params.validated_data)
+            return render_recipes(request, recipes, self, paginator)
+
+        content = recipe_responses.get_or_render(
+            ['search', request.build_absolute_uri(), sorted(disliked_ids)], render
+        )
+        return HttpResponse(content, content_type='application/json')
+
+class RecipeTextSearchView(APIView):
+    """
+    Recipes matching every word of `q` in their title, ingredients,
+    description or preparation guide, best first with their rank, see
+    api/search.py. Takes meal_type, exclude_disliked, limit (up to 100)
+    and fields or compact like the recipe list.
+    """
+    permission_classes = [IsAuthenticated]
+    max_limit = 100
+
+    @conditional_get(user_scopes=('preferences',), catalog=True)
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "q is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), self.max_limit)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return Response({"error": "limit must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        parts = ['text_search', request.build_absolute_uri()]
+        disliked_ids = []
+        if wants_disliked_excluded(request):
+            disliked_ids = get_disliked_ingredient_ids(request.user)
+            parts.append(sorted(disliked_ids))
+
+        def render():
+            fields = get_requested_recipe_fields(request)
+            ranked = search_recipe_text(
+                query, limit, request.query_params.get('meal_type'), get_disliked_recipe_ids(disliked_ids)
+            )
+
+            recipes = Recipe.objects.all()
+            if fields is None or 'ingredients' in fields:
+                recipes = RecipeSerializer.setup_eager_loading(recipes)
+            if fields is not None:
+                recipes = recipes.only(*[name for name in fields if name != 'ingredients'])
+            recipes = recipes.in_bulk([recipe_id for recipe_id, _ in ranked])
+
+            results = [
+                {**RecipeSerializer(recipes[recipe_id], fields=fields).data, 'rank': round(rank, 6)}
+                for recipe_id, rank in ranked
+                if recipe_id in recipes
+            ]
+            return JSONRenderer().render({"query": query, "results": results})
+
+        content = recipe_responses.get_or_render(parts, render)
+        return HttpResponse(content, content_type='application/json')
+
 class RecipeTypeView(APIView):
     permission_classes = [IsAuthenticated]
+    @conditional_get(user_scopes=('preferences',), catalog=True)
     def get(self, request):
         meal_type = request.query_params.get('meal_type', None)
         
@@ -152,8 +329,7 @@ class RecipeTypeView(APIView):
         else:
             recipes = Recipe.objects.all()
         
-        serializer = RecipeSerializer(recipes, many=True)
-        return Response(serializer.data)
+        return list_recipes(request, recipes, self)
     
 
 # user_screen 
@@ -188,6 +364,7 @@ class UpdateWeightView(APIView):
 class UserWeightListView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_get(user_scopes=('weights',))
     def get(self, request):
         user = request.user
         user_weights = UserWeight.objects.filter(user=user).order_by('-date')  # Optionally order by date
@@ -286,7 +463,7 @@ class CartAPIView(APIView):
 
         elif recipe_id:
             try:
-                recipe = Recipe.objects.get(id=recipe_id)
+                recipe = RecipeSerializer.setup_eager_loading(Recipe.objects.all()).get(id=recipe_id)
                 serializer = RecipeSerializer(recipe)
                 ingredients = serializer.data.get('ingredients')
 
@@ -328,6 +505,7 @@ class CartAPIView(APIView):
                 return Response({"message": "Recipe not found."}, status=status.HTTP_404_NOT_FOUND)
 
         return Response({"message": "No ingredients or recipe ID provided."}, status=status.HTTP_400_BAD_REQUEST)
+    @conditional_get(user_scopes=('cart',), catalog=True)
     def get(self, request):
         """
         Retrieves the ingredients in the user's cart.
@@ -392,35 +570,11 @@ class CartAPIView(APIView):
 class WeeklyMealPlanView(APIView):
     def post(self, request):
         user = request.user  
-        plan_meals_for_week(user)
-        today = datetime.today().date()
-
-        weekly_plan = []
-        
-        for i in range(7):
-            plan_date = today + timedelta(days=i)
-
-            day_plan, created = DayPlan.objects.get_or_create(user=user, date=plan_date)
-
-            recipes = DayPlanRecipes.objects.filter(day_plan=day_plan).select_related('recipe')
-            recipe_data = [
-                {
-                    'id': recipe.recipe.id,
-                    'title': recipe.recipe.title,
-                    'meal_type': recipe.recipe.meal_type,
-                    'total_calories': recipe.recipe.total_calories,
-                    'description':recipe.recipe.description,
-                }
-                for recipe in recipes
-            ]
+        solved_by = plan_meals_for_week(user)
 
-            weekly_plan.append({
-                'date': plan_date.strftime('%Y-%m-%d'),  
-                'recipes': recipe_data,
-            })
-
-        return Response({"weekly_plan": weekly_plan}, status=status.HTTP_200_OK)
+        return Response({"weekly_plan": build_weekly_plan(user), "engine": solved_by}, status=status.HTTP_200_OK)
 
+    @conditional_get(user_scopes=('plan',), catalog=True, dated=True)
     def get(self, request):
     
         user = request.user  
@@ -430,10 +584,10 @@ class WeeklyMealPlanView(APIView):
         end_date = today + timedelta(days=6)
 
    
-        plans = DayPlanRecipes.objects.filter(
+        plans = RecipeSerializer.setup_eager_loading(DayPlanRecipes.objects.filter(
             day_plan__user=user,
             day_plan__date__range=(today, end_date)
-        ).select_related('day_plan', 'recipe').order_by('day_plan__date', 
+        ).select_related('day_plan', 'recipe'), prefix='recipe__').order_by('day_plan__date', 
             Case(
                 When(recipe__meal_type='breakfast', then=Value(1)),
                 When(recipe__meal_type='lunch', then=Value(2)),
@@ -495,6 +649,94 @@ class WeeklyMealPlanView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class RecipeSuggestionsView(APIView):
+    """
+    Replacement candidates for one recipe: the closest recipes of the same
+    meal type in nutrient space, without the user's disliked ingredients.
+    With `day`, recipes already planned for that day are left out as well.
+    """
+    permission_classes = [IsAuthenticated]
+    max_count = 50
+
+    def get(self, request, pk):
+        try:
+            count = int(request.query_params.get('count', 5))
+        except ValueError:
+            return Response({"error": "count must be a number."}, status=status.HTTP_400_BAD_REQUEST)
+        count = max(1, min(count, self.max_count))
+
+        excluded_ids = []
+        day = request.query_params.get('day')
+        if day:
+            try:
+                plan_date = datetime.strptime(day, "%Y-%m-%d").date()
+            except ValueError:
+                return Response({"error": "day must be in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+            excluded_ids = DayPlanRecipes.objects.filter(
+                day_plan__user=request.user, day_plan__date=plan_date
+            ).values_list('recipe_id', flat=True)
+
+        nearest = get_recipe_catalog().nearest(
+            pk, count, list(excluded_ids), get_disliked_ingredient_ids(request.user)
+        )
+        if nearest is None:
+            return Response({"error": "Recipe not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        recipes = RecipeSerializer.setup_eager_loading(Recipe.objects.all()).in_bulk(
+            [recipe_id for recipe_id, _ in nearest]
+        )
+        suggestions = [
+            {**RecipeSerializer(recipes[recipe_id]).data, 'distance': round(distance, 4)}
+            for recipe_id, distance in nearest
+            if recipe_id in recipes
+        ]
+        return Response({"recipe_id": pk, "suggestions": suggestions}, status=status.HTTP_200_OK)
+
+
+class PlanningJobView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        job = enqueue_planning_job(request.user)
+        return Response(
+            {"job_id": job.id, "status": job.status},
+            status=status.HTTP_202_ACCEPTED
+        )
+
+class PlanningJobStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = PlanningJob.objects.filter(id=job_id, user=request.user).first()
+        if not job:
+            return Response({"error": "Planning job not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            "job_id": job.id,
+            "status": job.status,
+            "progress": job.progress,
+            "result": job.result,
+            "error": job.error,
+        }, status=status.HTTP_200_OK)
+
+class PlanCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(plan_cache.stats(), status=status.HTTP_200_OK)
+
+class RecipeCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(recipe_responses.stats(), status=status.HTTP_200_OK)
+
+class PlannerTimingsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(planner_timings.stats(), status=status.HTTP_200_OK)
+
 class DayPlanItemView(APIView):
     def post(self, request):
         user = request.user
@@ -591,15 +833,48 @@ class ResetMealPlansView(APIView):
     permission_classes = [IsAuthenticated]  
 
     def delete(self, request):
-        DayPlanRecipes.objects.filter(day_plan__user=request.user).delete()
-        DayPlan.objects.filter(user=request.user).delete()
+        with transaction.atomic(), summaries_suspended():
+            DayPlanRecipes.objects.filter(day_plan__user=request.user).delete()
+            DayPlan.objects.filter(user=request.user).delete()
+            rebuild_summaries([request.user.id])
 
         return Response({"message": "Your meal plans have been deleted successfully."}, status=status.HTTP_200_OK)
     
 
 class NutrientSummaryView(APIView):
+    """
+    Planned recipe nutrients of the user's whole history against seven days
+    of their preferences. With `start_date` and/or `end_date` (YYYY-MM-DD; a
+    missing end is seven days long) only that window is summed, and every
+    comparison also carries the preferences scaled to the window as
+    min/max.
+    """
     permission_classes = [IsAuthenticated]
 
+    def get_date_range(self, request):
+        """
+        (start_date, end_date) of the requested window, or None for the
+        whole history.
+        """
+        try:
+            start_date = request.query_params.get('start_date')
+            end_date = request.query_params.get('end_date')
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+        except ValueError:
+            raise ValueError("Invalid date format. Use YYYY-MM-DD")
+
+        if start_date is None and end_date is None:
+            return None
+        if end_date is None:
+            end_date = start_date + timedelta(days=6)
+        if start_date is None:
+            start_date = end_date - timedelta(days=6)
+        if start_date > end_date:
+            raise ValueError("start_date must not be after end_date")
+        return start_date, end_date
+
+    @conditional_get(user_scopes=('plan', 'preferences'), catalog=True, dated=True)
     def get(self, request):
         user = request.user
 
@@ -615,18 +890,10 @@ class NutrientSummaryView(APIView):
             'potassium': ['min_potassium', 'max_potassium']
         }
 
-        aggregates = {field: 0 for field in recipe_fields}
-
-        planned_recipes = DayPlanRecipes.objects.filter(day_plan__user=user)
-
-        for plan_recipe in planned_recipes:
-            recipe = plan_recipe.recipe
-            for field in recipe_fields:
-                value = getattr(recipe, field, 0) or 0  
-                try:
-                    aggregates[field] += float(value)
-                except ValueError:
-                    aggregates[field] += 0  
+        try:
+            date_range = self.get_date_range(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             preferences = UserNutrientPreferences.objects.get(user=user)
@@ -636,29 +903,52 @@ class NutrientSummaryView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+        planned = DayPlanRecipes.objects.filter(day_plan__user=user)
+        if date_range:
+            planned = planned.filter(day_plan__date__range=date_range)
+        aggregates = planned.aggregate(**{field: Sum(f'recipe__{field}') for field in recipe_fields})
+
         comparisons = {}
         for field in recipe_fields:
             min_field, max_field = preference_fields[field]
-
-            min_value = getattr(preferences, min_field, None) * 7
-            max_value = getattr(preferences, max_field, None) * 7
-
-           
-
-            total = aggregates[field]
+            min_value = getattr(preferences, min_field)
+            max_value = getattr(preferences, max_field)
 
             comparisons[field] = {
-                "total": total,
-                "min_7_days": min_value,
-                "max_7_days": max_value,
-    
+                "total": aggregates[field] or 0.0,
+                "min_7_days": min_value * 7,
+                "max_7_days": max_value * 7,
             }
+            if date_range:
+                days = (date_range[1] - date_range[0]).days + 1
+                comparisons[field].update({"min": min_value * days, "max": max_value * days})
 
-        return Response({"comparisons": comparisons})
+        if not date_range:
+            return Response({"comparisons": comparisons})
+
+        start_date, end_date = date_range
+        return Response({
+            "start_date": start_date.strftime('%Y-%m-%d'),
+            "end_date": end_date.strftime('%Y-%m-%d'),
+            "days": (end_date - start_date).days + 1,
+            "comparisons": comparisons,
+        })
 
 
 
 class WeeklyNutritionView(APIView):
+    # response key -> DailySummary field
+    nutrition_fields = {
+        'calories': 'total_calories',
+        'carbohydrates': 'total_carbohydrates',
+        'fat': 'total_fat',
+        'protein': 'total_protein',
+        'fiber': 'total_fiber',
+        'sugars': 'total_sugars',
+        'iron': 'total_iron',
+        'potassium': 'total_potassium',
+    }
+
     def get_date_range(self, request):
         try:
             if request.query_params.get('start_date') and request.query_params.get('end_date'):
@@ -681,96 +971,20 @@ class WeeklyNutritionView(APIView):
         except (TypeError, ValueError):
             raise ValueError("Invalid date format. Use YYYY-MM-DD")
 
-    def get_cumulative_nutrition(self, user, start_date, current_date):
-        day_plans = DayPlan.objects.filter(
-            user=user,
-            date__range=[start_date, current_date]
-        )
-        
-        recipe_nutrition = DayPlanRecipes.objects.filter(
-            day_plan__in=day_plans
-        ).aggregate(
-            calories=Sum(Cast('recipe__total_calories', output_field=IntegerField())),
-            carbohydrates=Sum(Cast('recipe__carbohydrates', output_field=IntegerField())),
-            fat=Sum(Cast('recipe__fat', output_field=IntegerField())),
-            protein=Sum(Cast('recipe__protein', output_field=IntegerField())),
-            fiber=Sum(Cast('recipe__fiber', output_field=IntegerField())),
-            sugars=Sum(Cast('recipe__sugars', output_field=IntegerField())),
-            iron=Sum(Cast('recipe__iron', output_field=IntegerField())),
-            potassium=Sum(Cast('recipe__potassium', output_field=IntegerField()))
-        )
-
-        item_nutrition = DayPlanItem.objects.filter(
-            user=user,
-            date__range=[start_date, current_date]
-        ).aggregate(
-            calories=Sum(F('total_calories') * F('quantity')),
-            carbohydrates=Sum(F('total_carbs') * F('quantity')),
-            fat=Sum(F('total_fats') * F('quantity')),
-            protein=Sum(F('total_protein') * F('quantity')),
-            fiber=Sum(F('total_fiber') * F('quantity')),
-            sugars=Sum(F('total_sugars') * F('quantity')),
-            iron=Sum(F('total_iron') * F('quantity')),
-            potassium=Sum(F('total_potassium') * F('quantity'))
-        )
-
-        combined_nutrition = {}
-        for key in recipe_nutrition.keys():
-            recipe_value = Decimal('0') if recipe_nutrition[key] is None else Decimal(str(recipe_nutrition[key]))
-            item_value = Decimal('0') if item_nutrition[key] is None else Decimal(str(item_nutrition[key]))
-            combined_nutrition[key] = recipe_value + item_value
-
-        return combined_nutrition
-
-    def get_daily_nutrition(self, user, date):
-        nutrition_keys = [
-            'calories', 'carbohydrates', 'fat', 'protein',
-            'fiber', 'sugars', 'iron', 'potassium'
-        ]
-        
-        day_plan = DayPlan.objects.filter(
-            user=user,
-            date=date
-        ).first()
-        
-        recipe_nutrition = {key: Decimal('0') for key in nutrition_keys}
-        if day_plan:
-            recipe_values = DayPlanRecipes.objects.filter(
-                day_plan=day_plan
-            ).aggregate(
-                calories=Sum(Cast('recipe__total_calories', output_field=IntegerField())),
-                carbohydrates=Sum(Cast('recipe__carbohydrates', output_field=IntegerField())),
-                fat=Sum(Cast('recipe__fat', output_field=IntegerField())),
-                protein=Sum(Cast('recipe__protein', output_field=IntegerField())),
-                fiber=Sum(Cast('recipe__fiber', output_field=IntegerField())),
-                sugars=Sum(Cast('recipe__sugars', output_field=IntegerField())),
-                iron=Sum(Cast('recipe__iron', output_field=IntegerField())),
-                potassium=Sum(Cast('recipe__potassium', output_field=IntegerField()))
-            )
-            for key in nutrition_keys:
-                if recipe_values.get(key) is not None:
-                    recipe_nutrition[key] = Decimal(str(recipe_values[key]))
-
-        item_nutrition = DayPlanItem.objects.filter(
+    def get_daily_nutrition(self, user, start_date, end_date):
+        """
+        The user's daily totals from `start_date` to `end_date` in one query,
+        as date -> totals. Days without a rollup are left out.
+        """
+        summaries = DailySummary.objects.filter(
             user=user,
-            date=date
-        ).aggregate(
-            calories=Sum(F('total_calories') * F('quantity')),
-            carbohydrates=Sum(F('total_carbs') * F('quantity')),
-            fat=Sum(F('total_fats') * F('quantity')),
-            protein=Sum(F('total_protein') * F('quantity')),
-            fiber=Sum(F('total_fiber') * F('quantity')),
-            sugars=Sum(F('total_sugars') * F('quantity')),
-            iron=Sum(F('total_iron') * F('quantity')),
-            potassium=Sum(F('total_potassium') * F('quantity'))
-        )
-
-        combined_nutrition = {}
-        for key in nutrition_keys:
-            item_value = Decimal('0') if item_nutrition.get(key) is None else Decimal(str(item_nutrition[key]))
-            combined_nutrition[key] = recipe_nutrition[key] + item_value
+            date__range=[start_date, end_date]
+        ).values_list('date', *self.nutrition_fields.values())
 
-        return combined_nutrition
+        return {
+            summary_date: {key: Decimal(str(value)) for key, value in zip(self.nutrition_fields, values)}
+            for summary_date, *values in summaries
+        }
 
     def serialize_nutrition_values(self, nutrition_data):
         return {
@@ -778,6 +992,7 @@ class WeeklyNutritionView(APIView):
             for key, value in nutrition_data.items()
         }
 
+    @conditional_get(user_scopes=('plan',), catalog=True, dated=True)
     def get(self, request):
         try:
             start_date, end_date = self.get_date_range(request)
@@ -789,7 +1004,11 @@ class WeeklyNutritionView(APIView):
 
         user = request.user
         response_data = []
-        
+        daily_nutrition = self.get_daily_nutrition(
+            user, start_date - timedelta(days=start_date.weekday()), end_date
+        )
+        no_nutrition = {key: Decimal('0') for key in self.nutrition_fields}
+
         current_date = start_date
         while current_date <= end_date:
             week_start = current_date - timedelta(days=current_date.weekday())
@@ -801,19 +1020,19 @@ class WeeklyNutritionView(APIView):
                 'days': []
             }
             
+            cumulative_nutrition = no_nutrition
             current_week_date = week_start
             while current_week_date <= week_end:
-                daily_nutrition = self.get_daily_nutrition(user, current_week_date)
-                cumulative_nutrition = self.get_cumulative_nutrition(
-                    user, 
-                    week_start, 
-                    current_week_date
-                )
+                day_nutrition = daily_nutrition.get(current_week_date, no_nutrition)
+                if current_week_date in daily_nutrition:
+                    cumulative_nutrition = {
+                        key: cumulative_nutrition[key] + value for key, value in day_nutrition.items()
+                    }
                 
                 day_data = {
                     'date': current_week_date.strftime('%Y-%m-%d'),
                     'day_of_week': current_week_date.strftime('%A'),
-                    'daily_totals': self.serialize_nutrition_values(daily_nutrition),
+                    'daily_totals': self.serialize_nutrition_values(day_nutrition),
                     'cumulative_totals': self.serialize_nutrition_values(cumulative_nutrition)
                 }
                 week_data['days'].append(day_data)